@@ -1,29 +1,72 @@
 # app/api/endpoints/analysis.py
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, status
+from fastapi import (
+    APIRouter,
+    UploadFile,
+    File,
+    Form,
+    HTTPException,
+    Query,
+    Depends,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
-from typing import Optional
-import os
+from typing import Awaitable, Callable, List, Optional, Tuple
 from datetime import datetime
-import uuid
-from app.models.database import get_db, User, HarvestRecord
-from app.models.schemas import AnalysisResult
-from app.api.dependencies import get_current_user
+import asyncio
+import json
+from app.core.admission import detection_admission
+from app.core.cancellation import (
+    ClientDisconnected,
+    raise_if_disconnected,
+    run_unless_disconnected,
+)
+from app.core.config import settings
+from app.models.database import get_db, User, Garden, HarvestRecord
+from app.models.schemas import (
+    AnalysisResult,
+    AnalysisJobAccepted,
+    AnalysisJobStatus,
+    ReanalysisResult,
+)
+from app.api.dependencies import get_admin_user, get_current_user, get_manager_user
+from app.api.endpoints.uploads import get_completed_upload
 from app.services.ai_service import ai_service
-from app.utils.image_utils import validate_image_file
-from app.core.storage import StorageService
+from app.services.analysis_jobs import analysis_jobs
+from app.services.backfill import detection_backfill
+from app.services.export_service import stream_harvest_export
+from app.services.resumable_uploads import ResumableUpload, resumable_uploads
+from app.services.usage import usage_tracker
+from app.services.analysis_service import (
+    build_analysis_result,
+    decode_history_cursor,
+    detect_and_store,
+    encode_history_cursor,
+    image_urls,
+    reanalyze_record,
+    release_image,
+)
+from app.services.derivatives import derivative_key
+from app.utils.image_utils import read_upload_with_digest, validate_image_file
+from app.core.storage import StorageService, get_storage
 
 router = APIRouter()
 
 
 @router.post("/photo", response_model=AnalysisResult)
 async def analyze_photo(
+    request: Request,
     file: UploadFile = File(...),
     tree_id: Optional[int] = None,
     fruit_type: str = "apple",
     garden_id: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
-    storage: StorageService = Depends(),  # внедряем сервис хранилища
+    storage: StorageService = Depends(get_storage),  # общий сервис хранилища
 ):
     """Анализ фотографии для подсчета плодов с использованием ИИ"""
 
@@ -34,25 +77,99 @@ async def analyze_photo(
     if not is_valid:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error_msg)
 
-    try:
-        # Читаем содержимое файла
-        contents = await file.read()
-
-        # Обрабатываем изображение с помощью ИИ
-        start_time = datetime.now()
-        detection_result = ai_service.process_image(contents, fruit_type)
-        processing_time = (datetime.now() - start_time).total_seconds()
-
-        # 📁 ЗАГРУЗКА ФАЙЛА В S3 (вместо локального сохранения)
-        # Сбрасываем указатель файла в начало, потому что мы уже прочитали его в contents
-        await file.seek(0)
+    return await _analyze_photo(
+        request,
+        db,
+        storage,
+        current_user,
+        lambda: read_upload_with_digest(file),
+        file.filename,
+        file.content_type,
+        tree_id,
+        fruit_type,
+        garden_id,
+    )
+
+
+@router.post("/uploads/{upload_id}", response_model=AnalysisResult)
+async def analyze_resumable_upload(
+    request: Request,
+    upload: ResumableUpload = Depends(get_completed_upload),
+    tree_id: Optional[int] = None,
+    fruit_type: str = "apple",
+    garden_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    storage: StorageService = Depends(get_storage),
+):
+    """
+    Анализ фотографии, докачанной через /uploads (см. create_upload).
+    Загрузка удаляется, когда запись урожая сохранена.
+    """
+    result = await _analyze_photo(
+        request,
+        db,
+        storage,
+        current_user,
+        lambda: resumable_uploads.read(upload),
+        upload.filename,
+        upload.content_type,
+        tree_id,
+        fruit_type,
+        garden_id,
+    )
+    if isinstance(result, AnalysisResult):
+        resumable_uploads.delete(upload.id)
+    return result
+
+
+async def _analyze_photo(
+    request: Request,
+    db: Session,
+    storage: StorageService,
+    current_user: User,
+    read_contents: Callable[[], Awaitable[Tuple[bytes, str]]],
+    filename: str,
+    content_type: str,
+    tree_id: Optional[int],
+    fruit_type: str,
+    garden_id: Optional[int],
+):
+    """Детекция, сохранение фото и записи урожая для /photo и /uploads/{id}"""
+    usage_tracker.check_quota(current_user)
+    usage_tracker.attribute(current_user.id, garden_id)
 
-        # Создаём путь в хранилище: users/{user_id}/analysis/{uuid}_{original_filename}
-        file_extension = os.path.splitext(file.filename)[1]
-        s3_key = f"users/{current_user.id}/analysis/{uuid.uuid4()}{file_extension}"
+    # Ждём свободного места для детекции (или сразу получаем 429)
+    ticket = await detection_admission.acquire()
+    try:
+        # Читаем содержимое файла, попутно считая хэш для дедупликации
+        contents, content_hash = await read_contents()
+        await raise_if_disconnected(request, "upload")
+
+        # Обрабатываем изображение с помощью ИИ и параллельно загружаем его
+        # в S3 (если такого же файла там ещё нет). Если клиент отключится,
+        # детекция будет отменена
+        detection_result, processing_time, s3_key = await run_unless_disconnected(
+            request,
+            detect_and_store(
+                db,
+                storage,
+                contents,
+                filename,
+                content_type,
+                fruit_type,
+                current_user.id,
+                content_hash=content_hash,
+            ),
+            "detection",
+        )
 
-        # Загружаем в S3
-        await storage.upload_file(file, folder=f"users/{current_user.id}")
+        try:
+            await raise_if_disconnected(request, "saving")
+        except ClientDisconnected:
+            # Запись никто не увидит - снимаем ссылку на изображение
+            await release_image(db, storage, s3_key)
+            raise
 
         print(f" Файл загружен в S3: {s3_key}")
         print(
@@ -68,6 +185,8 @@ async def analyze_photo(
             image_path=s3_key,  # теперь храним S3 key
             confidence_score=detection_result.get("confidence", 0.0),
             processing_time=processing_time,
+            detector_version=detection_result.get("version"),
+            has_derivatives=bool(detection_result.get("derivatives")),
             user_id=current_user.id,
         )
 
@@ -79,63 +198,18 @@ async def analyze_photo(
             f" Запись сохранена в БД: ID={harvest_record.id}, плодов={harvest_record.fruit_count}"
         )
 
-        # Форматируем результат для ответа
-        detected_list = []
-        if "detected_fruits" in detection_result:
-            if isinstance(detection_result["detected_fruits"], list):
-                detected_list = detection_result["detected_fruits"]
-            elif isinstance(detection_result["detected_fruits"], dict):
-                for ft, fruit_data in detection_result["detected_fruits"].items():
-                    if isinstance(fruit_data, dict):
-                        detected_list.append(
-                            {
-                                "fruit_type": ft,
-                                "count": fruit_data.get("count", 0),
-                                "confidence": fruit_data.get(
-                                    "confidence",
-                                    fruit_data.get(
-                                        "avg_confidence",
-                                        detection_result.get("confidence", 0.0),
-                                    ),
-                                ),
-                                "boxes": fruit_data.get("boxes", []),
-                            }
-                        )
-
-        # Если detected_list пуст, создаем базовую запись
-        if not detected_list and detection_result.get("total_fruits", 0) > 0:
-            detected_list = [
-                {
-                    "fruit_type": fruit_type,
-                    "count": detection_result.get("total_fruits", 0),
-                    "confidence": detection_result.get("confidence", 0.0),
-                    "boxes": [],
-                }
-            ]
-
-        # Убедимся что confidence есть во всех элементах
-        for item in detected_list:
-            if "confidence" not in item:
-                item["confidence"] = detection_result.get("confidence", 0.0)
-
-        # 🔗 Генерируем временную ссылку на изображение (pre-signed URL)
-        image_url = None
-        if s3_key:
-            # Срок действия ссылки - 1 час (3600 секунд)
-            image_url = storage.get_presigned_url(s3_key, expires_in=3600)
-
-        return AnalysisResult(
-            fruit_count=detection_result.get("total_fruits", 0),
-            confidence=detection_result.get("confidence", 0.0),
-            processing_time=processing_time,
-            detected_fruits=detected_list,
-            recommendations=detection_result.get("recommendations", ""),
+        # 🔗 Временные ссылки (pre-signed URL, 1 час) на фото и его копии
+        return build_analysis_result(
+            detection_result,
+            fruit_type,
+            processing_time,
             record_id=harvest_record.id,
-            method=detection_result.get("method", "unknown"),
-            model=detection_result.get("model", "simple"),
-            image_url=image_url,  # теперь это pre-signed URL, а не локальный путь
+            **image_urls(storage, s3_key, harvest_record.has_derivatives),
         )
 
+    except ClientDisconnected as e:
+        print(f" Анализ прерван: {str(e)}")
+        return Response(status_code=499)
     except Exception as e:
         print(f" Ошибка анализа: {str(e)}")
         import traceback
@@ -145,43 +219,434 @@ async def analyze_photo(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при обработке изображения: {str(e)}",
         )
+    finally:
+        ticket.release()
+
+
+@router.post("/batch")
+async def analyze_batch(
+    files: List[UploadFile] = File(...),
+    tree_ids: List[int] = Form(default=[]),
+    fruit_type: str = "apple",
+    garden_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    storage: StorageService = Depends(get_storage),
+):
+    """
+    Пакетный анализ нескольких фотографий (например, целого ряда деревьев).
+
+    Результаты отдаются в формате NDJSON по мере готовности каждого
+    изображения, записи урожая сохраняются пачками.
+    """
+    if len(files) > settings.BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Слишком много файлов. Максимум: {settings.BATCH_MAX_FILES}",
+        )
+    if tree_ids and len(tree_ids) != len(files):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Количество tree_ids должно совпадать с количеством файлов",
+        )
+
+    print(
+        f" Пакетный анализ {len(files)} фото от пользователя: {current_user.email}"
+    )
+    usage_tracker.check_quota(current_user)
+    user_id = current_user.id
+    concurrency = min(len(files), settings.BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(settings.BATCH_MAX_CONCURRENCY)
+    # Пакет занимает столько мест, сколько детекций запускает одновременно
+    ticket = await detection_admission.acquire(weight=concurrency)
+
+    async def analyze_one(index: int, file: UploadFile):
+        base = {"index": index, "filename": file.filename}
+        is_valid, error_msg = validate_image_file(file)
+        if not is_valid:
+            return {"type": "error", **base, "detail": error_msg}, None
+
+        async with semaphore:
+            try:
+                contents, content_hash = await read_upload_with_digest(file)
+                detection_result, processing_time, s3_key = await detect_and_store(
+                    db,
+                    storage,
+                    contents,
+                    file.filename,
+                    file.content_type,
+                    fruit_type,
+                    user_id,
+                    content_hash=content_hash,
+                    priority="bulk",
+                )
+            except Exception as e:
+                print(f" Ошибка анализа {file.filename}: {str(e)}")
+                return {"type": "error", **base, "detail": str(e)}, None
+
+        tree_id = tree_ids[index] if tree_ids else None
+        record = HarvestRecord(
+            tree_id=tree_id,
+            garden_id=garden_id,
+            fruit_count=detection_result.get("total_fruits", 0),
+            fruit_type=fruit_type,
+            image_path=s3_key,
+            confidence_score=detection_result.get("confidence", 0.0),
+            processing_time=processing_time,
+            detector_version=detection_result.get("version"),
+            has_derivatives=bool(detection_result.get("derivatives")),
+            user_id=user_id,
+        )
+        result = build_analysis_result(
+            detection_result,
+            fruit_type,
+            processing_time,
+            **image_urls(storage, s3_key, record.has_derivatives),
+        )
+        line = {"type": "result", **base, "tree_id": tree_id, **result.dict()}
+        line.pop("record_id", None)
+        return line, record
+
+    def save_chunk(chunk):
+        # Одна транзакция на пачку записей вместо коммита на каждое фото
+        db.add_all([record for _, record in chunk])
+        db.flush()
+        saved = [{"index": index, "record_id": record.id} for index, record in chunk]
+        db.commit()
+        return {"type": "records", "records": saved}
+
+    async def result_stream():
+        usage_tracker.attribute(user_id, garden_id)
+        tasks = [
+            asyncio.create_task(analyze_one(index, file))
+            for index, file in enumerate(files)
+        ]
+        pending_records = []
+        consumed = set()
+        succeeded = failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line, record = await next_done
+                consumed.add(line["index"])
+                if record is None:
+                    failed += 1
+                else:
+                    succeeded += 1
+                    pending_records.append((line["index"], record))
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+
+                if len(pending_records) >= settings.BATCH_INSERT_CHUNK:
+                    yield json.dumps(save_chunk(pending_records)) + "\n"
+                    pending_records = []
+
+            if pending_records:
+                yield json.dumps(save_chunk(pending_records)) + "\n"
+                pending_records = []
+
+            yield json.dumps(
+                {
+                    "type": "summary",
+                    "total": len(files),
+                    "succeeded": succeeded,
+                    "failed": failed,
+                }
+            ) + "\n"
+        finally:
+            # Клиент мог закрыть соединение раньше - не оставляем висящих задач.
+            # Прерванная детекция сама снимает ссылку на изображение
+            for task in tasks:
+                task.cancel()
+            # Готовые, но не сохранённые записи уже держат ссылки на изображения
+            # (detect_and_store) - сохраняем их, иначе объекты не освободятся.
+            # Только синхронно: await в отменённом потоке ответа не выполнится
+            for task in tasks:
+                if task.done() and not task.cancelled() and task.exception() is None:
+                    line, record = task.result()
+                    if record is not None and line["index"] not in consumed:
+                        pending_records.append((line["index"], record))
+            if pending_records:
+                try:
+                    save_chunk(pending_records)
+                except Exception as e:
+                    db.rollback()
+                    print(f" Не удалось сохранить записи пакета: {str(e)}")
+            ticket.release()
+
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        # Если поток так и не был запущен, место освободит фоновая задача
+        background=BackgroundTask(ticket.release),
+    )
+
+
+@router.post(
+    "/jobs",
+    response_model=AnalysisJobAccepted,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def create_analysis_job(
+    response: Response,
+    file: UploadFile = File(...),
+    tree_id: Optional[int] = None,
+    fruit_type: str = "apple",
+    garden_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Принять фото на анализ в фоне и сразу вернуть ID задачи"""
+    is_valid, error_msg = validate_image_file(file)
+    if not is_valid:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error_msg)
+    usage_tracker.check_quota(current_user)
+
+    contents = await file.read()
+    job = analysis_jobs.submit(
+        db,
+        user_id=current_user.id,
+        contents=contents,
+        filename=file.filename,
+        content_type=file.content_type,
+        fruit_type=fruit_type,
+        tree_id=tree_id,
+        garden_id=garden_id,
+    )
+    print(f" Задача анализа {job.id} поставлена в очередь ({current_user.email})")
+
+    status_url = f"/api/v1/analysis/jobs/{job.id}"
+    response.headers["Location"] = status_url
+    return AnalysisJobAccepted(
+        job_id=job.id,
+        status=job.status,
+        status_url=status_url,
+        events_url=f"{status_url}/events",
+    )
+
+
+def _get_user_job(job_id: str, current_user: User) -> dict:
+    snapshot = analysis_jobs.get_snapshot(job_id)
+    if not snapshot or snapshot["user_id"] != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Задача {job_id} не найдена",
+        )
+    return snapshot
+
+
+@router.get("/jobs/{job_id}", response_model=AnalysisJobStatus)
+async def get_analysis_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+):
+    """Получить статус фоновой задачи анализа"""
+    return _get_user_job(job_id, current_user)
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_analysis_job_events(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+):
+    """Поток событий (SSE) с прогрессом задачи по стадиям"""
+    _get_user_job(job_id, current_user)
+
+    async def event_stream():
+        async for snapshot in analysis_jobs.watch(job_id):
+            snapshot.pop("user_id", None)
+            yield (
+                f"event: {snapshot['stage']}\n"
+                f"data: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/backfill", status_code=status.HTTP_202_ACCEPTED)
+async def start_backfill(
+    restart: bool = False,
+    batch_size: int = Query(settings.BACKFILL_BATCH_SIZE, ge=1, le=5000),
+    current_user: User = Depends(get_admin_user),
+):
+    """
+    Запустить пересчёт старых записей текущей версией детектора
+    (только для администратора). Продолжает с последней контрольной точки.
+    """
+    # Пересчёт делит пул детектора с запросами пользователей на правах
+    # фоновой нагрузки, а не запускает отдельный пул процессов
+    started = detection_backfill.start(
+        restart=restart,
+        batch_size=batch_size,
+        executor=ai_service.executor.for_class("bulk"),
+    )
+    if not started:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Пересчёт уже выполняется",
+        )
+    return {"message": "Пересчёт запущен", "detector_version": ai_service.version}
+
+
+@router.get("/backfill")
+async def get_backfill_status(current_user: User = Depends(get_admin_user)):
+    """Прогресс пересчёта по контрольной точке (только для администратора)"""
+    return {
+        "running": detection_backfill.is_running,
+        "checkpoint": await asyncio.to_thread(detection_backfill.get_checkpoint),
+    }
+
+
+@router.get("/usage/top")
+async def get_top_consumers(
+    days: int = Query(1, ge=1, le=90),
+    by: str = Query("user", pattern="^(user|garden)$"),
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user),
+):
+    """
+    Пользователи или сады с наибольшей нагрузкой на детектор
+    (CPU-секунды и мегапиксели) за последние days дней
+    """
+    # Сначала сбрасываем накопленное в памяти, чтобы отчёт был актуальным
+    usage_tracker.flush(db)
+    return {
+        "days": days,
+        "by": by,
+        "consumers": usage_tracker.top_consumers(db, days=days, by=by, limit=limit),
+    }
+
+
+@router.get("/export")
+async def export_analyses(
+    garden_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    manifest: str = Query("csv", pattern="^(csv|json)$"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_manager_user),
+    storage: StorageService = Depends(get_storage),
+):
+    """
+    Выгрузить ZIP-архив с фотографиями и манифестом записей урожая
+    сада и/или периода (только менеджер и выше). Архив формируется
+    на лету, без сохранения целиком в памяти или на диске.
+    """
+    if garden_id is None and date_from is None and date_to is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Укажите garden_id или период (date_from/date_to)",
+        )
+
+    print(f" Выгрузка архива ({current_user.email}): сад {garden_id}, {date_from} - {date_to}")
+    filename = f"harvest_export_{datetime.utcnow():%Y%m%d_%H%M%S}.zip"
+    return StreamingResponse(
+        stream_harvest_export(
+            db,
+            storage,
+            garden_id=garden_id,
+            date_from=date_from,
+            date_to=date_to,
+            manifest_format=manifest,
+        ),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 @router.get("/history")
 async def get_analysis_history(
     garden_id: Optional[int] = None,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    storage: StorageService = Depends(get_storage),
 ):
-    """Получить историю анализов текущего пользователя"""
+    """
+    Получить историю анализов текущего пользователя.
+
+    Постраничная выдача по курсору: передайте next_cursor из ответа,
+    чтобы получить следующую страницу.
+    """
+    after = None
+    if cursor:
+        try:
+            after = decode_history_cursor(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Некорректный курсор пагинации",
+            )
+
     try:
         print(
             f" Получение истории для пользователя: {current_user.email} (ID: {current_user.id})"
         )
 
-        # Запрос только записей текущего пользователя
-        query = db.query(HarvestRecord).filter(HarvestRecord.user_id == current_user.id)
+        # Запрос только записей текущего пользователя; названия садов
+        # подтягиваем тем же запросом, а не отдельным запросом на запись
+        query = (
+            db.query(HarvestRecord, Garden.name)
+            .outerjoin(Garden, Garden.id == HarvestRecord.garden_id)
+            .filter(HarvestRecord.user_id == current_user.id)
+        )
 
         if garden_id:
             query = query.filter(HarvestRecord.garden_id == garden_id)
 
-        # Сортируем по дате (новые сначала)
-        records = query.order_by(HarvestRecord.harvest_date.desc()).limit(limit).all()
-
-        print(f" Найдено записей: {len(records)}")
-
-        # Получаем информацию о садах для названий
-        from app.models.database import Garden
+        # Keyset-пагинация по (harvest_date, id): страница читается по индексу
+        # (user_id, harvest_date) за одно и то же время на любой глубине.
+        # Записи без даты SQLite отдаёт последними, их дочитываем отдельно
+        order = (HarvestRecord.harvest_date.desc(), HarvestRecord.id.desc())
+        undated = query.filter(HarvestRecord.harvest_date.is_(None))
+
+        if after is None:
+            rows = query.order_by(*order).limit(limit + 1).all()
+        else:
+            after_date, after_id = after
+            if after_date is None:
+                rows = []
+                undated = undated.filter(HarvestRecord.id < after_id)
+            else:
+                rows = (
+                    query.filter(
+                        HarvestRecord.harvest_date <= after_date,
+                        or_(
+                            HarvestRecord.harvest_date < after_date,
+                            HarvestRecord.id < after_id,
+                        ),
+                    )
+                    .order_by(*order)
+                    .limit(limit + 1)
+                    .all()
+                )
+            if len(rows) <= limit:
+                rows += (
+                    undated.order_by(HarvestRecord.id.desc())
+                    .limit(limit + 1 - len(rows))
+                    .all()
+                )
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        print(f" Найдено записей: {len(rows)}")
+
+        # Ссылки на изображения страницы подписываются одним вызовом
+        keys = []
+        for record, _ in rows:
+            if record.image_path:
+                keys.append(record.image_path)
+                if record.has_derivatives:
+                    keys.append(derivative_key(record.image_path, "thumb"))
+        signed_urls = storage.get_presigned_urls(keys)
 
         analyses = []
-        for record in records:
-            garden_name = "Не указан"
-            if record.garden_id:
-                garden = db.query(Garden).filter(Garden.id == record.garden_id).first()
-                if garden:
-                    garden_name = garden.name
-
+        for record, garden_name in rows:
             # Форматируем дату
             display_date = record.harvest_date or record.created_at
             if display_date:
@@ -194,15 +659,16 @@ async def get_analysis_history(
                     "id": record.id,
                     "tree_id": record.tree_id,
                     "garden_id": record.garden_id,
-                    "garden_name": garden_name,
+                    "garden_name": garden_name or "Не указан",
                     "fruit_type": record.fruit_type or "apple",
                     "harvest_date": display_date_str,
                     "fruit_count": record.fruit_count or 0,
                     "confidence": record.confidence_score or 0.0,
                     "processing_time": record.processing_time or 0.0,
-                    "image_url": (
-                        f"/uploads/{os.path.basename(record.image_path)}"
-                        if record.image_path
+                    "image_url": signed_urls.get(record.image_path),
+                    "thumbnail_url": (
+                        signed_urls.get(derivative_key(record.image_path, "thumb"))
+                        if record.has_derivatives and record.image_path
                         else None
                     ),
                     "created_at": (
@@ -211,9 +677,16 @@ async def get_analysis_history(
                 }
             )
 
+        next_cursor = None
+        if has_more:
+            last_record = rows[-1][0]
+            next_cursor = encode_history_cursor(last_record.harvest_date, last_record.id)
+
         return {
             "analyses": analyses,
             "total": len(analyses),
+            "has_more": has_more,
+            "next_cursor": next_cursor,
             "user": {
                 "id": current_user.id,
                 "email": current_user.email,
@@ -233,6 +706,87 @@ async def get_analysis_history(
         )
 
 
+@router.delete("/{record_id}")
+async def delete_analysis(
+    record_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    storage: StorageService = Depends(get_storage),
+):
+    """Удалить запись анализа вместе с изображением, если на него больше нет ссылок"""
+    record = db.query(HarvestRecord).filter(HarvestRecord.id == record_id).first()
+    if not record or (
+        record.user_id != current_user.id and current_user.role != "admin"
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Запись {record_id} не найдена",
+        )
+
+    image_path = record.image_path
+    db.delete(record)
+    db.commit()
+
+    image_deleted = bool(image_path) and await release_image(db, storage, image_path)
+
+    return {"message": "Запись удалена", "id": record_id, "image_deleted": image_deleted}
+
+
+@router.post("/{record_id}/reanalyze", response_model=ReanalysisResult)
+async def reanalyze_analysis(
+    record_id: int,
+    fruit_type: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    storage: StorageService = Depends(get_storage),
+):
+    """
+    Повторный анализ сохранённого изображения записи (например, с другим
+    типом плода или после обновления детектора) без повторной загрузки фото
+    """
+    record = db.query(HarvestRecord).filter(HarvestRecord.id == record_id).first()
+    if not record or (
+        record.user_id != current_user.id and current_user.role != "admin"
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Запись {record_id} не найдена",
+        )
+    if not record.image_path:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="У записи нет сохранённого изображения",
+        )
+
+    usage_tracker.check_quota(current_user)
+    usage_tracker.attribute(current_user.id, record.garden_id)
+
+    fruit_type = fruit_type or record.fruit_type or "apple"
+    try:
+        detection_result, processing_time = await reanalyze_record(
+            db, storage, record, fruit_type
+        )
+    except Exception as e:
+        print(f" Ошибка повторного анализа записи {record_id}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при повторном анализе: {str(e)}",
+        )
+
+    result = build_analysis_result(
+        detection_result,
+        fruit_type,
+        processing_time,
+        record_id=record.id,
+        **image_urls(storage, record.image_path, bool(record.has_derivatives)),
+    )
+    return ReanalysisResult(
+        **result.dict(),
+        revision=record.revision,
+        detector_version=record.detector_version,
+    )
+
+
 @router.get("/demo")
 async def demo_analysis():
     """Демонстрационный эндпоинт для тестирования ИИ"""
@@ -251,7 +805,8 @@ async def demo_analysis():
         img_bytes = img_byte_arr.getvalue()
 
         # Обрабатываем
-        result = ai_service.process_image(img_bytes, "apple")
+        async with detection_admission.slot():
+            result = await ai_service.process_image_async(img_bytes, "apple")
 
         return {
             "message": "Демонстрационный анализ",
@@ -259,6 +814,8 @@ async def demo_analysis():
             "note": "Это тестовый результат на случайном изображении",
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1,50 +1,204 @@
 # app/api/endpoints/files.py
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
-from app.api.dependencies import get_current_user
-from app.models.database import User
-import uuid
-import os
+import asyncio
+import hashlib
+import mimetypes
+import re
+import time
+from contextlib import aclosing
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from PIL import UnidentifiedImageError
+from sqlalchemy.orm import Session
+from app.api.dependencies import get_admin_user, get_current_user
+from app.core.config import settings
+from app.core.responses import SendfileResponse
+from app.core.storage import FileTooLarge, StorageService, get_storage
+from app.core.storage_backends import LocalBackend
+from app.models.database import HarvestRecord, User, get_db
+from app.services.image_resizer import RESIZE_FORMATS, ImageResizer, get_image_resizer
+from app.services.storage_gc import storage_gc
+from app.utils.multipart_stream import iter_file_chunks
 
 router = APIRouter()
 
-UPLOAD_DIR = "uploads"
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# objects/ab/<sha256>.jpg и его копии objects/ab/<sha256>.thumb.webp
+CONTENT_ADDRESSED_KEY = re.compile(r"^objects/[0-9a-f]{2}/([0-9a-f]{64}[\w.]*)$")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
 
 
-@router.post("/upload")
+@router.post(
+    "/upload",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                        "required": ["file"],
+                    }
+                }
+            },
+        }
+    },
+)
 async def upload_file(
-    file: UploadFile = File(...), current_user: User = Depends(get_current_user)
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    storage: StorageService = Depends(get_storage),
 ):
-    """Загрузка файла"""
-    # Проверка типа файла
-    allowed_types = ["image/jpeg", "image/png", "image/jpg"]
-    if file.content_type not in allowed_types:
-        raise HTTPException(400, f"Only {', '.join(allowed_types)} images allowed")
-
-    # Проверка размера файла (читаем первые байты, чтобы не загружать весь файл)
-    first_chunk = await file.read(MAX_FILE_SIZE + 1)
-    if len(first_chunk) > MAX_FILE_SIZE:
+    """
+    Загрузка файла. Тело читается потоком: файл по частям пишется
+    во временный файл хранилища, попутно считаются SHA-256 и размер,
+    и загрузка обрывается, как только размер превысил лимит.
+    """
+    allowed_types = settings.ALLOWED_MIME_TYPES
+    too_large = HTTPException(
+        413, f"File too large. Max size: {settings.MAX_FILE_SIZE // (1024*1024)} MB"
+    )
+    chunks = iter_file_chunks(
+        request, "file", settings.UPLOAD_CHUNK_SIZE, settings.MAX_FILE_SIZE
+    )
+    async with aclosing(chunks):
+        # Первым приходят заголовки части: тип проверяется до чтения данных
+        part, _ = await anext(chunks)
+        if part.content_type not in allowed_types:
+            raise HTTPException(400, f"Only {', '.join(allowed_types)} images allowed")
+
+        upload = storage.open_upload(
+            part.filename,
+            part.content_type,
+            folder=f"users/{current_user.id}/uploads",
+        )
+        async with upload:
+            try:
+                async for _, chunk in chunks:
+                    await upload.write(chunk)
+            except FileTooLarge:
+                raise too_large
+            key = await upload.commit()
+
+    return {
+        "key": key,
+        "filename": part.filename,
+        "size": upload.size,
+        "sha256": upload.sha256,
+        "url": storage.get_presigned_url(key),
+    }
+
+
+@router.post("/gc", status_code=status.HTTP_202_ACCEPTED)
+async def start_storage_gc(
+    dry_run: bool = True,
+    min_age: float = Query(settings.STORAGE_GC_MIN_AGE, ge=0),
+    current_user: User = Depends(get_admin_user),
+):
+    """
+    Запустить удаление файлов, на которые не ссылается ни одна запись
+    (только для администратора). По умолчанию - пробный прогон без удаления.
+    """
+    if not storage_gc.start(dry_run=dry_run, min_age=min_age):
         raise HTTPException(
-            413, f"File too large. Max size: {MAX_FILE_SIZE // (1024*1024)} MB"
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Сборка мусора уже выполняется",
         )
+    return {"message": "Сборка мусора запущена", "dry_run": dry_run}
 
-    # Получаем расширение файла
-    ext = os.path.splitext(file.filename)[1]
-    filename = f"{uuid.uuid4()}{ext}"
-    filepath = os.path.join(UPLOAD_DIR, filename)
 
-    # Сохраняем файл (нужно дочитать остаток, если есть)
-    # Но мы уже прочитали первый чанк, который может быть всем файлом
-    if len(first_chunk) > 0:
-        with open(filepath, "wb") as f:
-            f.write(first_chunk)
-            # Читаем и записываем остаток, если файл больше
-            while chunk := await file.read(8192):
-                f.write(chunk)
+@router.get("/gc")
+async def get_storage_gc_status(current_user: User = Depends(get_admin_user)):
+    """Отчёт последнего прохода сборки мусора (только для администратора)"""
+    return {"running": storage_gc.is_running, "report": storage_gc.last_report}
 
-    return {
-        "key": filepath,
-        "filename": file.filename,
-        "size": os.path.getsize(filepath),
-    }
+
+def _can_read(db: Session, user: User, key: str) -> bool:
+    """Свои файлы, фото своих записей урожая или любые - для администратора"""
+    if user.role == "admin" or key.startswith(f"users/{user.id}/"):
+        return True
+    return (
+        db.query(HarvestRecord.id)
+        .filter(HarvestRecord.image_path == key, HarvestRecord.user_id == user.id)
+        .first()
+        is not None
+    )
+
+
+# Объявлен раньше /{key:path}, иначе тот перехватит .../resized
+@router.get("/{key:path}/resized")
+async def get_resized_file(
+    request: Request,
+    key: str,
+    w: Optional[int] = Query(None, ge=1, le=settings.RESIZE_MAX_DIMENSION),
+    h: Optional[int] = Query(None, ge=1, le=settings.RESIZE_MAX_DIMENSION),
+    fmt: str = Query("webp", pattern="^(webp|jpeg|png)$"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    storage: StorageService = Depends(get_storage),
+    resizer: ImageResizer = Depends(get_image_resizer),
+):
+    """
+    Изображение, вписанное в рамку w x h, в формате fmt
+    (карточки, галерея, просмотр). Копии кэшируются на диске
+    """
+    if w is None and h is None:
+        raise HTTPException(422, "Нужно указать w или h")
+    if not _can_read(db, current_user, key) or not await asyncio.to_thread(
+        storage.exists, key
+    ):
+        raise HTTPException(404, "Файл не найден")
+
+    try:
+        data = await resizer.resized(storage, key, w, h, fmt)
+    except FileNotFoundError:
+        raise HTTPException(404, "Файл не найден")
+    except (UnidentifiedImageError, OSError):
+        raise HTTPException(415, "Файл не является изображением")
+
+    etag = f'"{hashlib.sha256(data).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(data, media_type=RESIZE_FORMATS[fmt][1], headers=headers)
+
+
+@router.api_route("/{key:path}", methods=["GET", "HEAD"])
+async def download_file(
+    key: str,
+    expires: int = Query(...),
+    signature: str = Query(...),
+    storage: StorageService = Depends(get_storage),
+):
+    """
+    Файл локального хранилища по подписанной ссылке (get_presigned_url).
+    Поддерживаются Range, If-None-Match (304) и If-Range
+    """
+    backend = storage.backend
+    if not isinstance(backend, LocalBackend):
+        raise HTTPException(404, "Файл не найден")
+    try:
+        valid = backend.verify(key, expires, signature)
+        path = backend.path(key)
+    except ValueError:
+        valid = False
+    if not valid:
+        raise HTTPException(403, "Ссылка недействительна или истекла")
+    if not backend.exists(key):
+        raise HTTPException(404, "Файл не найден")
+
+    media_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+    match = CONTENT_ADDRESSED_KEY.match(key)
+    if match:
+        # Объект по хэшу содержимого не меняется: хэш и есть строгий ETag
+        etag = f'"{match.group(1)}"'
+        cache_control = f"private, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        etag = None
+        cache_control = f"private, max-age={max(expires - int(time.time()), 0)}"
+    return SendfileResponse(
+        path,
+        media_type=media_type,
+        headers={"Cache-Control": cache_control},
+        etag=etag,
+    )
@@ -0,0 +1,14 @@
+# app/api/endpoints/metrics.py
+from fastapi import APIRouter, Depends
+
+from app.api.dependencies import get_admin_user
+from app.core.metrics import metrics
+from app.models.database import User
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics(current_user: User = Depends(get_admin_user)):
+    """Текущие метрики процесса (только для администратора)"""
+    return metrics.snapshot()
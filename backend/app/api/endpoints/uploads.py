@@ -0,0 +1,149 @@
+# app/api/endpoints/uploads.py
+import os
+import uuid
+from email.utils import formatdate
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from app.api.dependencies import get_current_user
+from app.core.config import settings
+from app.core.storage import FileTooLarge, StorageService, get_storage
+from app.models.database import User
+from app.services.resumable_uploads import (
+    TUS_VERSION,
+    ResumableUpload,
+    UploadNotFound,
+    UploadOffsetMismatch,
+    parse_upload_metadata,
+    resumable_uploads,
+)
+
+router = APIRouter()
+
+
+def _tus_headers(upload: ResumableUpload, offset: int) -> dict:
+    return {
+        "Tus-Resumable": TUS_VERSION,
+        "Upload-Offset": str(offset),
+        "Upload-Length": str(upload.length),
+        "Upload-Expires": formatdate(upload.expires, usegmt=True),
+        "Cache-Control": "no-store",
+    }
+
+
+def get_upload(upload_id: str, current_user: User = Depends(get_current_user)):
+    """Загрузка текущего пользователя по id (404, если её нет или она истекла)"""
+    try:
+        return resumable_uploads.get(upload_id, current_user.id)
+    except UploadNotFound:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Загрузка не найдена")
+
+
+def get_completed_upload(upload: ResumableUpload = Depends(get_upload)):
+    """Загрузка, все байты которой уже приняты"""
+    if resumable_uploads.offset(upload) != upload.length:
+        raise HTTPException(status.HTTP_409_CONFLICT, "Загрузка ещё не завершена")
+    return upload
+
+
+@router.post("", status_code=status.HTTP_201_CREATED)
+async def create_upload(
+    response: Response,
+    upload_length: int = Header(..., ge=0),
+    upload_metadata: str = Header(""),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Создать докачиваемую загрузку (протокол в духе tus).
+
+    Upload-Length - размер файла, Upload-Metadata - имя и тип файла:
+    'filename <base64>,filetype <base64>'. Дальше файл передаётся
+    запросами PATCH /uploads/{id} с заголовком Upload-Offset, текущее
+    смещение после обрыва связи отдаёт HEAD /uploads/{id}.
+    """
+    if upload_length > settings.MAX_FILE_SIZE:
+        raise HTTPException(
+            413, f"File too large. Max size: {settings.MAX_FILE_SIZE // (1024*1024)} MB"
+        )
+    try:
+        metadata = parse_upload_metadata(upload_metadata)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    allowed_types = settings.ALLOWED_MIME_TYPES
+    content_type = metadata.get("filetype", "")
+    if content_type not in allowed_types:
+        raise HTTPException(400, f"Only {', '.join(allowed_types)} images allowed")
+
+    upload = resumable_uploads.create(
+        current_user.id, upload_length, metadata.get("filename", ""), content_type
+    )
+    response.headers.update(_tus_headers(upload, 0))
+    response.headers["Location"] = f"/api/v1/uploads/{upload.id}"
+    return {"id": upload.id, "offset": 0, "length": upload.length}
+
+
+@router.head("/{upload_id}")
+async def get_upload_offset(upload: ResumableUpload = Depends(get_upload)):
+    """Сколько байт уже принято: с этого смещения клиент продолжает загрузку"""
+    offset = resumable_uploads.offset(upload)
+    return Response(headers=_tus_headers(upload, offset))
+
+
+@router.patch("/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def append_upload(
+    request: Request,
+    upload_offset: int = Header(..., ge=0),
+    content_type: str = Header(...),
+    upload: ResumableUpload = Depends(get_upload),
+):
+    """Дописать часть файла (тело - application/offset+octet-stream)"""
+    if content_type != "application/offset+octet-stream":
+        raise HTTPException(
+            status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            "Ожидается Content-Type: application/offset+octet-stream",
+        )
+    try:
+        offset = await resumable_uploads.append(upload, upload_offset, request.stream())
+    except UploadOffsetMismatch as e:
+        raise HTTPException(
+            status.HTTP_409_CONFLICT,
+            f"Загрузка остановилась на смещении {e.offset}",
+            headers={"Upload-Offset": str(e.offset)},
+        )
+    except FileTooLarge:
+        raise HTTPException(413, "Данных больше, чем указано в Upload-Length")
+    return Response(
+        status_code=status.HTTP_204_NO_CONTENT, headers=_tus_headers(upload, offset)
+    )
+
+
+@router.delete("/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_upload(upload: ResumableUpload = Depends(get_upload)):
+    """Отменить загрузку и удалить принятые данные"""
+    resumable_uploads.delete(upload.id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.post("/{upload_id}/file")
+async def finish_upload_as_file(
+    upload: ResumableUpload = Depends(get_completed_upload),
+    current_user: User = Depends(get_current_user),
+    storage: StorageService = Depends(get_storage),
+):
+    """
+    Завершить загрузку как обычный файл (то же, что /files/upload).
+    Для анализа фото - POST /analysis/uploads/{upload_id}
+    """
+    sha256 = await resumable_uploads.sha256(upload)
+    ext = os.path.splitext(upload.filename)[1]
+    key = f"users/{current_user.id}/uploads/{uuid.uuid4()}{ext}"
+    await storage.put_file_async(
+        key, resumable_uploads.part_path(upload.id), upload.content_type
+    )
+    resumable_uploads.delete(upload.id)
+    return {
+        "key": key,
+        "filename": upload.filename,
+        "size": upload.length,
+        "sha256": sha256,
+        "url": storage.get_presigned_url(key),
+    }
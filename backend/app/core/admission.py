@@ -0,0 +1,150 @@
+# app/core/admission.py
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+
+class AdmissionTicket:
+    """Разрешение на выполнение; release() можно вызывать повторно"""
+
+    def __init__(self, controller: "AdmissionController", weight: int):
+        self._controller = controller
+        self.weight = weight
+        self.admitted_at = time.perf_counter()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(self)
+
+
+class AdmissionController:
+    """
+    Ограничение числа одновременных детекций.
+
+    Запросы сверх лимита ждут в ограниченной очереди в порядке поступления,
+    но не дольше дедлайна. Если очередь заполнена или дедлайн истёк,
+    запрос сразу получает 429 с оценкой Retry-After по среднему времени
+    обработки. Пакетный запрос может занять несколько мест (weight).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ):
+        self.name = name
+        self.max_concurrent = max_concurrent or settings.ADMISSION_MAX_CONCURRENT
+        self.max_queue = settings.ADMISSION_MAX_QUEUE if max_queue is None else max_queue
+        self.timeout = settings.ADMISSION_QUEUE_TIMEOUT if timeout is None else timeout
+        self.active = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future, float]] = deque()
+        # Среднее время удержания места (экспоненциальное сглаживание)
+        self._avg_service = 1.0
+
+    @property
+    def queue_length(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Оценка в секундах, через сколько освободится место"""
+        queued = sum(entry[0] for entry in self._waiters)
+        rounds = (self.active + queued) / self.max_concurrent
+        return max(1, math.ceil(rounds * self._avg_service))
+
+    async def acquire(self, weight: int = 1) -> AdmissionTicket:
+        weight = min(max(weight, 1), self.max_concurrent)
+        if not self._waiters and self.active + weight <= self.max_concurrent:
+            return self._admit(weight, waited=0.0)
+
+        if len(self._waiters) >= self.max_queue:
+            self._reject("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (weight, future, time.perf_counter())
+        self._waiters.append(entry)
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                self._waiters.remove(entry)
+                self._update_gauges()
+                self._reject("deadline")
+        except asyncio.CancelledError:
+            if future.done():
+                future.result().release()
+            else:
+                self._waiters.remove(entry)
+                future.cancel()
+                self._wake()
+            raise
+        return future.result()
+
+    @asynccontextmanager
+    async def slot(self, weight: int = 1):
+        ticket = await self.acquire(weight)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    # ---------- Внутреннее ----------
+
+    def _admit(self, weight: int, waited: float) -> AdmissionTicket:
+        self.active += weight
+        metrics.observe("admission_wait_seconds", waited, labels={"name": self.name})
+        self._update_gauges()
+        return AdmissionTicket(self, weight)
+
+    def _release(self, ticket: AdmissionTicket):
+        self.active -= ticket.weight
+        held = time.perf_counter() - ticket.admitted_at
+        self._avg_service = 0.8 * self._avg_service + 0.2 * held
+        self._wake()
+        self._update_gauges()
+
+    def _wake(self):
+        """Пропускает ожидающих из головы очереди, пока хватает мест"""
+        while self._waiters:
+            weight, future, enqueued = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if self.active + weight > self.max_concurrent:
+                break
+            self._waiters.popleft()
+            future.set_result(
+                self._admit(weight, waited=time.perf_counter() - enqueued)
+            )
+
+    def _reject(self, reason: str):
+        metrics.inc(
+            "admission_rejected_total", labels={"name": self.name, "reason": reason}
+        )
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Сервер перегружен, повторите запрос позже",
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+    def _update_gauges(self):
+        labels = {"name": self.name}
+        metrics.set_gauge("admission_queue_length", len(self._waiters), labels=labels)
+        metrics.set_gauge("admission_active", self.active, labels=labels)
+
+
+# Общий лимит на детекцию для всех эндпоинтов анализа
+detection_admission = AdmissionController("detection")
@@ -1,22 +1,283 @@
-from datetime import datetime, timedelta
-from typing import Any, Optional
+# app/core/cache.py
+import asyncio
+import functools
+import heapq
+import itertools
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+)
 
+from app.core.cache_backends import CacheBackend, RedisCache, SQLiteCache
+from app.core.config import settings
+from app.core.metrics import metrics
 
-class InMemoryCache:
-    def __init__(self):
-        self._store = {}
+T = TypeVar("T")
+
+
+class _Entry(NamedTuple):
+    value: Any
+    expires: float  # time.monotonic()
+    size: int
+    seq: int  # номер записи: отличает её от прежних значений того же ключа
+
+
+def approximate_size(value: Any, _depth: int = 0) -> int:
+    """Примерный размер значения в байтах (контейнеры - на 3 уровня вглубь)"""
+    size = sys.getsizeof(value)
+    if _depth >= 3:
+        return size
+    if isinstance(value, dict):
+        size += sum(
+            approximate_size(k, _depth + 1) + approximate_size(v, _depth + 1)
+            for k, v in value.items()
+        )
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approximate_size(item, _depth + 1) for item in value)
+    return size
+
+
+class InMemoryCache(CacheBackend):
+    """
+    Кэш в памяти процесса с TTL, ограниченный по числу записей
+    и примерному объёму; при переполнении вытесняются давно
+    использованные записи (LRU).
+
+    Срок жизни считается по монотонным часам. Истёкшая запись удаляется
+    при чтении, а остальные - периодической очисткой не чаще раза
+    в sweep_interval секунд: она идёт по куче сроков истечения и трогает
+    только истёкшие записи. Все операции под одной блокировкой и без
+    await, поэтому кэш можно использовать и из потоков, и из корутин.
+    Значения хранятся как есть, без сериализации.
+    """
+
+    name = "memory"
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        sweep_interval: Optional[float] = None,
+        metric_prefix: str = "cache",
+    ):
+        self.max_entries = max_entries or settings.CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or settings.CACHE_MAX_BYTES
+        self.sweep_interval = (
+            settings.CACHE_SWEEP_INTERVAL if sweep_interval is None else sweep_interval
+        )
+        self.metric_prefix = metric_prefix
+        self._store: "OrderedDict[str, _Entry]" = OrderedDict()
+        # (срок истечения, номер записи, ключ); устаревшие элементы
+        # пропускаются при очистке
+        self._expiry: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + self.sweep_interval
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        metrics.register_ratio(
+            f"{metric_prefix}_hit_ratio",
+            f"{metric_prefix}_hits_total",
+            f"{metric_prefix}_lookups_total",
+        )
 
     def set(self, key: str, value: Any, ttl: int = 3600):
-        expire = datetime.utcnow() + timedelta(seconds=ttl)
-        self._store[key] = (value, expire)
+        now = time.monotonic()
+        size = approximate_size(value)
+        with self._lock:
+            self._pop(key)
+            if size > self.max_bytes:
+                return
+            entry = _Entry(value, now + ttl, size, next(self._seq))
+            self._store[key] = entry
+            self._bytes += size
+            heapq.heappush(self._expiry, (entry.expires, entry.seq, key))
+            evicted = 0
+            while len(self._store) > self.max_entries or self._bytes > self.max_bytes:
+                _, old = self._store.popitem(last=False)
+                self._bytes -= old.size
+                evicted += 1
+            self._stats["evictions"] += evicted
+            self._maybe_sweep(now)
+        if evicted:
+            metrics.inc(f"{self.metric_prefix}_evictions_total", evicted)
+
+    def get(self, key: str, default: Any = None) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._store.get(key)
+            if entry is not None and entry.expires <= now:
+                self._pop(key)
+                self._stats["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+            else:
+                self._store.move_to_end(key)
+                self._stats["hits"] += 1
+            self._maybe_sweep(now)
+        metrics.inc(f"{self.metric_prefix}_lookups_total")
+        if entry is None:
+            return default
+        metrics.inc(f"{self.metric_prefix}_hits_total")
+        return entry.value
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        missing = object()
+        found = {}
+        for key in keys:
+            value = self.get(key, missing)
+            if value is not missing:
+                found[key] = value
+        return found
+
+    def set_many(self, items: Dict[str, Any], ttl: int = 3600) -> None:
+        for key, value in items.items():
+            self.set(key, value, ttl)
+
+    async def aget(self, key: str, default: Any = None) -> Optional[Any]:
+        # Без ввода-вывода: поток не нужен
+        return self.get(key, default)
+
+    async def aset(self, key: str, value: Any, ttl: int = 3600):
+        self.set(key, value, ttl)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
+            self._expiry.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "entries": len(self._store), "bytes": self._bytes}
+
+    def sweep(self) -> int:
+        """Удаляет все истёкшие записи, возвращает их число"""
+        with self._lock:
+            return self._sweep(time.monotonic())
+
+    # ---------- Внутреннее (под self._lock) ----------
+
+    def _pop(self, key: str):
+        entry = self._store.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _maybe_sweep(self, now: float):
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+    def _sweep(self, now: float) -> int:
+        self._next_sweep = now + self.sweep_interval
+        expired = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            _, seq, key = heapq.heappop(self._expiry)
+            entry = self._store.get(key)
+            # Ключ мог быть перезаписан или вытеснен - тогда элемент устарел
+            if entry is not None and entry.seq == seq:
+                self._pop(key)
+                expired += 1
+        # Устаревшие элементы кучи (перезаписанные ключи) не копятся бесконечно
+        if len(self._expiry) > 2 * len(self._store) + 64:
+            self._expiry = [
+                (entry.expires, entry.seq, key) for key, entry in self._store.items()
+            ]
+            heapq.heapify(self._expiry)
+        self._stats["expirations"] += expired
+        metrics.set_gauge(f"{self.metric_prefix}_entries", len(self._store))
+        metrics.set_gauge(f"{self.metric_prefix}_bytes", self._bytes)
+        return expired
+
+
+class SingleFlight:
+    """
+    Склейка одновременных вычислений: пока вычисление по ключу идёт,
+    остальные вызовы с тем же ключом ждут его результата (или ошибки),
+    а не запускают своё. Готовый результат не хранится - это дело кэша.
+
+    Отключившийся клиент не отменяет вычисление для остальных.
+    """
+
+    def __init__(self, name: str = "default"):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        future = self._inflight.get(key)
+        if future is not None:
+            metrics.inc("singleflight_coalesced_total", labels={"name": self.name})
+        else:
+            future = asyncio.ensure_future(func())
+            self._inflight[key] = future
+            future.add_done_callback(functools.partial(self._done, key))
+        return await asyncio.shield(future)
+
+    def _done(self, key: str, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # Ошибку могли не забрать, если все ожидающие отменены
+        if not future.cancelled():
+            future.exception()
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+def single_flight(key: Callable[..., str], name: Optional[str] = None):
+    """
+    Декоратор async-функции: одновременные вызовы с одинаковым
+    key(*args, **kwargs) выполняются один раз. Для методов key получает
+    и self, например key=lambda self, lat, lon: f"weather_{lat}_{lon}".
+    """
+
+    def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        flight = SingleFlight(name or func.__qualname__)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs) -> T:
+            return await flight.do(
+                key(*args, **kwargs), functools.partial(func, *args, **kwargs)
+            )
+
+        wrapper.flight = flight
+        return wrapper
+
+    return decorator
+
 
-    def get(self, key: str) -> Optional[Any]:
-        if key in self._store:
-            value, expire = self._store[key]
-            if datetime.utcnow() < expire:
-                return value
-            del self._store[key]
-        return None
+def create_cache(name: Optional[str] = None) -> CacheBackend:
+    """
+    Кэш по настройке CACHE_BACKEND: "memory" - свой у каждого воркера,
+    "sqlite" - общий для воркеров на одной машине, "redis" - общий для всех
+    """
+    name = name or settings.CACHE_BACKEND
+    if name == "memory":
+        return InMemoryCache()
+    if name == "sqlite":
+        return SQLiteCache()
+    if name == "redis":
+        return RedisCache()
+    raise ValueError(f"Неизвестный бэкенд кэша: {name}")
 
 
-cache = InMemoryCache()
+cache = create_cache()
@@ -0,0 +1,381 @@
+# app/core/cache_backends.py
+import asyncio
+import logging
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import unquote, urlsplit
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.serialization import SerializationError, packb, unpackb
+
+logger = logging.getLogger(__name__)
+
+# Наибольшее число ключей в одном запросе к SQLite (лимит параметров)
+SQLITE_BATCH = 500
+
+
+class CacheBackend(ABC):
+    """
+    Кэш значений с TTL по строковому ключу. Значения - то, что
+    сериализуется в MessagePack: None, bool, числа, строки, байты,
+    списки и словари.
+    """
+
+    name: str
+
+    @abstractmethod
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Найденные не истёкшие значения; отсутствующих ключей в ответе нет"""
+
+    @abstractmethod
+    def set_many(self, items: Dict[str, Any], ttl: int = 3600) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+    def get(self, key: str, default: Any = None) -> Optional[Any]:
+        return self.get_many([key]).get(key, default)
+
+    def set(self, key: str, value: Any, ttl: int = 3600):
+        self.set_many({key: value}, ttl)
+
+    async def aget(self, key: str, default: Any = None) -> Optional[Any]:
+        """get() для корутин: обращение к файлу или сети - в потоке"""
+        return await asyncio.to_thread(self.get, key, default)
+
+    async def aset(self, key: str, value: Any, ttl: int = 3600):
+        await asyncio.to_thread(self.set, key, value, ttl)
+
+    def close(self):
+        """Закрывает соединения при остановке приложения"""
+
+    @staticmethod
+    def _record_lookups(lookups: int, hits: int):
+        metrics.inc("cache_lookups_total", lookups)
+        metrics.inc("cache_hits_total", hits)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Кэш в файле SQLite, общий для всех воркеров на одной машине.
+
+    WAL позволяет читать параллельно с записью; у каждого потока своё
+    соединение. Срок жизни - по часам системы (общим для процессов).
+    Истёкшие записи при чтении не находятся и вычищаются периодически;
+    сверх max_entries удаляются записи, истекающие раньше других.
+    """
+
+    name = "sqlite"
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: Optional[int] = None,
+        sweep_interval: Optional[float] = None,
+    ):
+        self.path = path or settings.CACHE_SQLITE_PATH
+        self.max_entries = max_entries or settings.CACHE_MAX_ENTRIES
+        self.sweep_interval = (
+            settings.CACHE_SWEEP_INTERVAL if sweep_interval is None else sweep_interval
+        )
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + self.sweep_interval
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS ix_cache_expires ON cache (expires)")
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            with self._lock:
+                self._connections.append(db)
+        return db
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(dict.fromkeys(keys))
+        db = self._connection()
+        now = time.time()
+        found: Dict[str, Any] = {}
+        for start in range(0, len(keys), SQLITE_BATCH):
+            chunk = keys[start : start + SQLITE_BATCH]
+            rows = db.execute(
+                f"SELECT key, value FROM cache WHERE expires > ?"
+                f" AND key IN ({','.join('?' * len(chunk))})",
+                [now, *chunk],
+            )
+            for key, value in rows:
+                try:
+                    found[key] = unpackb(value)
+                except SerializationError:
+                    logger.warning(f"Повреждённое значение в кэше: {key}")
+        self._record_lookups(len(keys), len(found))
+        return found
+
+    def set_many(self, items: Dict[str, Any], ttl: int = 3600) -> None:
+        expires = time.time() + ttl
+        rows = [(key, packb(value), expires) for key, value in items.items()]
+        db = self._connection()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                rows,
+            )
+        if time.monotonic() >= self._next_sweep:
+            self.sweep()
+
+    def delete(self, key: str) -> None:
+        with self._connection() as db:
+            db.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._connection() as db:
+            db.execute("DELETE FROM cache")
+
+    def sweep(self) -> int:
+        """Удаляет истёкшие записи и лишние сверх max_entries"""
+        self._next_sweep = time.monotonic() + self.sweep_interval
+        with self._connection() as db:
+            removed = db.execute(
+                "DELETE FROM cache WHERE expires <= ?", (time.time(),)
+            ).rowcount
+            (count,) = db.execute("SELECT COUNT(*) FROM cache").fetchone()
+            if count > self.max_entries:
+                removed += db.execute(
+                    "DELETE FROM cache WHERE key IN"
+                    " (SELECT key FROM cache ORDER BY expires LIMIT ?)",
+                    (count - self.max_entries,),
+                ).rowcount
+        return removed
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for db in connections:
+            db.close()
+        self._local = threading.local()
+
+
+class RedisError(Exception):
+    """Ответ Redis с ошибкой"""
+
+
+class _RedisConnection:
+    """Соединение по протоколу RESP2 с конвейерной отправкой команд"""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def execute(self, commands: List[tuple]) -> List[Any]:
+        """Отправляет команды одним пакетом и читает ответы по порядку"""
+        payload = bytearray()
+        for command in commands:
+            payload += b"*%d\r\n" % len(command)
+            for arg in command:
+                if isinstance(arg, str):
+                    arg = arg.encode("utf-8")
+                elif isinstance(arg, int):
+                    arg = str(arg).encode()
+                payload += b"$%d\r\n%s\r\n" % (len(arg), arg)
+        self.sock.sendall(payload)
+        return [self._read_reply() for _ in commands]
+
+    def _read_reply(self) -> Any:
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Соединение с Redis закрыто")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            # Ошибка возвращается, а не бросается: остальные ответы
+            # конвейера ещё нужно дочитать
+            return RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Соединение с Redis закрыто")
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError(f"Непонятный ответ Redis: {line!r}")
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisCache(CacheBackend):
+    """
+    Кэш в Redis (или совместимом сервере), общий для всех воркеров
+    и машин. Клиент протокола встроен, библиотека redis не нужна.
+
+    У каждого потока своё соединение; пакетные операции уходят одним
+    конвейером (MGET, пачка SET ... PX). Недоступный Redis не ломает
+    запросы: чтение считается промахом, запись пропускается, а новое
+    подключение пробуется не раньше чем через retry_interval секунд.
+    """
+
+    name = "redis"
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        prefix: Optional[str] = None,
+        timeout: Optional[float] = None,
+        retry_interval: Optional[float] = None,
+    ):
+        parts = urlsplit(url or settings.CACHE_REDIS_URL)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.lstrip("/") or 0)
+        self.prefix = settings.CACHE_KEY_PREFIX if prefix is None else prefix
+        self.timeout = timeout or settings.CACHE_REDIS_TIMEOUT
+        self.retry_interval = (
+            settings.CACHE_REDIS_RETRY_INTERVAL
+            if retry_interval is None
+            else retry_interval
+        )
+        self._local = threading.local()
+        # time.monotonic(), до которого Redis считается недоступным
+        self._down_until = 0.0
+
+    def _connect(self) -> _RedisConnection:
+        connection = _RedisConnection(self.host, self.port, self.timeout)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            for reply in connection.execute(setup):
+                if isinstance(reply, RedisError):
+                    connection.close()
+                    raise reply
+        return connection
+
+    def _execute(self, commands: List[tuple]) -> List[Any]:
+        """Выполняет команды; оборванное соединение переоткрывается один раз"""
+        if time.monotonic() < self._down_until:
+            raise ConnectionError("Redis недоступен, повтор подключения позже")
+        for attempt in range(2):
+            connection = getattr(self._local, "connection", None)
+            try:
+                if connection is None:
+                    connection = self._local.connection = self._connect()
+                return connection.execute(commands)
+            except OSError:
+                if connection is not None:
+                    connection.close()
+                self._local.connection = None
+                if attempt or connection is None:
+                    # Не удалось подключиться - не пробуем на каждом запросе
+                    self._down_until = time.monotonic() + self.retry_interval
+                    logger.warning(
+                        f"Redis недоступен, кэш отключён на {self.retry_interval} с"
+                    )
+                    raise
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        try:
+            (values,) = self._execute([("MGET", *(self.prefix + k for k in keys))])
+        except OSError as e:
+            logger.debug(f"Чтение из кэша пропущено: {e}")
+            self._record_lookups(len(keys), 0)
+            return {}
+        if isinstance(values, RedisError):
+            raise values
+        found = {}
+        for key, value in zip(keys, values):
+            if value is None:
+                continue
+            try:
+                found[key] = unpackb(value)
+            except SerializationError:
+                logger.warning(f"Повреждённое значение в кэше: {key}")
+        self._record_lookups(len(keys), len(found))
+        return found
+
+    def set_many(self, items: Dict[str, Any], ttl: int = 3600) -> None:
+        if not items:
+            return
+        ttl_ms = int(ttl * 1000)
+        commands = [
+            ("SET", self.prefix + key, packb(value), "PX", ttl_ms)
+            for key, value in items.items()
+        ]
+        try:
+            replies = self._execute(commands)
+        except OSError as e:
+            logger.debug(f"Запись в кэш пропущена: {e}")
+            return
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+
+    def delete(self, key: str) -> None:
+        try:
+            self._execute([("DEL", self.prefix + key)])
+        except OSError as e:
+            logger.debug(f"Удаление из кэша пропущено: {e}")
+
+    def clear(self) -> None:
+        """Удаляет все ключи с префиксом этого приложения"""
+        cursor = b"0"
+        try:
+            while True:
+                (reply,) = self._execute(
+                    [("SCAN", cursor, "MATCH", f"{self.prefix}*", "COUNT", 1000)]
+                )
+                if isinstance(reply, RedisError):
+                    raise reply
+                cursor, keys = reply
+                if keys:
+                    self._execute([("DEL", *keys)])
+                if cursor == b"0":
+                    break
+        except OSError as e:
+            logger.debug(f"Очистка кэша пропущена: {e}")
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
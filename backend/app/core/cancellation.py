@@ -0,0 +1,52 @@
+# app/core/cancellation.py
+import asyncio
+from typing import Awaitable, TypeVar
+
+from fastapi import Request
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+T = TypeVar("T")
+
+
+class ClientDisconnected(Exception):
+    """Клиент закрыл соединение - продолжать обработку запроса незачем"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Клиент отключился на этапе {stage}")
+        self.stage = stage
+
+
+async def raise_if_disconnected(request: Request, stage: str) -> None:
+    """Проверка между этапами обработки"""
+    if await request.is_disconnected():
+        metrics.inc("analysis_cancelled_total", labels={"stage": stage})
+        raise ClientDisconnected(stage)
+
+
+async def run_unless_disconnected(
+    request: Request,
+    awaitable: Awaitable[T],
+    stage: str,
+    poll_interval: float = None,
+) -> T:
+    """
+    Выполняет этап, периодически проверяя, что клиент ещё ждёт ответа.
+    При отключении этап отменяется (вместе с детекцией в пуле)
+    и выбрасывается ClientDisconnected.
+    """
+    poll_interval = poll_interval or settings.DISCONNECT_POLL_INTERVAL
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                metrics.inc("analysis_cancelled_total", labels={"stage": stage})
+                raise ClientDisconnected(stage)
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
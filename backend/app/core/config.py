@@ -1,6 +1,6 @@
 # app/core/config.py
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 
 
 class Settings(BaseSettings):
@@ -16,20 +16,125 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite:///./smart_garden.db"
 
+    # Хранилище файлов: "s3" (S3/MinIO) или "local" (диск, для офлайн-развёртываний)
+    STORAGE_BACKEND: str = "s3"
+    LOCAL_STORAGE_DIR: str = "storage"
+    # fsync: "always", "batch" (пачками по LOCAL_STORAGE_FSYNC_BATCH файлов) или "none"
+    LOCAL_STORAGE_FSYNC: str = "batch"
+    LOCAL_STORAGE_FSYNC_BATCH: int = 32
+    LOCAL_STORAGE_URL_PREFIX: str = "/api/v1/files"
+    # Подписанная ссылка отдаётся повторно, пока не прошла эта доля её срока
+    PRESIGNED_URL_REUSE_FRACTION: float = 0.5
+    PRESIGNED_URL_CACHE_SIZE: int = 10000
+    # Дисковый кэш объектов S3 для повторных чтений (0 - выключен)
+    DISK_CACHE_DIR: str = "storage_cache"
+    DISK_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+
+    # Сборка мусора: возраст, с которого объект без ссылок можно удалить, и темп удаления
+    STORAGE_GC_MIN_AGE: float = 3600.0
+    STORAGE_GC_DELETES_PER_SECOND: float = 500.0
+
     # S3 / MinIO
     S3_ENDPOINT: str = "http://localhost:9000"
     S3_ACCESS_KEY: str = "minioadmin"
     S3_SECRET_KEY: str = "minioadmin"
     S3_BUCKET_NAME: str = "smart-garden"
     S3_REGION: str = "us-east-1"
+    # Пул соединений и параметры multipart-передачи для больших файлов
+    S3_MAX_POOL_CONNECTIONS: int = 32
+    S3_MAX_ATTEMPTS: int = 3
+    S3_CONNECT_TIMEOUT: float = 5.0
+    S3_READ_TIMEOUT: float = 60.0
+    S3_MULTIPART_THRESHOLD: int = 8 * 1024 * 1024
+    S3_MULTIPART_CHUNKSIZE: int = 8 * 1024 * 1024
+    S3_MAX_CONCURRENCY: int = 8
     MAX_FILE_SIZE: int = 10 * 1024 * 1024
     ALLOWED_MIME_TYPES: List[str] = ["image/jpeg", "image/png", "image/jpg"]
+    # /files/upload пишет файл во временный файл частями такого размера
+    UPLOAD_CHUNK_SIZE: int = 256 * 1024
+    # Докачиваемые загрузки (/uploads): брошенные удаляются через TTL секунд
+    # после последнего PATCH, проверка - раз в SWEEP_INTERVAL секунд
+    RESUMABLE_UPLOAD_TTL: int = 24 * 3600
+    RESUMABLE_UPLOAD_SWEEP_INTERVAL: float = 600.0
 
     # OpenWeatherMap
     OPENWEATHER_API_KEY: str = ""
     OPENWEATHER_BASE_URL: str = "https://api.openweathermap.org/data/2.5"
     WEATHER_CACHE_TTL: int = 3600
 
+    # Общий кэш (app.core.cache): "memory" - в памяти воркера, "sqlite" - файл,
+    # общий для воркеров одной машины, "redis" - сервер Redis
+    CACHE_BACKEND: str = "memory"
+    CACHE_SQLITE_PATH: str = "cache.sqlite3"
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    CACHE_REDIS_TIMEOUT: float = 0.5
+    # Пауза перед новым подключением после отказа Redis (секунды)
+    CACHE_REDIS_RETRY_INTERVAL: float = 5.0
+    CACHE_KEY_PREFIX: str = "smart-garden:"
+    # Лимиты и период очистки истёкших записей
+    CACHE_MAX_ENTRIES: int = 10000
+    CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    CACHE_SWEEP_INTERVAL: float = 60.0
+
+    # Детекция и фоновые задачи анализа
+    DETECTION_WORKERS: int = 2
+    # Доли пула детекции по классам приоритета и максимальное ожидание в очереди
+    DETECTION_PRIORITY_WEIGHTS: Dict[str, int] = {"interactive": 4, "bulk": 1}
+    DETECTION_MAX_QUEUE_AGE: float = 5.0
+    ANALYSIS_JOB_WORKERS: int = 2
+    ANALYSIS_JOB_SPOOL_DIR: str = "job_spool"
+    ANALYSIS_JOB_SSE_INTERVAL: float = 1.0
+    # Аренда задачи: воркер продлевает updated_at раз в HEARTBEAT секунд;
+    # задача без продления дольше LEASE считается брошенной и перезапускается
+    ANALYSIS_JOB_HEARTBEAT_INTERVAL: float = 15.0
+    ANALYSIS_JOB_LEASE_TIMEOUT: float = 120.0
+    DISCONNECT_POLL_INTERVAL: float = 0.25
+
+    # Допуск запросов к детекции: лимит одновременных, очередь, дедлайн ожидания
+    ADMISSION_MAX_CONCURRENT: int = 4
+    ADMISSION_MAX_QUEUE: int = 16
+    ADMISSION_QUEUE_TIMEOUT: float = 10.0
+
+    # Пакетный анализ
+    BATCH_MAX_FILES: int = 50
+    BATCH_MAX_CONCURRENCY: int = 4
+    BATCH_INSERT_CHUNK: int = 20
+
+    # Дедупликация загружаемых изображений по хэшу содержимого
+    DEDUP_ENABLED: bool = True
+    DEDUP_REUSE_DETECTION: bool = True
+
+    # Уменьшенные копии фотографий (WebP) для списков и просмотра
+    DERIVATIVES_ENABLED: bool = True
+    THUMBNAIL_SIZE: int = 320
+    PREVIEW_SIZE: int = 1280
+    DERIVATIVE_WEBP_QUALITY: int = 80
+    # Копии произвольного размера (/files/{key}/resized): кэш на диске
+    RESIZE_CACHE_DIR: str = "resize_cache"
+    RESIZE_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    RESIZE_MAX_DIMENSION: int = 4096
+    RESIZE_JPEG_QUALITY: int = 85
+
+    # Кэш декодированных кадров для повторного анализа (в байтах)
+    FRAME_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+
+    # Учёт нагрузки на детектор и суточные квоты (0 - без ограничений)
+    USAGE_FLUSH_INTERVAL: float = 60.0
+    DAILY_CPU_SECONDS_QUOTA: float = 0.0
+    DAILY_MEGAPIXELS_QUOTA: float = 0.0
+
+    # Выгрузка архива фотографий: сколько изображений скачивать заранее
+    EXPORT_PREFETCH: int = 8
+    EXPORT_PAGE_SIZE: int = 500
+
+    # Пересчёт старых записей новой версией детектора
+    BACKFILL_BATCH_SIZE: int = 200
+    BACKFILL_WORKERS: int = 4
+    BACKFILL_PREFETCH: int = 8
+    # Сколько изображений пересчёта одновременно в памяти: скачанных наперёд
+    # и ждущих детекции (каждого вида не больше окна)
+    BACKFILL_PREFETCH_WINDOW: int = 32
+
     class Config:
         env_file = ".env"  # ← эта строка загружает переменные из .env
         env_file_encoding = "utf-8"
@@ -0,0 +1,184 @@
+# app/core/disk_cache.py
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.register_ratio(
+    "disk_cache_hit_ratio", "disk_cache_hits_total", "disk_cache_lookups_total"
+)
+
+
+# Возраст (секунды), после которого файл в .tmp считается брошенным
+TMP_STALE_AGE = 60
+
+
+def _key_hash(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    Локальный кэш объектов хранилища на диске, ограниченный по объёму (LRU).
+
+    Файл записи называется <sha256 ключа>-<sha256 содержимого>: при чтении
+    содержимое сверяется с хэшем из имени, повреждённая запись удаляется
+    и считается промахом. Индекс восстанавливается по каталогу при старте,
+    порядок вытеснения - по времени последнего обращения к файлу.
+    Метрики пишутся с префиксом metric_prefix (disk_cache_hits_total и т.д.).
+    """
+
+    def __init__(self, root: str, max_bytes: int, metric_prefix: str = "disk_cache"):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.metric_prefix = metric_prefix
+        self._tmp_dir = os.path.join(self.root, ".tmp")
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # sha256 ключа -> (путь, размер); порядок - от давно использованных
+        self._entries: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        # Номер поколения ключа: растёт при инвалидации, чтобы запись,
+        # скачанная до удаления объекта, не попала в кэш после него
+        self._generations: Dict[str, int] = {}
+        self._size = 0
+        self._load()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def generation(self, key: str) -> int:
+        with self._lock:
+            return self._generations.get(_key_hash(key), 0)
+
+    def get(self, key: str) -> Optional[bytes]:
+        metrics.inc(f"{self.metric_prefix}_lookups_total")
+        key_hash = _key_hash(key)
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key_hash)
+        path, size = entry
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            # Файл мог заменить параллельный put - новую запись не трогаем
+            self._drop(key_hash, path)
+            return None
+
+        digest = os.path.basename(path).split("-", 1)[1]
+        if hashlib.sha256(data).hexdigest() != digest:
+            logger.warning(f"Повреждённая запись дискового кэша для {key}, удаляем")
+            metrics.inc(f"{self.metric_prefix}_corrupted_total")
+            self._drop(key_hash, path)
+            return None
+
+        try:
+            # Время обращения - порядок вытеснения после перезапуска
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        metrics.inc(f"{self.metric_prefix}_hits_total")
+        metrics.inc(f"{self.metric_prefix}_bytes_saved_total", size)
+        return data
+
+    def put(self, key: str, data: bytes, generation: Optional[int] = None) -> None:
+        if len(data) > self.max_bytes:
+            return
+        key_hash = _key_hash(key)
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.root, key_hash[:2], f"{key_hash}-{digest}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+
+        with self._lock:
+            current = self._generations.get(key_hash, 0)
+            if generation is not None and generation != current:
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, path)
+            old = self._entries.pop(key_hash, None)
+            if old is not None:
+                self._size -= old[1]
+                if old[0] != path:
+                    _remove(old[0])
+            self._entries[key_hash] = (path, len(data))
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, (evicted_path, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                _remove(evicted_path)
+                metrics.inc(f"{self.metric_prefix}_evictions_total")
+            metrics.set_gauge(f"{self.metric_prefix}_bytes", self._size)
+
+    def invalidate(self, key: str) -> None:
+        key_hash = _key_hash(key)
+        with self._lock:
+            self._generations[key_hash] = self._generations.get(key_hash, 0) + 1
+        self._drop(key_hash)
+
+    def _drop(self, key_hash: str, path: Optional[str] = None):
+        """Удаляет запись ключа; с path - только если запись всё ещё в этом файле"""
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None or (path is not None and entry[0] != path):
+                return
+            del self._entries[key_hash]
+            self._size -= entry[1]
+            metrics.set_gauge(f"{self.metric_prefix}_bytes", self._size)
+        _remove(entry[0])
+
+    def _load(self):
+        """Восстанавливает индекс по файлам, оставшимся с прошлого запуска"""
+        # Недописанные put: процесс упал между записью и переименованием.
+        # Совсем свежие файлы может дописывать другой процесс с тем же каталогом
+        stale = time.time() - TMP_STALE_AGE
+        with os.scandir(self._tmp_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.stat().st_mtime < stale:
+                    _remove(entry.path)
+
+        found = []
+        for shard in os.listdir(self.root):
+            shard_path = os.path.join(self.root, shard)
+            if shard == ".tmp" or not os.path.isdir(shard_path):
+                continue
+            with os.scandir(shard_path) as entries:
+                for entry in entries:
+                    if "-" not in entry.name or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name, entry.path, stat.st_size))
+
+        for _, name, path, size in sorted(found):
+            key_hash = name.split("-", 1)[0]
+            old = self._entries.pop(key_hash, None)
+            if old is not None:
+                self._size -= old[1]
+                _remove(old[0])
+            self._entries[key_hash] = (path, size)
+            self._size += size
+        while self._size > self.max_bytes and self._entries:
+            _, (path, size) = self._entries.popitem(last=False)
+            self._size -= size
+            _remove(path)
+        metrics.set_gauge(f"{self.metric_prefix}_bytes", self._size)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,98 @@
+# app/core/metrics.py
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+
+def _metric_name(name: str, labels: Optional[Dict[str, Any]] = None) -> str:
+    if not labels:
+        return name
+    label_str = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+
+class MetricsRegistry:
+    """
+    Простой потокобезопасный реестр метрик процесса.
+
+    Поддерживает счётчики, gauge-значения, распределения (count/sum/max)
+    и производные отношения двух счётчиков.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+        self._ratios: Dict[str, Tuple[str, str]] = {}
+
+    def inc(self, name: str, value: float = 1.0, labels: Optional[Dict] = None):
+        """Увеличивает счётчик"""
+        with self._lock:
+            self._counters[_metric_name(name, labels)] += value
+
+    def set_gauge(self, name: str, value: float, labels: Optional[Dict] = None):
+        """Устанавливает текущее значение gauge"""
+        with self._lock:
+            self._gauges[_metric_name(name, labels)] = value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict] = None):
+        """Добавляет наблюдение в распределение (например, время ожидания)"""
+        key = _metric_name(name, labels)
+        with self._lock:
+            stats = self._timings.setdefault(key, {"count": 0, "sum": 0.0, "max": 0.0})
+            stats["count"] += 1
+            stats["sum"] += value
+            stats["max"] = max(stats["max"], value)
+
+    def register_ratio(self, name: str, numerator: str, denominator: str):
+        """Регистрирует отношение двух счётчиков, вычисляемое в snapshot()"""
+        with self._lock:
+            self._ratios[name] = (numerator, denominator)
+
+    def get(self, name: str, labels: Optional[Dict] = None) -> float:
+        key = _metric_name(name, labels)
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            return self._gauges.get(key, 0.0)
+
+    def average(self, name: str, labels: Optional[Dict] = None) -> float:
+        """Среднее значение распределения (0, если наблюдений не было)"""
+        key = _metric_name(name, labels)
+        with self._lock:
+            stats = self._timings.get(key)
+            if not stats or not stats["count"]:
+                return 0.0
+            return stats["sum"] / stats["count"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущие значения всех метрик"""
+        with self._lock:
+            timings = {}
+            for key, stats in self._timings.items():
+                avg = stats["sum"] / stats["count"] if stats["count"] else 0.0
+                timings[key] = {**stats, "avg": round(avg, 6)}
+
+            ratios = {}
+            for key, (numerator, denominator) in self._ratios.items():
+                total = self._counters.get(denominator, 0.0)
+                part = self._counters.get(numerator, 0.0)
+                ratios[key] = round(part / total, 4) if total else 0.0
+
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": timings,
+                "ratios": ratios,
+            }
+
+    def reset(self):
+        """Сбрасывает значения (используется в тестах)"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timings.clear()
+
+
+metrics = MetricsRegistry()
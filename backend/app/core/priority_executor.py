@@ -0,0 +1,187 @@
+# app/core/priority_executor.py
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import Callable, Deque, Dict, List, Optional
+
+from app.core.metrics import metrics
+
+
+class _WorkItem:
+    __slots__ = ("future", "fn", "args", "kwargs", "enqueued_at")
+
+    def __init__(self, future: Future, fn: Callable, args, kwargs):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.enqueued_at = time.monotonic()
+
+
+class PriorityExecutor(Executor):
+    """
+    Пул потоков с классами приоритета.
+
+    У каждого класса своя очередь и вес. Свободный поток берёт задачу
+    из класса с наименьшим виртуальным временем (взвешенное справедливое
+    разделение: класс с весом 4 получает вчетверо больше запусков, чем
+    класс с весом 1). Задача, прождавшая дольше max_queue_age, идёт
+    вне очереди - так низкий приоритет не голодает. Вне очереди проходит
+    не больше одной задачи подряд: между такими запусками выбор снова
+    идёт по весам, иначе большая состарившаяся пачка фоновых задач
+    (пересчёт) выполнялась бы целиком раньше интерактивных.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        weights: Dict[str, int],
+        max_queue_age: float,
+        default_class: Optional[str] = None,
+        thread_name_prefix: str = "priority",
+    ):
+        self.max_workers = max(max_workers, 1)
+        self.weights = dict(weights)
+        self.max_queue_age = max_queue_age
+        self.default_class = default_class or next(iter(self.weights))
+        self.thread_name_prefix = thread_name_prefix
+
+        self._queues: Dict[str, Deque[_WorkItem]] = {c: deque() for c in self.weights}
+        self._vtime: Dict[str, float] = {c: 0.0 for c in self.weights}
+        # Предыдущая задача прошла вне очереди по возрасту
+        self._last_aged = False
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._idle = 0
+        self._shutdown = False
+
+    # ---------- Executor API ----------
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        return self.submit_to(self.default_class, fn, *args, **kwargs)
+
+    def submit_to(self, priority: str, fn: Callable, /, *args, **kwargs) -> Future:
+        """Ставит задачу в очередь указанного класса приоритета"""
+        if priority not in self._queues:
+            raise ValueError(f"Неизвестный класс приоритета: {priority}")
+
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Пул остановлен")
+            queue = self._queues[priority]
+            if not queue:
+                # Класс, долго простаивавший, не должен получить
+                # пачку внеочередных запусков за накопленный «долг»
+                busy = [self._vtime[c] for c, q in self._queues.items() if q]
+                if busy:
+                    self._vtime[priority] = max(self._vtime[priority], min(busy))
+            queue.append(_WorkItem(future, fn, args, kwargs))
+            self._set_queue_gauge(priority)
+            self._ensure_worker()
+            self._condition.notify()
+        return future
+
+    def for_class(self, priority: str) -> "PriorityClassExecutor":
+        """Executor, отправляющий все задачи в один класс приоритета"""
+        return PriorityClassExecutor(self, priority)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._condition:
+            self._shutdown = True
+            if cancel_futures:
+                for priority, queue in self._queues.items():
+                    while queue:
+                        queue.popleft().future.cancel()
+                    self._set_queue_gauge(priority)
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def queue_length(self, priority: str) -> int:
+        with self._condition:
+            return len(self._queues[priority])
+
+    # ---------- Внутреннее ----------
+
+    def _ensure_worker(self):
+        if self._idle == 0 and len(self._threads) < self.max_workers:
+            thread = threading.Thread(
+                target=self._worker,
+                name=f"{self.thread_name_prefix}_{len(self._threads)}",
+                daemon=True,
+            )
+            self._threads.append(thread)
+            thread.start()
+
+    def _next_item(self) -> Optional[_WorkItem]:
+        """Выбирает следующую задачу; вызывается под блокировкой"""
+        now = time.monotonic()
+        candidates = [c for c, q in self._queues.items() if q]
+        if not candidates:
+            return None
+
+        overdue = [
+            c
+            for c in candidates
+            if now - self._queues[c][0].enqueued_at >= self.max_queue_age
+        ]
+        if overdue and not self._last_aged:
+            priority = min(overdue, key=lambda c: self._queues[c][0].enqueued_at)
+            metrics.inc("detection_aged_total", labels={"class": priority})
+            self._last_aged = True
+        else:
+            priority = min(candidates, key=lambda c: self._vtime[c])
+            self._last_aged = False
+
+        self._vtime[priority] += 1.0 / self.weights[priority]
+        item = self._queues[priority].popleft()
+        self._set_queue_gauge(priority)
+        metrics.observe(
+            "detection_queue_seconds", now - item.enqueued_at, labels={"class": priority}
+        )
+        return item
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                item = self._next_item()
+                while item is None:
+                    if self._shutdown:
+                        return
+                    self._idle += 1
+                    self._condition.wait()
+                    self._idle -= 1
+                    item = self._next_item()
+
+            if not item.future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = item.fn(*item.args, **item.kwargs)
+            except BaseException as e:
+                item.future.set_exception(e)
+            else:
+                item.future.set_result(result)
+            del item
+
+    def _set_queue_gauge(self, priority: str):
+        metrics.set_gauge(
+            "detection_queue_length", len(self._queues[priority]), labels={"class": priority}
+        )
+
+
+class PriorityClassExecutor(Executor):
+    """Представление PriorityExecutor для одного класса приоритета"""
+
+    def __init__(self, executor: PriorityExecutor, priority: str):
+        self._executor = executor
+        self.priority = priority
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        return self._executor.submit_to(self.priority, fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        # Общий пул останавливает его владелец
+        pass
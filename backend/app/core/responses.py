@@ -0,0 +1,172 @@
+# app/core/responses.py
+import os
+import re
+import stat
+from email.utils import formatdate
+from typing import List, Mapping, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Заголовок Range с одним диапазоном -> (начало, конец включительно).
+    None - заголовок не понят или диапазонов несколько: отдаётся весь
+    файл. ValueError - диапазон за пределами файла (416).
+    """
+    match = _RANGE.match(header.replace(" ", ""))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-500: последние 500 байт
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise ValueError(header)
+    return start, end
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Для If-None-Match теги сравниваются без учёта W/
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag.removeprefix("W/") in tags
+
+
+class SendfileResponse(Response):
+    """
+    Отдача файла с диска с поддержкой условных запросов и диапазонов.
+
+    ETag - строгий: по умолчанию из inode, времени изменения и размера
+    (файлы хранилища заменяются переименованием, так что при любой
+    перезаписи он меняется), либо переданный явно, например хэш
+    содержимого. If-None-Match с совпавшим тегом даёт 304 без тела,
+    Range с одним диапазоном - 206 (If-Range учитывается).
+
+    Если ASGI-сервер поддерживает расширение zerocopysend, содержимое
+    передаётся ядром напрямую из файла в сокет, минуя Python. Иначе
+    (например, uvicorn) файл читается и отдаётся по частям.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+        etag: Optional[str] = None,
+    ):
+        self.path = path
+        self.status_code = 200
+        self.media_type = media_type or "application/octet-stream"
+        self.background = None
+        self.etag = etag
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise RuntimeError(f"File at path {self.path} is not a file.")
+        size = stat_result.st_size
+        etag = self.etag or (
+            f'"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}-{size:x}"'
+        )
+        self.headers["etag"] = etag
+        self.headers["last-modified"] = formatdate(stat_result.st_mtime, usegmt=True)
+        self.headers["accept-ranges"] = "bytes"
+
+        request_headers = Headers(scope=scope)
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None and _etag_matches(if_none_match, etag):
+            await self._send_empty(send, 304, ["content-type", "content-length"])
+            return
+
+        start, end = 0, size - 1
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and (if_range is None or if_range.strip() == etag):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                self.headers["content-range"] = f"bytes */{size}"
+                await self._send_empty(send, 416, ["content-type"])
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                self.status_code = 206
+                self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+        count = end - start + 1
+        self.headers["content-length"] = str(count)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if scope.get("method") == "HEAD" or count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send(
+                    {
+                        "type": ZEROCOPY_EXTENSION,
+                        "file": file,
+                        "offset": start,
+                        "count": count,
+                        "more_body": False,
+                    }
+                )
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(start)
+                remaining = count
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": chunk,
+                            "more_body": remaining > 0,
+                        }
+                    )
+                if remaining > 0:
+                    # Файл укоротился во время отдачи
+                    await send(
+                        {"type": "http.response.body", "body": b"", "more_body": False}
+                    )
+
+    async def _send_empty(self, send: Send, status_code: int, drop: List[str]):
+        for name in drop:
+            if name in self.headers:
+                del self.headers[name]
+        if status_code != 304:
+            self.headers["content-length"] = "0"
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
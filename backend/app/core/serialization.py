@@ -0,0 +1,199 @@
+# app/core/serialization.py
+"""
+Компактная двоичная сериализация значений кэша - подмножество MessagePack
+(nil, bool, int, float64, str, bin, array, map). Совместима с библиотекой
+msgpack (кортежи читаются как списки), но не требует её установки и,
+в отличие от pickle, не исполняет код при чтении чужих данных.
+"""
+import struct
+from typing import Any, Tuple
+
+
+class SerializationError(ValueError):
+    pass
+
+
+def packb(value: Any) -> bytes:
+    out = bytearray()
+    _pack(value, out)
+    return bytes(out)
+
+
+def unpackb(data: bytes) -> Any:
+    value, offset = _unpack(memoryview(data), 0)
+    if offset != len(data):
+        raise SerializationError("Лишние байты после значения")
+    return value
+
+
+def _pack(value: Any, out: bytearray):
+    if value is None:
+        out.append(0xC0)
+    elif value is True:
+        out.append(0xC3)
+    elif value is False:
+        out.append(0xC2)
+    elif isinstance(value, int):
+        _pack_int(value, out)
+    elif isinstance(value, float):
+        out.append(0xCB)
+        out += struct.pack(">d", value)
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+        _pack_header(len(data), out, fix=(0xA0, 31), sizes=(0xD9, 0xDA, 0xDB))
+        out += data
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        _pack_header(len(data), out, fix=None, sizes=(0xC4, 0xC5, 0xC6))
+        out += data
+    elif isinstance(value, (list, tuple)):
+        _pack_header(len(value), out, fix=(0x90, 15), sizes=(None, 0xDC, 0xDD))
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, dict):
+        _pack_header(len(value), out, fix=(0x80, 15), sizes=(None, 0xDE, 0xDF))
+        for key, item in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    else:
+        raise SerializationError(f"Тип {type(value).__name__} не сериализуется")
+
+
+def _pack_int(value: int, out: bytearray):
+    if 0 <= value <= 0x7F:
+        out.append(value)
+    elif -32 <= value < 0:
+        out.append(value & 0xFF)
+    elif 0 <= value < 2**64:
+        for code, fmt, limit in (
+            (0xCC, ">B", 2**8),
+            (0xCD, ">H", 2**16),
+            (0xCE, ">I", 2**32),
+        ):
+            if value < limit:
+                out.append(code)
+                out += struct.pack(fmt, value)
+                return
+        out.append(0xCF)
+        out += struct.pack(">Q", value)
+    elif -(2**63) <= value < 0:
+        for code, fmt, limit in (
+            (0xD0, ">b", 2**7),
+            (0xD1, ">h", 2**15),
+            (0xD2, ">i", 2**31),
+        ):
+            if value >= -limit:
+                out.append(code)
+                out += struct.pack(fmt, value)
+                return
+        out.append(0xD3)
+        out += struct.pack(">q", value)
+    else:
+        raise SerializationError("Целое не помещается в 64 бита")
+
+
+def _pack_header(length: int, out: bytearray, fix, sizes):
+    if fix is not None and length <= fix[1]:
+        out.append(fix[0] | length)
+        return
+    code8, code16, code32 = sizes
+    if code8 is not None and length < 2**8:
+        out.append(code8)
+        out += struct.pack(">B", length)
+    elif length < 2**16:
+        out.append(code16)
+        out += struct.pack(">H", length)
+    else:
+        out.append(code32)
+        out += struct.pack(">I", length)
+
+
+# Код -> (формат struct, размер) для чисел фиксированной длины
+_NUMBERS = {
+    0xCA: (">f", 4),
+    0xCB: (">d", 8),
+    0xCC: (">B", 1),
+    0xCD: (">H", 2),
+    0xCE: (">I", 4),
+    0xCF: (">Q", 8),
+    0xD0: (">b", 1),
+    0xD1: (">h", 2),
+    0xD2: (">i", 4),
+    0xD3: (">q", 8),
+}
+# Код -> (тип, размер поля длины)
+_SIZED = {
+    0xC4: ("bin", 1),
+    0xC5: ("bin", 2),
+    0xC6: ("bin", 4),
+    0xD9: ("str", 1),
+    0xDA: ("str", 2),
+    0xDB: ("str", 4),
+    0xDC: ("array", 2),
+    0xDD: ("array", 4),
+    0xDE: ("map", 2),
+    0xDF: ("map", 4),
+}
+_LENGTH_FORMATS = {1: ">B", 2: ">H", 4: ">I"}
+
+
+def _unpack(data: memoryview, offset: int) -> Tuple[Any, int]:
+    try:
+        code = data[offset]
+    except IndexError:
+        raise SerializationError("Неожиданный конец данных")
+    offset += 1
+    if code <= 0x7F:
+        return code, offset
+    if code >= 0xE0:
+        return code - 0x100, offset
+    if code == 0xC0:
+        return None, offset
+    if code in (0xC2, 0xC3):
+        return code == 0xC3, offset
+    if code in _NUMBERS:
+        fmt, size = _NUMBERS[code]
+        return _read(data, offset, fmt, size), offset + size
+
+    if 0xA0 <= code <= 0xBF:
+        kind, length = "str", code & 0x1F
+    elif 0x90 <= code <= 0x9F:
+        kind, length = "array", code & 0x0F
+    elif 0x80 <= code <= 0x8F:
+        kind, length = "map", code & 0x0F
+    elif code in _SIZED:
+        kind, size = _SIZED[code]
+        length = _read(data, offset, _LENGTH_FORMATS[size], size)
+        offset += size
+    else:
+        raise SerializationError(f"Неподдерживаемый код 0x{code:02x}")
+
+    if kind in ("str", "bin"):
+        chunk = data[offset : offset + length]
+        if len(chunk) != length:
+            raise SerializationError("Неожиданный конец данных")
+        if kind == "bin":
+            return bytes(chunk), offset + length
+        try:
+            return str(chunk, "utf-8"), offset + length
+        except UnicodeDecodeError:
+            raise SerializationError("Строка не в UTF-8")
+    if kind == "array":
+        items = []
+        for _ in range(length):
+            item, offset = _unpack(data, offset)
+            items.append(item)
+        return items, offset
+    result = {}
+    for _ in range(length):
+        key, offset = _unpack(data, offset)
+        if isinstance(key, list):
+            raise SerializationError("Массив не может быть ключом")
+        result[key], offset = _unpack(data, offset)
+    return result, offset
+
+
+def _read(data: memoryview, offset: int, fmt: str, size: int):
+    if offset + size > len(data):
+        raise SerializationError("Неожиданный конец данных")
+    return struct.unpack_from(fmt, data, offset)[0]
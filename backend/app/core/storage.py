@@ -1,22 +1,122 @@
-import boto3
-from botocore.config import Config
+from collections import OrderedDict
+from concurrent.futures import Future
 from fastapi import UploadFile, HTTPException
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import aiofiles
+import asyncio
+import hashlib
+import io
+import logging
+import tempfile
+import threading
+import time
 import uuid
 import os
 from app.core.config import settings
+from app.core.disk_cache import DiskCache
+from app.core.metrics import metrics
+from app.core.storage_backends import ObjectInfo, StorageBackend, create_backend
 
+logger = logging.getLogger(__name__)
 
-class StorageService:
-    def __init__(self):
-        self.client = boto3.client(
-            "s3",
-            endpoint_url=settings.S3_ENDPOINT,
-            aws_access_key_id=settings.S3_ACCESS_KEY,
-            aws_secret_access_key=settings.S3_SECRET_KEY,
-            region_name=settings.S3_REGION,
-            config=Config(signature_version="s3v4"),
+
+def content_addressed_key(content_hash: str, filename: str = "") -> str:
+    """Ключ объекта, однозначно определяемый его содержимым"""
+    ext = os.path.splitext(filename or "")[1].lower()
+    return f"objects/{content_hash[:2]}/{content_hash}{ext}"
+
+
+class FileTooLarge(Exception):
+    """Загружаемый файл превысил допустимый размер"""
+
+
+class StreamingUpload:
+    """
+    Потоковая запись объекта: части пишутся во временный файл
+    в staging_dir бэкенда с подсчётом SHA-256 и размера, после
+    commit() файл передаётся бэкенду. В памяти держится только
+    текущая часть. Используется как async with: без commit()
+    временный файл удаляется.
+    """
+
+    def __init__(
+        self, storage: "StorageService", key: str, content_type: str, max_size: int
+    ):
+        self.storage = storage
+        self.key = key
+        self.content_type = content_type
+        self.max_size = max_size
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._path: Optional[str] = None
+        self._file = None
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    async def __aenter__(self) -> "StreamingUpload":
+        fd, self._path = tempfile.mkstemp(
+            dir=self.storage.backend.staging_dir, suffix=".part"
         )
-        self.bucket = settings.S3_BUCKET_NAME
+        os.close(fd)
+        self._file = await aiofiles.open(self._path, "wb")
+        return self
+
+    async def write(self, chunk: bytes):
+        """Дописывает часть; FileTooLarge сразу при превышении max_size"""
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise FileTooLarge(self.size)
+        self._digest.update(chunk)
+        await self._file.write(chunk)
+
+    async def commit(self) -> str:
+        await self._file.close()
+        path, self._path = self._path, None
+        # Бэкенд забирает файл себе
+        return await self.storage.put_file_async(self.key, path, self.content_type)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._file.close()
+        if self._path is not None:
+            try:
+                os.remove(self._path)
+            except FileNotFoundError:
+                pass
+
+
+class StorageService:
+    """
+    Хранилище файлов: проверки и генерация ключей поверх бэкенда
+    (S3 или локальный диск, см. STORAGE_BACKEND).
+
+    Бэкенды потокобезопасны, поэтому сервис создаётся один раз на процесс
+    (см. get_storage). Синхронные методы блокируют поток; в асинхронном
+    коде используйте методы *_async.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[StorageBackend] = None,
+        disk_cache: Optional[DiskCache] = None,
+    ):
+        self.backend = backend or create_backend()
+        # Дисковый кэш скачанных объектов нужен только удалённому хранилищу
+        if (
+            disk_cache is None
+            and self.backend.name != "local"
+            and settings.DISK_CACHE_MAX_BYTES > 0
+        ):
+            disk_cache = DiskCache(settings.DISK_CACHE_DIR, settings.DISK_CACHE_MAX_BYTES)
+        self.disk_cache = disk_cache
+        # Скачивания в процессе: параллельные читатели ключа ждут одно
+        self._downloads: Dict[str, Future] = {}
+        self._downloads_lock = threading.Lock()
+        # Подписанные ссылки: ключ -> (срок жизни, ссылка, до какого момента отдавать)
+        self._urls: "OrderedDict[str, Tuple[int, str, float]]" = OrderedDict()
+        self._urls_lock = threading.Lock()
 
     async def upload_file(self, file: UploadFile, folder: str = "uploads") -> str:
         # Проверка размера
@@ -32,24 +132,216 @@ class StorageService:
 
         ext = os.path.splitext(file.filename)[1]
         key = f"{folder}/{uuid.uuid4()}{ext}"
-        self.client.upload_fileobj(
-            file.file, self.bucket, key, ExtraArgs={"ContentType": file.content_type}
+        await asyncio.to_thread(self.backend.put, key, file.file, file.content_type)
+        return key
+
+    def open_upload(
+        self,
+        filename: str,
+        content_type: str,
+        folder: str = "uploads",
+        max_size: Optional[int] = None,
+    ) -> StreamingUpload:
+        """Загрузка по частям без буферизации файла в памяти (см. StreamingUpload)"""
+        ext = os.path.splitext(filename or "")[1]
+        key = f"{folder}/{uuid.uuid4()}{ext}"
+        return StreamingUpload(
+            self, key, content_type, max_size or settings.MAX_FILE_SIZE
         )
+
+    def upload_bytes(
+        self,
+        data: bytes,
+        filename: str,
+        content_type: str,
+        folder: str = "uploads",
+        key: str = None,
+    ) -> str:
+        """Загружает уже прочитанное содержимое файла (для фоновых задач)"""
+        if len(data) > settings.MAX_FILE_SIZE:
+            raise HTTPException(
+                400, f"File too large. Max size: {settings.MAX_FILE_SIZE} bytes"
+            )
+        if content_type not in settings.ALLOWED_MIME_TYPES:
+            raise HTTPException(400, f"File type not allowed: {content_type}")
+
+        if key is None:
+            ext = os.path.splitext(filename or "")[1]
+            key = f"{folder}/{uuid.uuid4()}{ext}"
+        self.backend.put(key, io.BytesIO(data), content_type)
+        self._invalidate([key])
         return key
 
-    def get_presigned_url(self, key: str, expires_in: int = 3600) -> str | None:
+    def put_bytes(self, key: str, data: bytes, content_type: str) -> str:
+        """Сохраняет служебный объект по готовому ключу (без проверок загрузки)"""
+        self.backend.put(key, io.BytesIO(data), content_type)
+        self._invalidate([key])
+        return key
+
+    def put_file(self, key: str, path: str, content_type: str) -> str:
+        """Переносит готовый временный файл в хранилище (файл удаляется)"""
+        self.backend.put_file(key, path, content_type)
+        self._invalidate([key])
+        return key
+
+    def download_bytes(self, key: str) -> bytes:
+        """
+        Скачивает объект целиком (большие - параллельно по частям).
+        Через дисковый кэш, если он включён: одновременные запросы
+        одного ключа ждут одного скачивания.
+        """
+        if self.disk_cache is None:
+            return self.backend.get(key)
+        data = self.disk_cache.get(key)
+        if data is not None:
+            return data
+
+        with self._downloads_lock:
+            future = self._downloads.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._downloads[key] = future
+        if not leader:
+            metrics.inc("storage_downloads_coalesced_total")
+            return future.result()
+
         try:
-            return self.client.generate_presigned_url(
-                "get_object",
-                Params={"Bucket": self.bucket, "Key": key},
-                ExpiresIn=expires_in,
-            )
-        except Exception:
-            return None
+            generation = self.disk_cache.generation(key)
+            data = self.backend.get(key)
+            self.disk_cache.put(key, data, generation)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(data)
+            return data
+        finally:
+            with self._downloads_lock:
+                self._downloads.pop(key, None)
+
+    def _invalidate(self, keys: Iterable[str]):
+        """Убирает ключи из кэшей ссылок и содержимого (объект изменён или удалён)"""
+        with self._urls_lock:
+            for key in keys:
+                self._urls.pop(key, None)
+        if self.disk_cache is not None:
+            for key in keys:
+                self.disk_cache.invalidate(key)
+
+    def get_presigned_url(self, key: str, expires_in: int = 3600) -> str | None:
+        return self.get_presigned_urls([key], expires_in)[key]
+
+    def get_presigned_urls(
+        self, keys: Iterable[str], expires_in: int = 3600
+    ) -> Dict[str, Optional[str]]:
+        """
+        Подписанные ссылки для набора ключей за один проход.
+
+        Ссылка переиспользуется, пока не прошла доля
+        PRESIGNED_URL_REUSE_FRACTION её срока жизни, так что клиенту
+        всегда остаётся не меньше остальной части срока. Подписываются
+        только ключи, которых нет в кэше; кэш ограничен по числу ссылок.
+        """
+        now = time.monotonic()
+        urls: Dict[str, Optional[str]] = {}
+        missing = []
+        with self._urls_lock:
+            for key in dict.fromkeys(keys):
+                entry = self._urls.get(key)
+                if entry is not None and entry[0] == expires_in and entry[2] > now:
+                    self._urls.move_to_end(key)
+                    urls[key] = entry[1]
+                else:
+                    missing.append(key)
+        metrics.inc("presigned_url_cache_hits_total", len(urls))
+        if not missing:
+            return urls
+
+        metrics.inc("presigned_url_cache_misses_total", len(missing))
+        reuse_until = now + expires_in * settings.PRESIGNED_URL_REUSE_FRACTION
+        signed = {}
+        for key in missing:
+            try:
+                signed[key] = self.backend.presigned_url(key, expires_in)
+            except Exception:
+                signed[key] = None
+        with self._urls_lock:
+            for key, url in signed.items():
+                if url is None:
+                    continue
+                self._urls[key] = (expires_in, url, reuse_until)
+                self._urls.move_to_end(key)
+            while len(self._urls) > settings.PRESIGNED_URL_CACHE_SIZE:
+                self._urls.popitem(last=False)
+        urls.update(signed)
+        return urls
 
     def delete_file(self, key: str) -> bool:
+        self._invalidate([key])
         try:
-            self.client.delete_object(Bucket=self.bucket, Key=key)
+            self.backend.delete(key)
             return True
-        except Exception:
+        except Exception as e:
+            logger.warning(f"Не удалось удалить {key}: {e}")
             return False
+
+    def delete_many(self, keys: Iterable[str]) -> List[str]:
+        """
+        Удаляет несколько объектов (в S3 - пачками по 1000 ключей
+        на запрос), возвращает ключи, которые удалить не удалось
+        """
+        keys = list(keys)
+        self._invalidate(keys)
+        try:
+            failed = self.backend.delete_many(keys)
+        except Exception as e:
+            logger.error(f"Не удалось удалить {len(keys)} объектов: {e}")
+            return keys
+        if failed:
+            logger.warning(f"Не удалось удалить {len(failed)} объектов: {failed[:10]}")
+        return failed
+
+    def list_objects(self, prefix: str = "") -> Iterator[ObjectInfo]:
+        return self.backend.list_objects(prefix)
+
+    def exists(self, key: str) -> bool:
+        return self.backend.exists(key)
+
+    def close(self):
+        self.backend.close()
+
+    # ---------- Асинхронные обёртки (не блокируют event loop) ----------
+
+    async def upload_bytes_async(
+        self,
+        data: bytes,
+        filename: str,
+        content_type: str,
+        folder: str = "uploads",
+        key: str = None,
+    ) -> str:
+        return await asyncio.to_thread(
+            self.upload_bytes, data, filename, content_type, folder=folder, key=key
+        )
+
+    async def put_bytes_async(self, key: str, data: bytes, content_type: str) -> str:
+        return await asyncio.to_thread(self.put_bytes, key, data, content_type)
+
+    async def put_file_async(self, key: str, path: str, content_type: str) -> str:
+        return await asyncio.to_thread(self.put_file, key, path, content_type)
+
+    async def download_bytes_async(self, key: str) -> bytes:
+        return await asyncio.to_thread(self.download_bytes, key)
+
+    async def delete_file_async(self, key: str) -> bool:
+        return await asyncio.to_thread(self.delete_file, key)
+
+    async def delete_many_async(self, keys: Iterable[str]) -> List[str]:
+        return await asyncio.to_thread(self.delete_many, list(keys))
+
+
+@lru_cache
+def get_storage() -> StorageService:
+    """Общий на процесс экземпляр хранилища (зависимость FastAPI)"""
+    return StorageService()
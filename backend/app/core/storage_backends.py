@@ -0,0 +1,385 @@
+# app/core/storage_backends.py
+import hashlib
+import hmac
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Iterable, Iterator, List, NamedTuple, Optional, Set
+from urllib.parse import quote, unquote, urlencode
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from app.core.config import settings
+
+
+class ObjectInfo(NamedTuple):
+    key: str
+    size: int
+    modified: float  # время изменения, unix timestamp
+
+
+# Наибольшее число ключей в одном запросе DeleteObjects
+S3_DELETE_BATCH = 1000
+
+
+class StorageBackend(ABC):
+    """Низкоуровневое хранилище объектов по ключу"""
+
+    name: str
+    # Каталог для временных файлов потоковой загрузки (см. put_file)
+    staging_dir: str = tempfile.gettempdir()
+
+    @abstractmethod
+    def put(self, key: str, fileobj: BinaryIO, content_type: str) -> None:
+        """Сохраняет объект, читая содержимое из fileobj"""
+
+    def put_file(self, key: str, path: str, content_type: str) -> None:
+        """
+        Сохраняет объект из временного файла и удаляет этот файл (бэкенд
+        может просто забрать его себе). Локальному бэкенду нужен файл
+        на том же разделе, что и хранилище, например в staging_dir
+        """
+        try:
+            with open(path, "rb") as f:
+                self.put(key, f, content_type)
+        finally:
+            _remove(path)
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        """Содержимое объекта; FileNotFoundError, если его нет"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Удаляет объект; отсутствие объекта ошибкой не считается"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def list_objects(self, prefix: str = "") -> Iterator[ObjectInfo]:
+        """Все объекты с ключом, начинающимся с prefix"""
+
+    def delete_many(self, keys: Iterable[str]) -> List[str]:
+        """Удаляет объекты, возвращает ключи, которые удалить не удалось"""
+        failed = []
+        for key in keys:
+            try:
+                self.delete(key)
+            except Exception:
+                failed.append(key)
+        return failed
+
+    @abstractmethod
+    def presigned_url(self, key: str, expires_in: int) -> str:
+        """Временная ссылка на скачивание объекта без авторизации"""
+
+    def close(self):
+        """Сбрасывает отложенные данные при остановке приложения"""
+
+
+class S3Backend(StorageBackend):
+    """
+    S3/MinIO. Клиент boto3 потокобезопасен и держит пул соединений;
+    файлы больше порога передаются частями в несколько потоков.
+    """
+
+    name = "s3"
+
+    def __init__(self):
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=settings.S3_ENDPOINT,
+            aws_access_key_id=settings.S3_ACCESS_KEY,
+            aws_secret_access_key=settings.S3_SECRET_KEY,
+            region_name=settings.S3_REGION,
+            config=Config(
+                signature_version="s3v4",
+                max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+                connect_timeout=settings.S3_CONNECT_TIMEOUT,
+                read_timeout=settings.S3_READ_TIMEOUT,
+                retries={"max_attempts": settings.S3_MAX_ATTEMPTS, "mode": "standard"},
+                tcp_keepalive=True,
+            ),
+        )
+        self.bucket = settings.S3_BUCKET_NAME
+        self.transfer_config = TransferConfig(
+            multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=settings.S3_MAX_CONCURRENCY,
+        )
+
+    def put(self, key: str, fileobj: BinaryIO, content_type: str) -> None:
+        self.client.upload_fileobj(
+            fileobj,
+            self.bucket,
+            key,
+            ExtraArgs={"ContentType": content_type},
+            Config=self.transfer_config,
+        )
+
+    def put_file(self, key: str, path: str, content_type: str) -> None:
+        try:
+            self.client.upload_file(
+                path,
+                self.bucket,
+                key,
+                ExtraArgs={"ContentType": content_type},
+                Config=self.transfer_config,
+            )
+        finally:
+            _remove(path)
+
+    def get(self, key: str) -> bytes:
+        buffer = io.BytesIO()
+        try:
+            self.client.download_fileobj(
+                self.bucket, key, buffer, Config=self.transfer_config
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                raise FileNotFoundError(key) from e
+            raise
+        return buffer.getvalue()
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return False
+            raise
+
+    def list_objects(self, prefix: str = "") -> Iterator[ObjectInfo]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get("Contents", []):
+                yield ObjectInfo(
+                    item["Key"], item["Size"], item["LastModified"].timestamp()
+                )
+
+    def delete_many(self, keys: Iterable[str]) -> List[str]:
+        """Пакетное удаление: один запрос DeleteObjects на 1000 ключей"""
+        keys = list(keys)
+        failed = []
+        for start in range(0, len(keys), S3_DELETE_BATCH):
+            chunk = keys[start : start + S3_DELETE_BATCH]
+            response = self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in chunk], "Quiet": True},
+            )
+            failed.extend(error["Key"] for error in response.get("Errors", []))
+        return failed
+
+    def presigned_url(self, key: str, expires_in: int) -> str:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=expires_in,
+        )
+
+
+class LocalBackend(StorageBackend):
+    """
+    Локальный диск для офлайн-развёртываний без MinIO.
+
+    Объект лежит в root/ab/cd/<ключ>, где ab/cd - первые байты SHA-256
+    ключа, а ключ записан в имени файла с экранированными «/». Так
+    в одном каталоге не скапливаются сотни тысяч файлов, а ключ
+    восстанавливается по имени файла.
+
+    Запись атомарна: содержимое пишется во временный файл в том же
+    разделе и переименовывается. Режимы fsync: "always" - после каждой
+    записи, "batch" - пачками по fsync_batch файлов (последние записи
+    могут потеряться при сбое питания), "none" - на усмотрение ОС.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        fsync: Optional[str] = None,
+        fsync_batch: Optional[int] = None,
+    ):
+        self.root = os.path.abspath(root or settings.LOCAL_STORAGE_DIR)
+        self.fsync = fsync or settings.LOCAL_STORAGE_FSYNC
+        self.fsync_batch = max(fsync_batch or settings.LOCAL_STORAGE_FSYNC_BATCH, 1)
+        if self.fsync not in ("always", "batch", "none"):
+            raise ValueError(f"Неизвестный режим fsync: {self.fsync}")
+        self._tmp_dir = os.path.join(self.root, ".tmp")
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        # Временный файл в том же разделе переименовывается без копирования
+        self.staging_dir = self._tmp_dir
+        self._lock = threading.Lock()
+        self._unsynced: List[str] = []
+
+    # ---------- Раскладка по каталогам ----------
+
+    def path(self, key: str) -> str:
+        """Путь к файлу объекта на диске"""
+        if not key or key.startswith("/") or ".." in key.split("/"):
+            raise ValueError(f"Недопустимый ключ: {key}")
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        filename = quote(key, safe="")
+        if len(filename) > 255:
+            raise ValueError(f"Слишком длинный ключ: {key}")
+        return os.path.join(self.root, digest[:2], digest[2:4], filename)
+
+    # ---------- StorageBackend ----------
+
+    def put(self, key: str, fileobj: BinaryIO, content_type: str) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(fileobj, f, 1024 * 1024)
+                if self.fsync == "always":
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            _remove(tmp_path)
+            raise
+        self._after_write(path)
+
+    def put_file(self, key: str, path: str, content_type: str) -> None:
+        try:
+            target = self.path(key)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if self.fsync == "always":
+                _fsync_files([path])
+            os.replace(path, target)
+        except BaseException:
+            _remove(path)
+            raise
+        self._after_write(target)
+
+    def _after_write(self, path: str):
+        if self.fsync == "always":
+            _fsync_dir(os.path.dirname(path))
+        elif self.fsync == "batch":
+            self._schedule_fsync(path)
+
+    def get(self, key: str) -> bytes:
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def list_objects(self, prefix: str = "") -> Iterator[ObjectInfo]:
+        # Ключи раскиданы по каталогам по хэшу, поэтому обходятся все шарды
+        for shard in sorted(os.listdir(self.root)):
+            shard_path = os.path.join(self.root, shard)
+            # Служебные каталоги (.tmp, .uploads) - не объекты
+            if shard.startswith(".") or not os.path.isdir(shard_path):
+                continue
+            for sub in sorted(os.listdir(shard_path)):
+                with os.scandir(os.path.join(shard_path, sub)) as entries:
+                    for entry in entries:
+                        key = unquote(entry.name)
+                        if not key.startswith(prefix) or not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                        yield ObjectInfo(key, stat.st_size, stat.st_mtime)
+
+    def presigned_url(self, key: str, expires_in: int) -> str:
+        """Ссылка на GET /files/{key}, подписанная HMAC с временем истечения"""
+        expires = int(time.time()) + expires_in
+        query = urlencode({"expires": expires, "signature": self.sign(key, expires)})
+        return f"{settings.LOCAL_STORAGE_URL_PREFIX}/{quote(key)}?{query}"
+
+    def close(self):
+        self.flush()
+
+    # ---------- Подписанные ссылки ----------
+
+    @staticmethod
+    def sign(key: str, expires: int) -> str:
+        message = f"{key}:{expires}".encode("utf-8")
+        return hmac.new(
+            settings.SECRET_KEY.encode("utf-8"), message, hashlib.sha256
+        ).hexdigest()
+
+    def verify(self, key: str, expires: int, signature: str) -> bool:
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self.sign(key, expires), signature)
+
+    # ---------- fsync пачками ----------
+
+    def _schedule_fsync(self, path: str):
+        with self._lock:
+            self._unsynced.append(path)
+            if len(self._unsynced) < self.fsync_batch:
+                return
+            batch, self._unsynced = self._unsynced, []
+        _fsync_files(batch)
+
+    def flush(self):
+        """Сбрасывает на диск все файлы, записанные с момента прошлого fsync"""
+        with self._lock:
+            batch, self._unsynced = self._unsynced, []
+        _fsync_files(batch)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_files(paths: List[str]):
+    directories: Set[str] = set()
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            # Уже удалён
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        directories.add(os.path.dirname(path))
+    for directory in directories:
+        _fsync_dir(directory)
+
+
+def create_backend(name: Optional[str] = None) -> StorageBackend:
+    """Бэкенд хранилища по настройке STORAGE_BACKEND"""
+    name = name or settings.STORAGE_BACKEND
+    if name == "s3":
+        return S3Backend()
+    if name == "local":
+        return LocalBackend()
+    raise ValueError(f"Неизвестный бэкенд хранилища: {name}")
@@ -11,7 +11,14 @@ from app.api.endpoints import (
     seo,
     weather,
     files,
+    metrics,
+    uploads,
 )
+from app.services.analysis_jobs import analysis_jobs
+from app.services.resumable_uploads import resumable_uploads
+from app.services.usage import usage_tracker
+from app.core.cache import cache
+from app.core.storage import get_storage
 import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
@@ -61,7 +68,7 @@ app.add_middleware(
         "http://localhost:8000",
     ],
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
+    allow_methods=["GET", "HEAD", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
     allow_headers=["*"],
     expose_headers=["*"],
 )
@@ -81,9 +88,32 @@ app.include_router(analysis.router, prefix="/api/v1/analysis", tags=["analysis"]
 app.include_router(analytics.router, prefix="/api/v1/analytics", tags=["analytics"])
 app.include_router(weather.router, prefix="/api/v1/weather", tags=["weather"])
 app.include_router(files.router, prefix="/api/v1/files", tags=["files"])
+app.include_router(uploads.router, prefix="/api/v1/uploads", tags=["uploads"])
+app.include_router(metrics.router, prefix="/api/v1", tags=["metrics"])
 app.include_router(seo.router, tags=["seo"])
 
 
+@app.on_event("startup")
+async def start_background_workers():
+    """
+    Запускает воркеры фоновых задач анализа, сброс статистики нагрузки
+    и удаление брошенных докачиваемых загрузок
+    """
+    await analysis_jobs.start()
+    await usage_tracker.start()
+    await resumable_uploads.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await analysis_jobs.stop()
+    await usage_tracker.stop()
+    await resumable_uploads.stop()
+    cache.close()
+    # Локальное хранилище досбрасывает на диск отложенные fsync
+    get_storage().close()
+
+
 @app.get("/")
 async def root():
     return {"message": "Добро пожаловать в Smart Garden API!"}
@@ -16,6 +16,7 @@ async def auth_middleware(request: Request, call_next):
     - /api/v1/health, /api/v1/health/detailed, /api/v1/health/ready
     - /api/v1/auth/login, /api/v1/auth/register
     - /api/v1/analysis/demo
+    - /api/v1/files/{key} с подписью (ссылки локального хранилища)
     - OPTIONS запросы (CORS preflight)
     """
 
@@ -24,7 +25,7 @@ async def auth_middleware(request: Request, call_next):
         response = await call_next(request)
         response.headers["Access-Control-Allow-Origin"] = "*"
         response.headers["Access-Control-Allow-Methods"] = (
-            "GET, POST, PUT, DELETE, OPTIONS, PATCH"
+            "GET, HEAD, POST, PUT, DELETE, OPTIONS, PATCH"
         )
         response.headers["Access-Control-Allow-Headers"] = "Authorization, Content-Type"
         return response
@@ -67,6 +68,13 @@ async def auth_middleware(request: Request, call_next):
             print(f"DEBUG: Public path with prefix allowed: {request.url.path}")
             return await call_next(request)
 
+    # Подписанные ссылки на файлы локального хранилища (подпись проверяет эндпоинт)
+    if (
+        request.url.path.startswith("/api/v1/files/")
+        and "signature" in request.query_params
+    ):
+        return await call_next(request)
+
     # Для остальных путей проверяем JWT токен
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
@@ -5,10 +5,14 @@ from sqlalchemy import (
     Integer,
     String,
     Float,
+    Date,
     DateTime,
     Text,
     Boolean,
     ForeignKey,
+    Index,
+    inspect,
+    text,
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
@@ -85,10 +89,20 @@ class HarvestRecord(Base):
     harvest_date = Column(DateTime, default=datetime.utcnow)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    detector_version = Column(String(20), nullable=True)
+    revision = Column(Integer, nullable=True, default=1)  # растёт при повторном анализе
+    analyzed_at = Column(DateTime, nullable=True, default=datetime.utcnow)
+    # Для изображения сохранены уменьшенные копии (см. derivatives.py)
+    has_derivatives = Column(Boolean, nullable=True, default=False)
 
     # Связи
     user = relationship("User", back_populates="harvest_records")
 
+    __table_args__ = (
+        # История анализов пользователя: фильтр по user_id, сортировка по дате
+        Index("ix_harvest_records_user_harvest_date", "user_id", "harvest_date"),
+    )
+
 
 class RefreshToken(Base):
     """Модель refresh токенов"""
@@ -108,12 +122,124 @@ class RefreshToken(Base):
     user = relationship("User", back_populates="refresh_tokens")
 
 
+class StoredObject(Base):
+    """Модель объекта в хранилище, адресуемого по хэшу содержимого"""
+
+    __tablename__ = "stored_objects"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), unique=True, index=True, nullable=False)
+    key = Column(String(500), unique=True, nullable=False)
+    size = Column(Integer, nullable=False)
+    content_type = Column(String(100), nullable=True)
+    ref_count = Column(Integer, default=0, nullable=False)
+    # pending - файл ещё загружается, ready - загружен; NULL - запись
+    # создана до появления статуса (файл загружен)
+    upload_status = Column(String(20), nullable=True)
+    detections = Column(Text, nullable=True)  # JSON: результаты детекции по типу плода
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class AnalysisJob(Base):
+    """Модель фоновой задачи анализа фотографии"""
+
+    __tablename__ = "analysis_jobs"
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    status = Column(String(20), default="queued", nullable=False, index=True)
+    stage = Column(String(20), default="queued", nullable=False)
+    progress = Column(Integer, default=0, nullable=False)  # 0-100
+    tree_id = Column(Integer, nullable=True)
+    garden_id = Column(Integer, nullable=True)
+    fruit_type = Column(String(50), nullable=False, default="apple")
+    filename = Column(String(255), nullable=True)
+    content_type = Column(String(100), nullable=True)
+    input_path = Column(String(500), nullable=True)  # файл во временном хранилище
+    record_id = Column(Integer, nullable=True)
+    result = Column(Text, nullable=True)  # JSON с результатом анализа
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class BackfillCheckpoint(Base):
+    """Прогресс пересчёта записей урожая новой версией детектора"""
+
+    __tablename__ = "backfill_checkpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), unique=True, index=True, nullable=False)
+    detector_version = Column(String(20), nullable=False)
+    status = Column(String(20), default="running", nullable=False)  # running, done, failed
+    last_record_id = Column(Integer, default=0, nullable=False)
+    processed = Column(Integer, default=0, nullable=False)
+    updated = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    retry_ids = Column(Text, nullable=True)  # JSON: id записей с ошибкой детекции
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class DetectionUsage(Base):
+    """Суточная сводка нагрузки на детектор по пользователю и саду"""
+
+    __tablename__ = "detection_usage"
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    garden_id = Column(Integer, nullable=True)  # 0 - без сада (NO_GARDEN)
+    detections = Column(Integer, default=0, nullable=False)
+    cpu_seconds = Column(Float, default=0.0, nullable=False)
+    megapixels = Column(Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_detection_usage_day_user_garden", "day", "user_id", "garden_id", unique=True),
+    )
+
+
 # Настройка подключения к БД
 DATABASE_URL = "sqlite:///./smart_garden.db"
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 
+
+
+def upgrade_schema(bind):
+    """
+    Доводит уже существующую базу до текущих моделей.
+    create_all() создаёт только новые таблицы, поэтому колонки и индексы,
+    добавленные к старым таблицам, создаём отдельно. Новые колонки
+    должны допускать NULL - старые строки получат NULL.
+    """
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                column_type = column.type.compile(dialect=bind.dialect)
+                with bind.begin() as conn:
+                    conn.execute(
+                        text(
+                            f"ALTER TABLE {table.name} "
+                            f"ADD COLUMN {column.name} {column_type}"
+                        )
+                    )
+
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=bind)
+
+
 # Создаем таблицы (ВАЖНО: теперь включает refresh_tokens)
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
 
 # Создаем сессию для работы с БД
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
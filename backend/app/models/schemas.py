@@ -173,11 +173,38 @@ class AnalysisResult(BaseModel):
     method: str = Field(..., description="Метод анализа")
     model: Optional[str] = Field(None, description="Используемая модель ИИ")
     image_url: Optional[str] = Field(None, description="URL изображения")
+    thumbnail_url: Optional[str] = Field(None, description="URL миниатюры (WebP)")
+    preview_url: Optional[str] = Field(None, description="URL копии для просмотра (WebP)")
 
     class Config:
         from_attributes = True
 
 
+class ReanalysisResult(AnalysisResult):
+    revision: int = Field(..., description="Номер ревизии записи после повторного анализа")
+    detector_version: Optional[str] = Field(None, description="Версия детектора")
+
+
+# Схемы для фоновых задач анализа
+class AnalysisJobAccepted(BaseModel):
+    job_id: str = Field(..., description="ID задачи")
+    status: str = Field(..., description="Статус задачи")
+    status_url: str = Field(..., description="URL для опроса статуса")
+    events_url: str = Field(..., description="URL потока событий (SSE)")
+
+
+class AnalysisJobStatus(BaseModel):
+    job_id: str
+    status: str = Field(..., description="queued, running, done, failed")
+    stage: str = Field(..., description="Текущая стадия обработки")
+    progress: int = Field(..., ge=0, le=100, description="Прогресс в процентах")
+    record_id: Optional[int] = None
+    result: Optional[AnalysisResult] = None
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+
+
 # Схема для загрузки файла
 class ImageUpload(BaseModel):
     tree_id: Optional[int] = Field(None, description="ID дерева")
@@ -209,6 +236,7 @@ class HarvestRecordResponse(BaseModel):
     confidence: Optional[float]
     processing_time: Optional[float]
     image_url: Optional[str]
+    thumbnail_url: Optional[str] = None
     created_at: Optional[str]
 
 
@@ -0,0 +1,148 @@
+# app/repositories/object_repository.py
+import json
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.database import StoredObject
+
+UPLOAD_PENDING = "pending"
+UPLOAD_READY = "ready"
+
+
+class StoredObjectRepository:
+    """
+    Репозиторий индекса объектов хранилища, адресуемых по хэшу содержимого.
+    Ведёт счётчик ссылок, чтобы удаление записи не удаляло общий файл.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_by_hash(self, content_hash: str) -> Optional[StoredObject]:
+        return (
+            self.db.query(StoredObject)
+            .filter(StoredObject.content_hash == content_hash)
+            .first()
+        )
+
+    def get_by_key(self, key: str) -> Optional[StoredObject]:
+        return self.db.query(StoredObject).filter(StoredObject.key == key).first()
+
+    def get_cached_detection(
+        self, obj: StoredObject, cache_key: str
+    ) -> Optional[Dict[str, Any]]:
+        """Сохранённый результат детекции для данного типа плода и версии"""
+        if not obj.detections:
+            return None
+        return json.loads(obj.detections).get(cache_key)
+
+    def acquire(
+        self,
+        content_hash: str,
+        key: str,
+        size: int,
+        content_type: Optional[str] = None,
+    ) -> Tuple[StoredObject, bool]:
+        """
+        Добавляет ссылку на объект, создавая запись индекса при первой
+        загрузке. Возвращает запись и признак того, что она уже была
+        (файл лежит под obj.key, а не под переданным key).
+
+        Новая запись создаётся со статусом UPLOAD_PENDING: после загрузки
+        файла вызывающий отмечает её mark_ready().
+
+        Счётчик меняется одним UPDATE, без чтения в Python, поэтому
+        параллельные запросы и воркеры не теряют ссылки.
+        """
+        if self._increment(content_hash):
+            existed = True
+        else:
+            existed = False
+            # Точка сохранения: при гонке откатывается только вставка,
+            # а не вся работа сессии (в /batch она общая для задач)
+            savepoint = self.db.begin_nested()
+            try:
+                self.db.add(
+                    StoredObject(
+                        content_hash=content_hash,
+                        key=key,
+                        size=size,
+                        content_type=content_type,
+                        ref_count=1,
+                        upload_status=UPLOAD_PENDING,
+                    )
+                )
+                self.db.flush()
+                savepoint.commit()
+            except IntegrityError:
+                # Тот же файл параллельно загрузил другой запрос
+                savepoint.rollback()
+                existed = self._increment(content_hash)
+                if not existed:
+                    raise
+        self.db.commit()
+        # populate_existing: запись в сессии могла остаться со старым счётчиком
+        obj = (
+            self._objects(StoredObject.content_hash == content_hash)
+            .populate_existing()
+            .one()
+        )
+        return obj, existed
+
+    def mark_ready(self, content_hash: str):
+        """Файл объекта загружен в хранилище"""
+        self._objects(StoredObject.content_hash == content_hash).update(
+            {StoredObject.upload_status: UPLOAD_READY}, synchronize_session=False
+        )
+        self.db.commit()
+
+    @staticmethod
+    def is_ready(obj: StoredObject) -> bool:
+        return obj.upload_status in (None, UPLOAD_READY)
+
+    def remember_detection(
+        self, content_hash: str, cache_key: str, detection: Dict[str, Any]
+    ):
+        """Сохраняет результат детекции для повторных загрузок того же изображения"""
+        obj = self.get_by_hash(content_hash)
+        if obj is None:
+            return
+        detections = json.loads(obj.detections) if obj.detections else {}
+        detections[cache_key] = detection
+        obj.detections = json.dumps(detections, ensure_ascii=False)
+        self.db.commit()
+
+    def release(self, key: str) -> bool:
+        """
+        Убирает одну ссылку на объект.
+        Возвращает True, если ссылок не осталось и файл можно удалить.
+        """
+        found = self._objects(StoredObject.key == key).update(
+            {StoredObject.ref_count: StoredObject.ref_count - 1},
+            synchronize_session=False,
+        )
+        if not found:
+            self.db.commit()
+            # Объект загружен до появления индекса - ключ уникален для записи
+            return True
+
+        # Счётчик перечитывается в том же DELETE и той же транзакции:
+        # ссылка, взятая другим запросом, не даст удалить запись
+        deleted = self._objects(
+            StoredObject.key == key, StoredObject.ref_count <= 0
+        ).delete(synchronize_session=False)
+        self.db.commit()
+        return bool(deleted)
+
+    def _objects(self, *criteria):
+        return self.db.query(StoredObject).filter(*criteria)
+
+    def _increment(self, content_hash: str) -> bool:
+        """Атомарно увеличивает счётчик ссылок; False - записи нет"""
+        updated = self._objects(StoredObject.content_hash == content_hash).update(
+            {StoredObject.ref_count: StoredObject.ref_count + 1},
+            synchronize_session=False,
+        )
+        return bool(updated)
@@ -1,6 +1,17 @@
+import asyncio
 import logging
-from typing import Dict, Any
-from .improved_detector import improved_detector
+import threading
+import time
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.priority_executor import PriorityExecutor
+from .derivatives import render_derivatives
+from .improved_detector import DetectionCancelled, improved_detector
+from .usage import parse_megapixels, usage_tracker
 
 logger = logging.getLogger(__name__)
 
@@ -8,26 +19,86 @@ logger = logging.getLogger(__name__)
 class FruitDetectionService:
     """Сервис детекции фруктов"""
 
+    version = "3.0"
+
     def __init__(self):
         self.detector = improved_detector
+        # Детекция упирается в CPU (OpenCV отпускает GIL), поэтому выносим
+        # её из event loop в отдельный пул потоков. Интерактивные запросы
+        # получают большую долю пула, чем фоновые (пакеты, пересчёт)
+        self.executor = PriorityExecutor(
+            max_workers=settings.DETECTION_WORKERS,
+            weights=settings.DETECTION_PRIORITY_WEIGHTS,
+            max_queue_age=settings.DETECTION_MAX_QUEUE_AGE,
+            default_class="interactive",
+            thread_name_prefix="detector",
+        )
         logger.info("Инициализация FruitDetectionService с улучшенным детектором")
 
     def process_image(
-        self, image_bytes: bytes, expected_fruit: str = "apple"
+        self,
+        image_bytes: bytes,
+        expected_fruit: str = "apple",
+        cancel: Optional[threading.Event] = None,
     ) -> Dict[str, Any]:
         """
         Обрабатывает изображение
         """
+        return self._run(self.detector.detect, image_bytes, expected_fruit, cancel)
+
+    def process_frame(
+        self,
+        frame: np.ndarray,
+        expected_fruit: str = "apple",
+        cancel: Optional[threading.Event] = None,
+    ) -> Dict[str, Any]:
+        """
+        Обрабатывает уже декодированный RGB-кадр (без повторного декодирования)
+        """
+        return self._run(self.detector.detect_array, frame, expected_fruit, cancel)
+
+    def process_image_with_derivatives(
+        self,
+        image_bytes: bytes,
+        expected_fruit: str = "apple",
+        cancel: Optional[threading.Event] = None,
+    ) -> Dict[str, Any]:
+        """
+        Детекция и уменьшенные копии изображения из одного декодированного
+        кадра. Копии возвращаются в result["derivatives"] (имя -> WebP)
+        """
+        try:
+            frame = self.decode_image(image_bytes)
+        except Exception:
+            # Ошибку декодирования оформит обычный путь детекции
+            return self.process_image(image_bytes, expected_fruit, cancel=cancel)
+
+        result = self.process_frame(frame, expected_fruit, cancel=cancel)
+        if cancel is not None and cancel.is_set():
+            raise DetectionCancelled()
+        try:
+            result["derivatives"] = render_derivatives(frame)
+        except Exception as e:
+            logger.error(f"Не удалось построить уменьшенные копии: {e}")
+        return result
+
+    def decode_image(self, image_bytes: bytes) -> np.ndarray:
+        """Декодирует изображение в RGB-кадр для process_frame"""
+        return self.detector.decode(image_bytes)
+
+    def _run(
+        self, detect, image, expected_fruit: str, cancel: Optional[threading.Event]
+    ) -> Dict[str, Any]:
         try:
             # Для стабильности - нормализуем тип фрукта
             if expected_fruit not in ["apple", "pear", "cherry", "plum"]:
                 expected_fruit = "apple"
 
-            result = self.detector.detect(image_bytes, expected_fruit)
+            result = detect(image, expected_fruit, cancel=cancel)
 
             # Добавляем метаданные
             result["model"] = "improved_stable_detector"
-            result["version"] = "3.0"
+            result["version"] = self.version
             result["success"] = True
             result["fruit_type"] = expected_fruit
 
@@ -37,6 +108,8 @@ class FruitDetectionService:
 
             return result
 
+        except DetectionCancelled:
+            raise
         except Exception as e:
             logger.error(f"Ошибка обработки изображения: {e}")
 
@@ -52,6 +125,87 @@ class FruitDetectionService:
                 "recommendations": "Произошла ошибка при обработке изображения.",
             }
 
+    async def process_image_async(
+        self,
+        image_bytes: bytes,
+        expected_fruit: str = "apple",
+        priority: str = "interactive",
+        derivatives: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Обрабатывает изображение в пуле детектора, не блокируя event loop.
+        С derivatives=True в том же задании строятся уменьшенные копии
+        """
+        process = (
+            self.process_image_with_derivatives if derivatives else self.process_image
+        )
+        return await self._submit(process, image_bytes, expected_fruit, priority)
+
+    async def process_frame_async(
+        self,
+        frame: np.ndarray,
+        expected_fruit: str = "apple",
+        priority: str = "interactive",
+    ) -> Dict[str, Any]:
+        """Обрабатывает декодированный кадр в пуле детектора"""
+        return await self._submit(self.process_frame, frame, expected_fruit, priority)
+
+    async def _submit(
+        self, process, image, expected_fruit: str, priority: str
+    ) -> Dict[str, Any]:
+        """
+        Запускает детекцию в пуле. Если ожидающую корутину отменили,
+        задача снимается из очереди пула, а уже начатая детекция
+        прерывается на ближайшем этапе.
+        """
+        loop = asyncio.get_running_loop()
+        cancel = threading.Event()
+        state = {}
+
+        def task():
+            if cancel.is_set():
+                raise DetectionCancelled()
+            state["started"] = time.perf_counter()
+            cpu_started = time.thread_time()
+            result = process(image, expected_fruit, cancel=cancel)
+            state["cpu_seconds"] = time.thread_time() - cpu_started
+            return result
+
+        try:
+            result = await asyncio.wrap_future(
+                self.executor.submit_to(priority, task), loop=loop
+            )
+        except asyncio.CancelledError:
+            cancel.set()
+            self._record_cancelled(state.get("started"))
+            raise
+
+        metrics.observe("detection_seconds", time.perf_counter() - state["started"])
+        # Нагрузка учитывается на пользователя/сад из контекста запроса
+        usage_tracker.record(
+            state["cpu_seconds"], parse_megapixels(result.get("image_size"))
+        )
+        return result
+
+    @staticmethod
+    def _record_cancelled(started: Optional[float]):
+        """Учитывает отменённую детекцию и оценку сэкономленного времени CPU"""
+        average = metrics.average("detection_seconds")
+        if started is None:
+            stage, saved = "queued", average
+        else:
+            stage = "running"
+            saved = max(average - (time.perf_counter() - started), 0.0)
+        metrics.inc("detection_cancelled_total", labels={"stage": stage})
+        metrics.inc("detection_cpu_seconds_saved_total", saved)
+
+    async def decode_image_async(self, image_bytes: bytes) -> np.ndarray:
+        """Декодирует изображение в пуле детектора"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.decode_image, image_bytes
+        )
+
 
 # Глобальный экземпляр
 ai_service = FruitDetectionService()
@@ -0,0 +1,390 @@
+# app/services/analysis_jobs.py
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.storage import StorageService, get_storage
+from app.models.database import AnalysisJob, HarvestRecord, SessionLocal
+from app.services.analysis_service import (
+    build_analysis_result,
+    detect_and_store,
+    image_urls,
+    release_image,
+)
+from app.services.usage import usage_tracker
+
+logger = logging.getLogger(__name__)
+
+# Стадии задачи и соответствующий прогресс в процентах
+STAGE_PROGRESS = {
+    "queued": 0,
+    "detecting": 10,
+    "saving": 85,
+    "done": 100,
+}
+TERMINAL_STATUSES = ("done", "failed")
+
+
+class AnalysisJobQueue:
+    """
+    Очередь фоновых задач анализа фотографий.
+
+    Состояние задач хранится в таблице analysis_jobs, а загруженные файлы -
+    во временном каталоге на диске, поэтому незавершённые задачи
+    подхватываются заново после перезапуска сервера.
+
+    Задачу забирает тот воркер (в любом процессе), чей атомарный UPDATE
+    queued -> running прошёл первым. Пока задача выполняется, updated_at
+    продлевается; running-задача без продления дольше
+    ANALYSIS_JOB_LEASE_TIMEOUT считается брошенной (процесс упал)
+    и возвращается в очередь.
+    """
+
+    def __init__(self, session_factory=SessionLocal, storage_factory=get_storage):
+        self.session_factory = session_factory
+        self.storage_factory = storage_factory
+        self.spool_dir = settings.ANALYSIS_JOB_SPOOL_DIR
+        self._queue: Optional[asyncio.Queue] = None
+        self._changed: Optional[asyncio.Condition] = None
+        self._workers: List[asyncio.Task] = []
+        self._reaper: Optional[asyncio.Task] = None
+
+    # ---------- Жизненный цикл ----------
+
+    async def start(self, workers: int = settings.ANALYSIS_JOB_WORKERS):
+        """Запускает воркеры и возвращает в очередь незавершённые задачи"""
+        if self._workers:
+            return
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._queue = asyncio.Queue()
+        self._changed = asyncio.Condition()
+
+        for job_id in self._recover():
+            self._queue.put_nowait(job_id)
+
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(max(workers, 1))
+        ]
+        self._reaper = asyncio.create_task(self._reap_loop())
+        logger.info(f"Запущено воркеров анализа: {len(self._workers)}")
+
+    async def stop(self):
+        """Останавливает воркеры (задачи останутся в БД до следующего запуска)"""
+        tasks = self._workers + ([self._reaper] if self._reaper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._reaper = None
+        self._queue = None
+        self._changed = None
+
+    def _recover(self, queued_min_age: float = 0.0) -> List[str]:
+        """
+        Возвращает id задач для очереди этого процесса: ждущих дольше
+        queued_min_age и брошенных running-задач (аренда истекла),
+        которые сбрасываются в queued. Задачу, попавшую в очереди
+        нескольких процессов, всё равно выполнит только один (_claim).
+        """
+        db = self.session_factory()
+        now = datetime.utcnow()
+        try:
+            stale = (
+                db.query(AnalysisJob)
+                .filter(
+                    AnalysisJob.status == "running",
+                    AnalysisJob.updated_at
+                    < now - timedelta(seconds=settings.ANALYSIS_JOB_LEASE_TIMEOUT),
+                )
+                .update(
+                    {
+                        AnalysisJob.status: "queued",
+                        AnalysisJob.stage: "queued",
+                        AnalysisJob.progress: STAGE_PROGRESS["queued"],
+                        AnalysisJob.updated_at: now,
+                    },
+                    synchronize_session=False,
+                )
+            )
+            db.commit()
+            job_ids = [
+                job_id
+                for (job_id,) in db.query(AnalysisJob.id)
+                .filter(
+                    AnalysisJob.status == "queued",
+                    AnalysisJob.updated_at <= now - timedelta(seconds=queued_min_age),
+                )
+                .order_by(AnalysisJob.created_at)
+            ]
+            if stale:
+                logger.info(f"Перезапущено брошенных задач анализа: {stale}")
+            return job_ids
+        except Exception as e:
+            logger.error(f"Не удалось восстановить задачи анализа: {e}")
+            db.rollback()
+            return []
+        finally:
+            db.close()
+
+    async def _reap_loop(self):
+        """Периодически подбирает задачи упавших процессов"""
+        while True:
+            await asyncio.sleep(settings.ANALYSIS_JOB_LEASE_TIMEOUT)
+            job_ids = await asyncio.to_thread(
+                self._recover, settings.ANALYSIS_JOB_LEASE_TIMEOUT
+            )
+            for job_id in job_ids:
+                self._queue.put_nowait(job_id)
+
+    # ---------- Постановка задач ----------
+
+    def submit(
+        self,
+        db,
+        user_id: int,
+        contents: bytes,
+        filename: str,
+        content_type: str,
+        fruit_type: str = "apple",
+        tree_id: Optional[int] = None,
+        garden_id: Optional[int] = None,
+    ) -> AnalysisJob:
+        """Сохраняет файл на диск, создаёт запись задачи и ставит её в очередь"""
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.spool_dir, exist_ok=True)
+        input_path = os.path.join(self.spool_dir, job_id)
+        with open(input_path, "wb") as f:
+            f.write(contents)
+
+        job = AnalysisJob(
+            id=job_id,
+            user_id=user_id,
+            status="queued",
+            stage="queued",
+            progress=STAGE_PROGRESS["queued"],
+            tree_id=tree_id,
+            garden_id=garden_id,
+            fruit_type=fruit_type,
+            filename=filename,
+            content_type=content_type,
+            input_path=input_path,
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+        return job
+
+    # ---------- Чтение состояния ----------
+
+    def get_snapshot(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Текущее состояние задачи в виде словаря для API"""
+        db = self.session_factory()
+        try:
+            job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+            return self.to_snapshot(job) if job else None
+        finally:
+            db.close()
+
+    @staticmethod
+    def to_snapshot(job: AnalysisJob) -> Dict[str, Any]:
+        return {
+            "job_id": job.id,
+            "user_id": job.user_id,
+            "status": job.status,
+            "stage": job.stage,
+            "progress": job.progress,
+            "record_id": job.record_id,
+            "result": json.loads(job.result) if job.result else None,
+            "error": job.error,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        }
+
+    async def watch(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Отдаёт состояние задачи при каждом изменении до её завершения"""
+        last = None
+        while True:
+            snapshot = self.get_snapshot(job_id)
+            if snapshot is None:
+                return
+            if snapshot != last:
+                yield snapshot
+                last = snapshot
+            if snapshot["status"] in TERMINAL_STATUSES:
+                return
+            await self._wait_for_change(settings.ANALYSIS_JOB_SSE_INTERVAL)
+
+    async def _wait_for_change(self, timeout: float):
+        # Задачу может обрабатывать другой процесс, поэтому помимо
+        # уведомления периодически перечитываем состояние из БД
+        if self._changed is None:
+            await asyncio.sleep(timeout)
+            return
+        try:
+            async with self._changed:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _notify(self):
+        if self._changed is not None:
+            async with self._changed:
+                self._changed.notify_all()
+
+    # ---------- Обработка ----------
+
+    async def _worker(self, index: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self.process(job_id)
+            except Exception as e:
+                logger.error(f"Воркер {index}: ошибка задачи {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _set_stage(self, db, job: AnalysisJob, stage: str, status: str = None):
+        job.stage = stage
+        job.progress = STAGE_PROGRESS.get(stage, job.progress)
+        if status:
+            job.status = status
+        db.commit()
+        await self._notify()
+
+    @staticmethod
+    def _claim(db, job_id: str) -> bool:
+        """Атомарно забирает задачу queued -> running; False - её забрал другой"""
+        claimed = (
+            db.query(AnalysisJob)
+            .filter(AnalysisJob.id == job_id, AnalysisJob.status == "queued")
+            .update(
+                {AnalysisJob.status: "running", AnalysisJob.updated_at: datetime.utcnow()},
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        return claimed == 1
+
+    def _touch(self, job_id: str):
+        """Продлевает аренду выполняемой задачи (отдельная сессия)"""
+        db = self.session_factory()
+        try:
+            db.query(AnalysisJob).filter(
+                AnalysisJob.id == job_id, AnalysisJob.status == "running"
+            ).update({AnalysisJob.updated_at: datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(settings.ANALYSIS_JOB_HEARTBEAT_INTERVAL)
+            try:
+                await asyncio.to_thread(self._touch, job_id)
+            except Exception as e:
+                logger.warning(f"Не удалось продлить аренду задачи {job_id}: {e}")
+
+    def _get_storage(self) -> StorageService:
+        return self.storage_factory()
+
+    async def process(self, job_id: str):
+        """Выполняет анализ: детекция и загрузка в S3 -> запись в БД"""
+        db = self.session_factory()
+        heartbeat = None
+        try:
+            if not self._claim(db, job_id):
+                return
+            job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+            heartbeat = asyncio.create_task(self._heartbeat(job_id))
+
+            storage = None
+            s3_key = None
+            try:
+                with open(job.input_path, "rb") as f:
+                    contents = f.read()
+
+                await self._set_stage(db, job, "detecting", status="running")
+                usage_tracker.attribute(job.user_id, job.garden_id)
+                storage = self._get_storage()
+                detection_result, processing_time, s3_key = await detect_and_store(
+                    db,
+                    storage,
+                    contents,
+                    job.filename,
+                    job.content_type,
+                    job.fruit_type,
+                    job.user_id,
+                    priority="bulk",
+                )
+
+                await self._set_stage(db, job, "saving")
+                harvest_record = HarvestRecord(
+                    tree_id=job.tree_id,
+                    garden_id=job.garden_id,
+                    fruit_count=detection_result.get("total_fruits", 0),
+                    fruit_type=job.fruit_type,
+                    image_path=s3_key,
+                    confidence_score=detection_result.get("confidence", 0.0),
+                    processing_time=processing_time,
+                    detector_version=detection_result.get("version"),
+                    has_derivatives=bool(detection_result.get("derivatives")),
+                    user_id=job.user_id,
+                )
+                db.add(harvest_record)
+                db.flush()
+
+                result = build_analysis_result(
+                    detection_result,
+                    job.fruit_type,
+                    processing_time,
+                    record_id=harvest_record.id,
+                    **image_urls(storage, s3_key, harvest_record.has_derivatives),
+                )
+                job.record_id = harvest_record.id
+                job.result = result.json()
+                await self._set_stage(db, job, "done", status="done")
+
+            except Exception as e:
+                logger.error(f"Ошибка задачи анализа {job_id}: {e}")
+                db.rollback()
+                if s3_key:
+                    # Ссылка на изображение уже взята - без записи она не снимется
+                    try:
+                        await release_image(db, storage, s3_key)
+                    except Exception as release_error:
+                        db.rollback()
+                        logger.warning(
+                            f"Не удалось снять ссылку на {s3_key}: {release_error}"
+                        )
+                job.status = "failed"
+                job.error = str(e)
+                db.commit()
+                await self._notify()
+
+            # "failed" - конечный статус, повторно задача не запускается,
+            # поэтому входной файл не нужен ни после успеха, ни после ошибки
+            self._remove_input(job.input_path)
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+            db.close()
+
+    @staticmethod
+    def _remove_input(path: Optional[str]):
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Не удалось удалить временный файл {path}: {e}")
+
+
+# Глобальный экземпляр
+analysis_jobs = AnalysisJobQueue()
@@ -0,0 +1,383 @@
+# app/services/analysis_service.py
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.storage import StorageService, content_addressed_key
+from app.models.schemas import AnalysisResult
+from app.repositories.object_repository import StoredObjectRepository
+from app.models.database import HarvestRecord
+from app.services.ai_service import ai_service
+from app.services.derivatives import (
+    DERIVATIVE_CONTENT_TYPE,
+    derivative_key,
+    derivative_keys,
+)
+from app.services.frame_cache import frame_cache
+
+logger = logging.getLogger(__name__)
+
+metrics.register_ratio("dedup_ratio", "dedup_hits_total", "dedup_lookups_total")
+
+
+def analysis_folder(user_id: int) -> str:
+    """Каталог в хранилище для фотографий анализов пользователя"""
+    return f"users/{user_id}/analysis"
+
+
+async def timed_detection(
+    contents: bytes,
+    fruit_type: str,
+    priority: str = "interactive",
+    derivatives: bool = False,
+) -> Tuple[Dict[str, Any], float]:
+    """Детекция в пуле детектора с замером времени"""
+    start_time = time.perf_counter()
+    result = await ai_service.process_image_async(
+        contents, fruit_type, priority, derivatives=derivatives
+    )
+    return result, time.perf_counter() - start_time
+
+
+async def store_derivatives(
+    storage: StorageService, key: str, detection_result: Dict[str, Any]
+) -> List[str]:
+    """
+    Сохраняет уменьшенные копии, построенные при детекции, рядом
+    с оригиналом. В результате детекции байты заменяются списком
+    имён сохранённых копий.
+    """
+    rendered = detection_result.pop("derivatives", None) or {}
+    names = list(rendered)
+    outcomes = await asyncio.gather(
+        *(
+            storage.put_bytes_async(
+                derivative_key(key, name), rendered[name], DERIVATIVE_CONTENT_TYPE
+            )
+            for name in names
+        ),
+        return_exceptions=True,
+    )
+    stored = []
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"Не удалось сохранить копию {name} для {key}: {outcome}")
+        else:
+            stored.append(name)
+    if stored:
+        detection_result["derivatives"] = stored
+    return stored
+
+
+def image_urls(
+    storage: StorageService, key: Optional[str], has_derivatives: bool = False
+) -> Dict[str, Optional[str]]:
+    """Подписанные ссылки на оригинал и его уменьшенные копии"""
+    if not key:
+        return {"image_url": None, "thumbnail_url": None, "preview_url": None}
+    return {
+        "image_url": storage.get_presigned_url(key, expires_in=3600),
+        "thumbnail_url": (
+            storage.get_presigned_url(derivative_key(key, "thumb"), expires_in=3600)
+            if has_derivatives
+            else None
+        ),
+        "preview_url": (
+            storage.get_presigned_url(derivative_key(key, "preview"), expires_in=3600)
+            if has_derivatives
+            else None
+        ),
+    }
+
+
+async def detect_and_upload(
+    storage: StorageService,
+    contents: bytes,
+    filename: str,
+    content_type: str,
+    fruit_type: str,
+    user_id: int,
+    key: Optional[str] = None,
+    priority: str = "interactive",
+) -> Tuple[Dict[str, Any], float, str]:
+    """
+    Запускает детекцию и загрузку файла в хранилище параллельно.
+
+    Детекция выполняется в пуле детектора, загрузка через boto3 - в пуле
+    потоков, так что общее время близко к max(детекция, загрузка).
+    Уменьшенные копии строятся в том же задании детектора и сохраняются
+    после загрузки оригинала.
+    Возвращает (результат детекции, время детекции, ключ в хранилище).
+    """
+    (detection_result, processing_time), key = await asyncio.gather(
+        timed_detection(
+            contents, fruit_type, priority, derivatives=settings.DERIVATIVES_ENABLED
+        ),
+        storage.upload_bytes_async(
+            contents,
+            filename,
+            content_type,
+            folder=analysis_folder(user_id),
+            key=key,
+        ),
+    )
+    await store_derivatives(storage, key, detection_result)
+    return detection_result, processing_time, key
+
+
+async def detect_and_store(
+    db: Session,
+    storage: StorageService,
+    contents: bytes,
+    filename: str,
+    content_type: str,
+    fruit_type: str,
+    user_id: int,
+    content_hash: Optional[str] = None,
+    priority: str = "interactive",
+) -> Tuple[Dict[str, Any], float, str]:
+    """
+    Детекция и сохранение изображения с дедупликацией по хэшу содержимого.
+
+    Если такие же байты уже лежат в хранилище, повторная загрузка
+    пропускается, а при DEDUP_REUSE_DETECTION переиспользуется и прошлый
+    результат детекции для того же типа плода и версии детектора.
+    Каждый вызов добавляет ссылку на объект - её нужно снять через
+    release_image() при удалении записи. Ссылка берётся до детекции и
+    загрузки, чтобы удаление последней записи с тем же изображением
+    не удалило файл, на который будет ссылаться новая; при ошибке
+    ссылка снимается. Если объект ещё не отмечен загруженным (первая
+    загрузка идёт или упала), наличие файла проверяется и при
+    необходимости он загружается заново.
+    priority - класс приоритета в пуле детектора ("interactive" или "bulk").
+    """
+    if not settings.DEDUP_ENABLED:
+        return await detect_and_upload(
+            storage,
+            contents,
+            filename,
+            content_type,
+            fruit_type,
+            user_id,
+            priority=priority,
+        )
+
+    content_hash = content_hash or hashlib.sha256(contents).hexdigest()
+    cache_key = f"{fruit_type}:{ai_service.version}"
+    objects = StoredObjectRepository(db)
+
+    metrics.inc("dedup_lookups_total")
+    obj, existed = objects.acquire(
+        content_hash,
+        content_addressed_key(content_hash, filename),
+        len(contents),
+        content_type,
+    )
+    key = obj.key
+    cached = None
+    try:
+        if existed:
+            metrics.inc("dedup_hits_total")
+            if objects.is_ready(obj) or await asyncio.to_thread(storage.exists, key):
+                metrics.inc("dedup_bytes_saved_total", len(contents))
+            else:
+                metrics.inc("dedup_reuploads_total")
+                await storage.put_bytes_async(key, contents, content_type)
+                objects.mark_ready(content_hash)
+            if settings.DEDUP_REUSE_DETECTION:
+                cached = objects.get_cached_detection(obj, cache_key)
+            if cached:
+                metrics.inc("dedup_detections_reused_total")
+                detection_result = cached["result"]
+                processing_time = cached["processing_time"]
+            else:
+                # Копии перестраиваются: объект мог быть загружен до их появления
+                detection_result, processing_time = await timed_detection(
+                    contents,
+                    fruit_type,
+                    priority,
+                    derivatives=settings.DERIVATIVES_ENABLED,
+                )
+                await store_derivatives(storage, key, detection_result)
+        else:
+            detection_result, processing_time, key = await detect_and_upload(
+                storage,
+                contents,
+                filename,
+                content_type,
+                fruit_type,
+                user_id,
+                key=key,
+                priority=priority,
+            )
+            objects.mark_ready(content_hash)
+    except BaseException:
+        await release_image(db, storage, key)
+        raise
+
+    # Запоминаем результат для повторных загрузок того же изображения
+    if not cached and detection_result.get("success", False):
+        objects.remember_detection(
+            content_hash,
+            cache_key,
+            {"result": detection_result, "processing_time": processing_time},
+        )
+    return detection_result, processing_time, key
+
+
+async def release_image(db: Session, storage: StorageService, key: str) -> bool:
+    """
+    Снимает ссылку записи на изображение и удаляет файл, если ссылок
+    не осталось. Возвращает True, если файл удалён.
+    """
+    if StoredObjectRepository(db).release(key):
+        frame_cache.invalidate(key)
+        deleted, _ = await asyncio.gather(
+            storage.delete_file_async(key),
+            storage.delete_many_async(derivative_keys(key)),
+        )
+        return deleted
+    return False
+
+
+async def load_frame(storage: StorageService, key: str):
+    """
+    Декодированный кадр изображения из хранилища.
+    Повторные обращения к тому же ключу обходятся без скачивания и декодирования.
+    """
+    frame = frame_cache.get(key)
+    if frame is None:
+        contents = await storage.download_bytes_async(key)
+        frame = await ai_service.decode_image_async(contents)
+        frame_cache.put(key, frame)
+    return frame
+
+
+async def reanalyze_record(
+    db: Session,
+    storage: StorageService,
+    record: HarvestRecord,
+    fruit_type: str,
+) -> Tuple[Dict[str, Any], float]:
+    """
+    Повторная детекция по уже сохранённому изображению записи.
+    Запись обновляется на месте, номер ревизии увеличивается.
+    """
+    frame = await load_frame(storage, record.image_path)
+
+    start_time = time.perf_counter()
+    detection_result = await ai_service.process_frame_async(frame, fruit_type)
+    processing_time = time.perf_counter() - start_time
+
+    record.fruit_type = fruit_type
+    record.fruit_count = detection_result.get("total_fruits", 0)
+    record.confidence_score = detection_result.get("confidence", 0.0)
+    record.processing_time = processing_time
+    record.detector_version = detection_result.get("version")
+    record.revision = (record.revision or 1) + 1
+    record.analyzed_at = datetime.utcnow()
+    db.commit()
+    db.refresh(record)
+    return detection_result, processing_time
+
+
+def build_detected_list(
+    detection_result: Dict[str, Any], fruit_type: str
+) -> List[Dict[str, Any]]:
+    """Приводит результат детектора к списку DetectedFruit"""
+    detected_list = []
+    if "detected_fruits" in detection_result:
+        if isinstance(detection_result["detected_fruits"], list):
+            detected_list = detection_result["detected_fruits"]
+        elif isinstance(detection_result["detected_fruits"], dict):
+            for ft, fruit_data in detection_result["detected_fruits"].items():
+                if isinstance(fruit_data, dict):
+                    detected_list.append(
+                        {
+                            "fruit_type": ft,
+                            "count": fruit_data.get("count", 0),
+                            "confidence": fruit_data.get(
+                                "confidence",
+                                fruit_data.get(
+                                    "avg_confidence",
+                                    detection_result.get("confidence", 0.0),
+                                ),
+                            ),
+                            "boxes": fruit_data.get("boxes", []),
+                        }
+                    )
+
+    # Если detected_list пуст, создаем базовую запись
+    if not detected_list and detection_result.get("total_fruits", 0) > 0:
+        detected_list = [
+            {
+                "fruit_type": fruit_type,
+                "count": detection_result.get("total_fruits", 0),
+                "confidence": detection_result.get("confidence", 0.0),
+                "boxes": [],
+            }
+        ]
+
+    # Убедимся что confidence есть во всех элементах
+    for item in detected_list:
+        if "confidence" not in item:
+            item["confidence"] = detection_result.get("confidence", 0.0)
+
+    return detected_list
+
+
+def build_analysis_result(
+    detection_result: Dict[str, Any],
+    fruit_type: str,
+    processing_time: float,
+    record_id: Optional[int] = None,
+    image_url: Optional[str] = None,
+    thumbnail_url: Optional[str] = None,
+    preview_url: Optional[str] = None,
+) -> AnalysisResult:
+    """Формирует ответ API по результату детекции"""
+    return AnalysisResult(
+        fruit_count=detection_result.get("total_fruits", 0),
+        confidence=detection_result.get("confidence", 0.0),
+        processing_time=processing_time,
+        detected_fruits=build_detected_list(detection_result, fruit_type),
+        recommendations=detection_result.get("recommendations", ""),
+        record_id=record_id,
+        method=detection_result.get("method", "unknown"),
+        model=detection_result.get("model", "simple"),
+        image_url=image_url,
+        thumbnail_url=thumbnail_url,
+        preview_url=preview_url,
+    )
+
+
+def encode_history_cursor(harvest_date: Optional[datetime], record_id: int) -> str:
+    """Курсор страницы истории: позиция последней записи по (harvest_date, id)"""
+    payload = {
+        "d": harvest_date.isoformat() if harvest_date else None,
+        "id": record_id,
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """Разбирает курсор истории, ValueError при некорректном значении"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        harvest_date = (
+            datetime.fromisoformat(payload["d"]) if payload["d"] else None
+        )
+        return harvest_date, int(payload["id"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Некорректный курсор: {e}")
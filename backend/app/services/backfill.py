@@ -0,0 +1,426 @@
+# app/services/backfill.py
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.storage import StorageService, get_storage
+from app.models.database import BackfillCheckpoint, HarvestRecord, SessionLocal
+from app.services.ai_service import ai_service
+
+logger = logging.getLogger(__name__)
+
+
+def _detect_worker(image_bytes: bytes, fruit_type: str) -> Dict[str, Any]:
+    """Детекция в дочернем процессе пула (функция должна быть на уровне модуля)"""
+    return ai_service.process_image(image_bytes, fruit_type)
+
+
+class _Prefetcher:
+    """
+    Скачивание изображений наперёд скользящим окном: скачивается или
+    ждёт детекции не больше window изображений, сколько бы ключей
+    ни было поставлено в очередь. Ключи забираются в порядке постановки.
+    """
+
+    def __init__(self, downloader: Executor, storage: StorageService, window: int):
+        self.downloader = downloader
+        self.storage = storage
+        self.window = max(window, 1)
+        self._waiting: Deque[str] = deque()
+        self._started: Deque[Tuple[str, Future]] = deque()
+
+    def add(self, keys: Iterable[str]):
+        self._waiting.extend(keys)
+        self._fill()
+
+    def take(self) -> Tuple[str, Future]:
+        """Следующий ключ и его скачивание"""
+        if not self._started:
+            self._start_next()
+        item = self._started.popleft()
+        self._fill()
+        return item
+
+    def _fill(self):
+        while self._waiting and len(self._started) < self.window:
+            self._start_next()
+
+    def _start_next(self):
+        key = self._waiting.popleft()
+        future = self.downloader.submit(self.storage.download_bytes, key)
+        self._started.append((key, future))
+
+
+def _batch_keys(rows: List[Tuple]) -> Dict[str, List[str]]:
+    """Ключ изображения -> типы плодов в пачке (порядок ключей - как в пачке)"""
+    keys: Dict[str, List[str]] = {}
+    for row in rows:
+        fruit_types = keys.setdefault(row.image_path, [])
+        if (row.fruit_type or "apple") not in fruit_types:
+            fruit_types.append(row.fruit_type or "apple")
+    return keys
+
+
+def default_checkpoint_name() -> str:
+    return f"detector-{ai_service.version}"
+
+
+def retry_ids(checkpoint: BackfillCheckpoint) -> List[int]:
+    return json.loads(checkpoint.retry_ids) if checkpoint.retry_ids else []
+
+
+def checkpoint_to_dict(checkpoint: BackfillCheckpoint) -> Dict[str, Any]:
+    return {
+        "name": checkpoint.name,
+        "detector_version": checkpoint.detector_version,
+        "status": checkpoint.status,
+        "last_record_id": checkpoint.last_record_id,
+        "processed": checkpoint.processed,
+        "updated": checkpoint.updated,
+        "failed": checkpoint.failed,
+        "pending_retry": len(retry_ids(checkpoint)),
+        "error": checkpoint.error,
+        "started_at": checkpoint.started_at,
+        "updated_at": checkpoint.updated_at,
+        "finished_at": checkpoint.finished_at,
+    }
+
+
+class DetectionBackfill:
+    """
+    Пересчёт записей урожая текущей версией детектора.
+
+    Записи обходятся по возрастанию id пачками. Пока пачка считается в пуле
+    процессов, изображения следующей пачки уже скачиваются. Результаты
+    пишутся одним bulk update вместе с контрольной точкой, поэтому после
+    падения обход продолжается с последней сохранённой пачки. Записи,
+    детекция которых не удалась, запоминаются в контрольной точке
+    и повторяются в начале следующего запуска.
+    """
+
+    def __init__(self, session_factory=SessionLocal, storage_factory=get_storage):
+        self.session_factory = session_factory
+        self.storage_factory = storage_factory
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- Контрольные точки ----------
+
+    def get_checkpoint(self, name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            checkpoint = (
+                db.query(BackfillCheckpoint)
+                .filter(BackfillCheckpoint.name == (name or default_checkpoint_name()))
+                .first()
+            )
+            return checkpoint_to_dict(checkpoint) if checkpoint else None
+        finally:
+            db.close()
+
+    def _load_checkpoint(
+        self, db: Session, name: str, restart: bool
+    ) -> BackfillCheckpoint:
+        checkpoint = (
+            db.query(BackfillCheckpoint).filter(BackfillCheckpoint.name == name).first()
+        )
+        if checkpoint is None:
+            checkpoint = BackfillCheckpoint(name=name)
+            db.add(checkpoint)
+        if restart or checkpoint.last_record_id is None:
+            checkpoint.last_record_id = 0
+            checkpoint.processed = 0
+            checkpoint.updated = 0
+            checkpoint.failed = 0
+            checkpoint.retry_ids = None
+            checkpoint.started_at = datetime.utcnow()
+        checkpoint.detector_version = ai_service.version
+        checkpoint.status = "running"
+        checkpoint.error = None
+        checkpoint.finished_at = None
+        db.commit()
+        return checkpoint
+
+    # ---------- Обход ----------
+
+    def _outdated(self, db: Session):
+        """Записи с изображением, посчитанные не текущей версией детектора"""
+        return db.query(
+            HarvestRecord.id,
+            HarvestRecord.image_path,
+            HarvestRecord.fruit_type,
+            HarvestRecord.revision,
+        ).filter(
+            HarvestRecord.image_path.isnot(None),
+            or_(
+                HarvestRecord.detector_version.is_(None),
+                HarvestRecord.detector_version != ai_service.version,
+            ),
+        )
+
+    def _fetch_batch(self, db: Session, after_id: int, batch_size: int) -> List[Tuple]:
+        return (
+            self._outdated(db)
+            .filter(HarvestRecord.id > after_id)
+            .order_by(HarvestRecord.id)
+            .limit(batch_size)
+            .all()
+        )
+
+    def _fetch_by_ids(self, db: Session, ids: List[int]) -> List[Tuple]:
+        """Записи для повтора; удалённые и уже пересчитанные отпадают"""
+        return (
+            self._outdated(db)
+            .filter(HarvestRecord.id.in_(ids))
+            .order_by(HarvestRecord.id)
+            .all()
+        )
+
+    def _detect_batch(
+        self, executor: Executor, rows: List[Tuple], prefetcher: _Prefetcher
+    ) -> Dict[Tuple[str, str], Optional[Dict[str, Any]]]:
+        """
+        Детекция пачки; одинаковые изображения считаются один раз.
+        В пуле детекции одновременно не больше prefetcher.window задач -
+        иначе изображения всей пачки лежали бы в его очереди.
+        """
+        results: Dict[Tuple[str, str], Optional[Dict[str, Any]]] = {}
+        running: Dict[Future, Tuple[str, str]] = {}
+        keys = _batch_keys(rows)
+        for _ in range(len(keys)):
+            key, download = prefetcher.take()
+            try:
+                image_bytes = download.result()
+            except Exception as e:
+                logger.warning(f"Не удалось скачать {key}: {e}")
+                results.update({(key, fruit_type): None for fruit_type in keys[key]})
+                continue
+            for fruit_type in keys[key]:
+                if len(running) >= prefetcher.window:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    self._collect(done, running, results)
+                future = executor.submit(_detect_worker, image_bytes, fruit_type)
+                running[future] = (key, fruit_type)
+        self._collect(list(running), running, results)
+        return results
+
+    @staticmethod
+    def _collect(
+        futures: Iterable[Future],
+        running: Dict[Future, Tuple[str, str]],
+        results: Dict[Tuple[str, str], Optional[Dict[str, Any]]],
+    ):
+        for future in futures:
+            item = running.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.warning(f"Ошибка детекции {item[0]}: {e}")
+                result = None
+            results[item] = result if result and result.get("success") else None
+
+    def _apply(
+        self,
+        db: Session,
+        checkpoint: BackfillCheckpoint,
+        rows: List[Tuple],
+        results: Dict[Tuple[str, str], Optional[Dict[str, Any]]],
+        retry: bool = False,
+    ) -> Tuple[int, int]:
+        """
+        Пишет результаты пачки вместе с контрольной точкой (одна транзакция).
+        Записи с ошибкой попадают в список повтора. retry - пачка из этого
+        списка: она уже учтена в processed, а обход дальше не сдвигает.
+        Возвращает (обновлено, с ошибкой).
+        """
+        now = datetime.utcnow()
+        mappings = []
+        failed_ids = []
+        for row in rows:
+            result = results[(row.image_path, row.fruit_type or "apple")]
+            if result is None:
+                failed_ids.append(row.id)
+                continue
+            mappings.append(
+                {
+                    "id": row.id,
+                    "fruit_count": result.get("total_fruits", 0),
+                    "confidence_score": result.get("confidence", 0.0),
+                    "detector_version": result.get("version"),
+                    "revision": (row.revision or 1) + 1,
+                    "analyzed_at": now,
+                }
+            )
+
+        db.bulk_update_mappings(HarvestRecord, mappings)
+        pending = retry_ids(checkpoint) + failed_ids
+        checkpoint.retry_ids = json.dumps(pending) if pending else None
+        checkpoint.updated += len(mappings)
+        if retry:
+            # Раньше эти записи уже посчитаны как неудачные
+            checkpoint.failed -= len(mappings)
+        else:
+            checkpoint.last_record_id = rows[-1].id
+            checkpoint.processed += len(rows)
+            checkpoint.failed += len(failed_ids)
+        db.commit()
+        return len(mappings), len(failed_ids)
+
+    def _retry_failed(
+        self,
+        db: Session,
+        executor: Executor,
+        prefetcher: _Prefetcher,
+        checkpoint: BackfillCheckpoint,
+        batch_size: int,
+    ) -> int:
+        """Повторяет записи, не пересчитанные в прошлых запусках; один раз за запуск"""
+        ids = retry_ids(checkpoint)
+        if not ids:
+            return 0
+        rows = self._fetch_by_ids(db, ids)
+        checkpoint.retry_ids = None
+        # Отпавшие записи (удалены или пересчитаны) больше не считаются неудачными
+        checkpoint.failed -= len(ids) - len(rows)
+        db.commit()
+
+        updated = 0
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start : start + batch_size]
+            prefetcher.add(_batch_keys(batch))
+            results = self._detect_batch(executor, batch, prefetcher)
+            updated += self._apply(db, checkpoint, batch, results, retry=True)[0]
+        metrics.inc("backfill_retried_total", len(rows))
+        return updated
+
+    def run(
+        self,
+        name: Optional[str] = None,
+        batch_size: int = settings.BACKFILL_BATCH_SIZE,
+        workers: int = settings.BACKFILL_WORKERS,
+        prefetch: int = settings.BACKFILL_PREFETCH,
+        window: int = settings.BACKFILL_PREFETCH_WINDOW,
+        restart: bool = False,
+        limit: Optional[int] = None,
+        executor: Optional[Executor] = None,
+        on_batch: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Выполняет (или продолжает) пересчёт. Возвращает итоговую статистику
+        с пропускной способностью в записях в секунду.
+        """
+        name = name or default_checkpoint_name()
+        db = self.session_factory()
+        storage = self.storage_factory()
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=max(workers, 1))
+        downloader = ThreadPoolExecutor(
+            max_workers=max(prefetch, 1), thread_name_prefix="backfill-fetch"
+        )
+        prefetcher = _Prefetcher(downloader, storage, window)
+
+        started = time.perf_counter()
+        stats = {"name": name, "processed": 0, "updated": 0, "failed": 0}
+        checkpoint = self._load_checkpoint(db, name, restart)
+        try:
+            stats["retried"] = self._retry_failed(
+                db, executor, prefetcher, checkpoint, batch_size
+            )
+            stats["updated"] += stats["retried"]
+            rows = self._fetch_batch(db, checkpoint.last_record_id, batch_size)
+            prefetcher.add(_batch_keys(rows))
+
+            while rows:
+                if limit is not None and stats["processed"] >= limit:
+                    break
+
+                # Следующая пачка скачивается, пока считается текущая
+                next_rows = self._fetch_batch(db, rows[-1].id, batch_size)
+                prefetcher.add(_batch_keys(next_rows))
+
+                results = self._detect_batch(executor, rows, prefetcher)
+                updated, failed = self._apply(db, checkpoint, rows, results)
+
+                stats["processed"] += len(rows)
+                stats["updated"] += updated
+                stats["failed"] += failed
+                stats["last_record_id"] = rows[-1].id
+                elapsed = time.perf_counter() - started
+                stats["elapsed"] = round(elapsed, 3)
+                stats["records_per_second"] = round(
+                    stats["processed"] / elapsed if elapsed > 0 else 0.0, 2
+                )
+                metrics.inc("backfill_records_total", len(rows))
+                metrics.inc("backfill_failed_total", failed)
+                metrics.set_gauge("backfill_records_per_second", stats["records_per_second"])
+                if on_batch:
+                    on_batch(dict(stats))
+
+                rows = next_rows
+
+            if not rows:
+                checkpoint.status = "done"
+                checkpoint.finished_at = datetime.utcnow()
+            db.commit()
+            stats["status"] = checkpoint.status
+        except Exception as e:
+            db.rollback()
+            checkpoint.status = "failed"
+            checkpoint.error = str(e)
+            db.commit()
+            raise
+        finally:
+            downloader.shutdown(wait=False, cancel_futures=True)
+            if own_executor:
+                executor.shutdown()
+            db.close()
+
+        elapsed = time.perf_counter() - started
+        stats["elapsed"] = round(elapsed, 3)
+        stats["records_per_second"] = round(
+            stats["processed"] / elapsed if elapsed > 0 else 0.0, 2
+        )
+        logger.info(f"Пересчёт {name}: {stats}")
+        return stats
+
+    # ---------- Запуск из API ----------
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, **kwargs) -> bool:
+        """Запускает пересчёт в фоне; False, если он уже идёт"""
+        if self.is_running:
+            return False
+        self._task = asyncio.get_running_loop().create_task(
+            asyncio.to_thread(self.run, **kwargs)
+        )
+        self._task.add_done_callback(self._log_failure)
+        return True
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Пересчёт завершился с ошибкой: {task.exception()}")
+
+
+# Глобальный экземпляр
+detection_backfill = DetectionBackfill()
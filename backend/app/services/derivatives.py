@@ -0,0 +1,65 @@
+# app/services/derivatives.py
+import io
+import logging
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_CONTENT_TYPE = "image/webp"
+
+
+def derivative_sizes() -> Dict[str, int]:
+    """Имя уменьшенной копии -> наибольшая сторона в пикселях (от большей к меньшей)"""
+    return {"preview": settings.PREVIEW_SIZE, "thumb": settings.THUMBNAIL_SIZE}
+
+
+def derivative_key(key: str, name: str) -> str:
+    """users/1/analysis/abc.jpg -> users/1/analysis/abc.thumb.webp"""
+    return f"{os.path.splitext(key)[0]}.{name}.webp"
+
+
+def derivative_keys(key: str) -> List[str]:
+    return [derivative_key(key, name) for name in derivative_sizes()]
+
+
+def derivative_stem(key: str) -> Optional[str]:
+    """
+    users/1/analysis/abc.thumb.webp -> users/1/analysis/abc;
+    None, если ключ не уменьшенной копии. Расширение оригинала в ключе
+    копии не сохраняется, поэтому оригинал - stem + ".<расширение>".
+    """
+    for name in derivative_sizes():
+        suffix = f".{name}.webp"
+        if key.endswith(suffix):
+            return key[: -len(suffix)]
+    return None
+
+
+def render_derivatives(frame: np.ndarray) -> Dict[str, bytes]:
+    """
+    Уменьшенные копии декодированного RGB-кадра в WebP.
+    Каждая следующая копия строится из предыдущей, а не из оригинала.
+    """
+    image = Image.fromarray(frame)
+    rendered = {}
+    for name, size in derivative_sizes().items():
+        if max(image.size) > size:
+            image = _resized(image, size)
+        buffer = io.BytesIO()
+        image.save(
+            buffer, format="WEBP", quality=settings.DERIVATIVE_WEBP_QUALITY, method=4
+        )
+        rendered[name] = buffer.getvalue()
+    return rendered
+
+
+def _resized(image: Image.Image, size: int) -> Image.Image:
+    image = image.copy()
+    image.thumbnail((size, size), Image.LANCZOS)
+    return image
@@ -0,0 +1,231 @@
+# app/services/export_service.py
+import asyncio
+import csv
+import io
+import json
+import os
+import zipfile
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Deque, Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.storage import StorageService
+from app.models.database import Garden, HarvestRecord
+
+MANIFEST_FIELDS = [
+    "id",
+    "garden_id",
+    "garden_name",
+    "tree_id",
+    "fruit_type",
+    "fruit_count",
+    "confidence_score",
+    "detector_version",
+    "harvest_date",
+    "image_key",
+    "archive_path",
+]
+
+
+class _ZipSink(io.RawIOBase):
+    """
+    Приёмник для zipfile без перемотки: записанные байты копятся
+    до вызова drain() и сразу отдаются клиенту.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ZipStreamWriter:
+    """ZIP-архив, который формируется и отдаётся по частям"""
+
+    def __init__(self):
+        self._sink = _ZipSink()
+        self._zip = zipfile.ZipFile(self._sink, mode="w", allowZip64=True)
+
+    def _info(self, name: str, compress: bool) -> zipfile.ZipInfo:
+        info = zipfile.ZipInfo(name, date_time=datetime.now().timetuple()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        return info
+
+    def add_bytes(self, name: str, data: bytes, compress: bool = False) -> bytes:
+        """Добавляет файл целиком; JPEG/PNG уже сжаты, поэтому по умолчанию без сжатия"""
+        with self._zip.open(self._info(name, compress), mode="w", force_zip64=True) as f:
+            f.write(data)
+        return self._sink.drain()
+
+    def add_stream(self, name: str, parts: Iterator[bytes]) -> Iterator[bytes]:
+        """Добавляет файл, содержимое которого генерируется по частям"""
+        with self._zip.open(self._info(name, True), mode="w", force_zip64=True) as f:
+            for part in parts:
+                f.write(part)
+                chunk = self._sink.drain()
+                if chunk:
+                    yield chunk
+        yield self._sink.drain()
+
+    def close(self) -> bytes:
+        """Центральный каталог архива"""
+        self._zip.close()
+        return self._sink.drain()
+
+
+def archive_path(record: HarvestRecord) -> Optional[str]:
+    if not record.image_path:
+        return None
+    ext = os.path.splitext(record.image_path)[1].lower() or ".jpg"
+    return f"images/{record.id}{ext}"
+
+
+def _iter_records(db: Session, query, page_size: int) -> Iterator[tuple]:
+    """Записи постранично по id, чтобы не держать всю выборку в памяти"""
+    last_id = 0
+    while True:
+        page = (
+            query.filter(HarvestRecord.id > last_id)
+            .order_by(HarvestRecord.id)
+            .limit(page_size)
+            .all()
+        )
+        if not page:
+            return
+        last_id = page[-1][0].id
+        for row in page:
+            yield row
+            # Выгруженная запись больше не нужна сессии
+            db.expunge(row[0])
+
+
+def _manifest_row(record: HarvestRecord, garden_name: Optional[str]) -> dict:
+    return {
+        "id": record.id,
+        "garden_id": record.garden_id,
+        "garden_name": garden_name,
+        "tree_id": record.tree_id,
+        "fruit_type": record.fruit_type,
+        "fruit_count": record.fruit_count,
+        "confidence_score": record.confidence_score,
+        "detector_version": record.detector_version,
+        "harvest_date": record.harvest_date.isoformat() if record.harvest_date else None,
+        "image_key": record.image_path,
+        "archive_path": archive_path(record),
+    }
+
+
+def _manifest_parts(rows: Iterator[tuple], manifest_format: str) -> Iterator[bytes]:
+    if manifest_format == "json":
+        yield b"[\n"
+        first = True
+        for record, garden_name in rows:
+            prefix = b"" if first else b",\n"
+            first = False
+            row = json.dumps(_manifest_row(record, garden_name), ensure_ascii=False)
+            yield prefix + row.encode("utf-8")
+        yield b"\n]\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=MANIFEST_FIELDS)
+    writer.writeheader()
+    for record, garden_name in rows:
+        writer.writerow(_manifest_row(record, garden_name))
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+async def stream_harvest_export(
+    db: Session,
+    storage: StorageService,
+    garden_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    manifest_format: str = "csv",
+    prefetch: int = settings.EXPORT_PREFETCH,
+    page_size: int = settings.EXPORT_PAGE_SIZE,
+) -> AsyncIterator[bytes]:
+    """
+    Потоковый ZIP: манифест записей урожая и их изображения.
+
+    Сначала в архив пишется манифест (записи читаются страницами), затем
+    изображения. Изображения скачиваются заранее, но не больше prefetch
+    штук одновременно, поэтому расход памяти не зависит от размера выгрузки.
+    """
+    query = db.query(HarvestRecord, Garden.name).outerjoin(
+        Garden, Garden.id == HarvestRecord.garden_id
+    )
+    if garden_id is not None:
+        query = query.filter(HarvestRecord.garden_id == garden_id)
+    if date_from is not None:
+        query = query.filter(HarvestRecord.harvest_date >= date_from)
+    if date_to is not None:
+        query = query.filter(HarvestRecord.harvest_date <= date_to)
+
+    archive = ZipStreamWriter()
+    manifest_name = f"manifest.{manifest_format}"
+    for chunk in archive.add_stream(
+        manifest_name, _manifest_parts(_iter_records(db, query, page_size), manifest_format)
+    ):
+        yield chunk
+        await asyncio.sleep(0)
+
+    # Изображения: скользящее окно загрузок, запись в архив по порядку
+    window: Deque[tuple] = deque()
+    failed = []
+
+    async def write_next():
+        name, key, task = window.popleft()
+        try:
+            data = await task
+        except Exception as e:
+            failed.append(f"{key}: {e}")
+            return b""
+        return archive.add_bytes(name, data)
+
+    image_rows = _iter_records(
+        db, query.filter(HarvestRecord.image_path.isnot(None)), page_size
+    )
+    try:
+        for record, _ in image_rows:
+            key = record.image_path
+            task = asyncio.ensure_future(storage.download_bytes_async(key))
+            window.append((archive_path(record), key, task))
+            if len(window) >= prefetch:
+                chunk = await write_next()
+                if chunk:
+                    yield chunk
+        while window:
+            chunk = await write_next()
+            if chunk:
+                yield chunk
+    finally:
+        for _, _, task in window:
+            task.cancel()
+
+    if failed:
+        yield archive.add_bytes("errors.txt", "\n".join(failed).encode("utf-8"), True)
+    yield archive.close()
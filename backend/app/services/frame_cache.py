@@ -0,0 +1,76 @@
+# app/services/frame_cache.py
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+metrics.register_ratio(
+    "frame_cache_hit_ratio", "frame_cache_hits_total", "frame_cache_lookups_total"
+)
+
+
+class FrameCache:
+    """
+    LRU-кэш декодированных RGB-кадров, ключ - ключ объекта в хранилище.
+
+    Размер ограничен суммарным объёмом массивов в байтах. Кадры
+    помечаются только для чтения: детектор их не изменяет, и один
+    и тот же массив можно отдавать параллельным запросам.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = (
+            settings.FRAME_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        )
+        self._frames: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        metrics.inc("frame_cache_lookups_total")
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                return None
+            self._frames.move_to_end(key)
+        metrics.inc("frame_cache_hits_total")
+        return frame
+
+    def put(self, key: str, frame: np.ndarray) -> None:
+        if frame.nbytes > self.max_bytes:
+            return
+        frame.setflags(write=False)
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self._size -= old.nbytes
+            self._frames[key] = frame
+            self._size += frame.nbytes
+            while self._size > self.max_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self._size -= evicted.nbytes
+                metrics.inc("frame_cache_evictions_total")
+            metrics.set_gauge("frame_cache_bytes", self._size)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            frame = self._frames.pop(key, None)
+            if frame is not None:
+                self._size -= frame.nbytes
+                metrics.set_gauge("frame_cache_bytes", self._size)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._frames.clear()
+            self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+
+# Глобальный экземпляр
+frame_cache = FrameCache()
@@ -0,0 +1,123 @@
+# app/services/image_resizer.py
+import asyncio
+import io
+import logging
+from functools import lru_cache
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps
+
+from app.core.config import settings
+from app.core.disk_cache import DiskCache
+from app.core.metrics import metrics
+from app.core.storage import StorageService
+
+logger = logging.getLogger(__name__)
+
+metrics.register_ratio(
+    "resize_cache_hit_ratio", "resize_cache_hits_total", "resize_cache_lookups_total"
+)
+
+# Меняется вместе с результатом resize_image: старые копии в кэше не отдаются
+RENDER_VERSION = 2
+
+# Формат ответа -> (формат PIL, Content-Type)
+RESIZE_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+
+
+def resize_image(
+    data: bytes, width: Optional[int], height: Optional[int], fmt: str
+) -> bytes:
+    """
+    Вписывает изображение в рамку width x height (без увеличения)
+    и кодирует в fmt. JPEG декодируется сразу в уменьшенном масштабе
+    (draft: 1/2, 1/4 или 1/8), так что большой оригинал не
+    раскодируется целиком. Поворот по EXIF применяется, как в браузере:
+    рамка задана для изображения в том виде, в каком его видит пользователь.
+    """
+    box = (width or settings.RESIZE_MAX_DIMENSION, height or settings.RESIZE_MAX_DIMENSION)
+    image = Image.open(io.BytesIO(data))
+    # Orientation 5-8: пиксели повёрнуты на 90°, рамка для draft - тоже
+    rotated = image.getexif().get(0x0112) in (5, 6, 7, 8)
+    image.draft("RGB", box[::-1] if rotated else box)
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    image.thumbnail(box, Image.LANCZOS)
+
+    pil_format = RESIZE_FORMATS[fmt][0]
+    options = {}
+    if pil_format == "JPEG":
+        if image.mode == "RGBA":
+            image = image.convert("RGB")
+        options = {"quality": settings.RESIZE_JPEG_QUALITY, "optimize": True}
+    elif pil_format == "WEBP":
+        options = {"quality": settings.DERIVATIVE_WEBP_QUALITY, "method": 4}
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, **options)
+    return buffer.getvalue()
+
+
+class ImageResizer:
+    """
+    Копии изображений произвольного размера по запросу.
+
+    Результат кэшируется на диске по ключу объекта и параметрам
+    (DiskCache с вытеснением по объёму). Одновременные одинаковые
+    запросы ждут одного вычисления.
+    """
+
+    def __init__(self, cache: DiskCache):
+        self.cache = cache
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def resized(
+        self,
+        storage: StorageService,
+        key: str,
+        width: Optional[int],
+        height: Optional[int],
+        fmt: str,
+    ) -> bytes:
+        cache_key = (
+            f"{key}?w={width or ''}&h={height or ''}&fmt={fmt}&v={RENDER_VERSION}"
+        )
+        data = await asyncio.to_thread(self.cache.get, cache_key)
+        if data is not None:
+            return data
+
+        future = self._inflight.get(cache_key)
+        if future is not None:
+            metrics.inc("resize_coalesced_total")
+        else:
+            future = asyncio.ensure_future(
+                self._render(storage, key, cache_key, width, height, fmt)
+            )
+            self._inflight[cache_key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+        # Отключившийся клиент не отменяет вычисление для остальных
+        return await asyncio.shield(future)
+
+    async def _render(self, storage, key, cache_key, width, height, fmt) -> bytes:
+        generation = self.cache.generation(cache_key)
+        original = await storage.download_bytes_async(key)
+        data = await asyncio.to_thread(resize_image, original, width, height, fmt)
+        metrics.inc("resize_rendered_total")
+        await asyncio.to_thread(self.cache.put, cache_key, data, generation)
+        return data
+
+
+@lru_cache
+def get_image_resizer() -> ImageResizer:
+    """Общий на процесс экземпляр (зависимость FastAPI)"""
+    return ImageResizer(
+        DiskCache(
+            settings.RESIZE_CACHE_DIR,
+            settings.RESIZE_CACHE_MAX_BYTES,
+            metric_prefix="resize_cache",
+        )
+    )
@@ -1,15 +1,20 @@
 import cv2
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageOps
 import io
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import logging
 import math
 import json
+import threading
 
 logger = logging.getLogger(__name__)
 
 
+class DetectionCancelled(Exception):
+    """Детекция прервана: результат больше никому не нужен"""
+
+
 class NumpyEncoder(json.JSONEncoder):
     """Кастомный JSON энкодер для numpy типов"""
 
@@ -493,42 +498,81 @@ class ImprovedFruitDetector:
         )
         return min(confidence, 0.95)  # Максимум 95%
 
+    def decode(self, image_bytes: bytes) -> np.ndarray:
+        """Декодирует изображение в RGB-массив"""
+        image_pil = Image.open(io.BytesIO(image_bytes))
+        # Поворот по EXIF (Orientation), как изображение показывает браузер:
+        # иначе портретные снимки с телефона лежат в кадре на боку
+        image_pil = ImageOps.exif_transpose(image_pil)
+
+        # Конвертируем в RGB если нужно (для JPEG)
+        if image_pil.mode != "RGB":
+            image_pil = image_pil.convert("RGB")
+
+        return np.array(image_pil)
+
+    @staticmethod
+    def _check_cancelled(cancel: Optional[threading.Event]):
+        """Точка прерывания между этапами детекции"""
+        if cancel is not None and cancel.is_set():
+            raise DetectionCancelled()
+
     def detect(
-        self, image_bytes: bytes, expected_fruit: str = "apple"
+        self,
+        image_bytes: bytes,
+        expected_fruit: str = "apple",
+        cancel: Optional[threading.Event] = None,
     ) -> Dict[str, Any]:
         """
-        Основной метод детекции с несколькими алгоритмами
+        Основной метод детекции с несколькими алгоритмами.
+        Если выставлен cancel, работа прерывается на ближайшем этапе
+        с исключением DetectionCancelled.
         """
         try:
             # Загружаем и декодируем изображение
-            image_pil = Image.open(io.BytesIO(image_bytes))
+            image_np = self.decode(image_bytes)
+        except Exception as e:
+            logger.error(f"Ошибка детекции: {e}")
+            return self._error_result(e)
 
-            # Конвертируем в RGB если нужно (для JPEG)
-            if image_pil.mode != "RGB":
-                image_pil = image_pil.convert("RGB")
+        return self.detect_array(image_np, expected_fruit, cancel=cancel)
 
-            image_np = np.array(image_pil)
+    def detect_array(
+        self,
+        image_np: np.ndarray,
+        expected_fruit: str = "apple",
+        cancel: Optional[threading.Event] = None,
+    ) -> Dict[str, Any]:
+        """
+        Детекция на уже декодированном RGB-кадре (массив не изменяется)
+        """
+        try:
             height, width = image_np.shape[:2]
             image_area = width * height
 
             # Предобработка изображения
+            self._check_cancelled(cancel)
             processed_image = self._preprocess_image(image_np)
 
             # Детекция по цвету
+            self._check_cancelled(cancel)
             color_mask = self._detect_by_color(processed_image, expected_fruit)
 
             # Детекция кругов (для круглых фруктов)
+            self._check_cancelled(cancel)
             circles = self._detect_by_circles(
                 processed_image, color_mask, expected_fruit
             )
 
             # Детекция по контурам
+            self._check_cancelled(cancel)
             contours = self._detect_by_contours(color_mask, expected_fruit)
 
             # Объединение результатов
             all_detections = self._merge_detections(circles, contours)
 
             # Если ничего не найдено, пробуем альтернативные методы
+            self._check_cancelled(cancel)
             if not all_detections and self.accuracy_level in ["medium", "high"]:
                 # Пробуем найти контуры на оригинальном изображении
                 gray = cv2.cvtColor(image_np, cv2.COLOR_RGB2GRAY)
@@ -609,21 +653,26 @@ class ImprovedFruitDetector:
 
             return result
 
+        except DetectionCancelled:
+            raise
         except Exception as e:
             logger.error(f"Ошибка детекции: {e}")
-            # Возвращаем минимальный результат вместо демо-данных
-            return self._convert_numpy_types(
-                {
-                    "total_fruits": 0,
-                    "detected_fruits": [],
-                    "method": "error_fallback",
-                    "model": "improved_detector_v2",
-                    "accuracy_level": self.accuracy_level,
-                    "confidence": 0.1,
-                    "error": str(e),
-                    "recommendations": "Ошибка обработки изображения. Попробуйте другое фото.",
-                }
-            )
+            return self._error_result(e)
+
+    def _error_result(self, error: Exception) -> Dict[str, Any]:
+        """Минимальный результат вместо демо-данных"""
+        return self._convert_numpy_types(
+            {
+                "total_fruits": 0,
+                "detected_fruits": [],
+                "method": "error_fallback",
+                "model": "improved_detector_v2",
+                "accuracy_level": self.accuracy_level,
+                "confidence": 0.1,
+                "error": str(error),
+                "recommendations": "Ошибка обработки изображения. Попробуйте другое фото.",
+            }
+        )
 
     def _get_timestamp(self) -> str:
         """Получение временной метки"""
@@ -0,0 +1,242 @@
+# app/services/resumable_uploads.py
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import aiofiles
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.storage import FileTooLarge
+
+logger = logging.getLogger(__name__)
+
+# Версия протокола tus, на который похож /uploads
+TUS_VERSION = "1.0.0"
+UPLOADS_DIRNAME = ".uploads"
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadNotFound(Exception):
+    """Загрузки нет, она чужая или истекла"""
+
+
+class UploadOffsetMismatch(Exception):
+    """Клиент прислал часть не с того смещения, на котором остановилась загрузка"""
+
+    def __init__(self, offset: int):
+        super().__init__(offset)
+        self.offset = offset
+
+
+@dataclass
+class ResumableUpload:
+    id: str
+    user_id: int
+    length: int
+    filename: str
+    content_type: str
+    expires: float  # unix timestamp
+
+
+def parse_upload_metadata(header: Optional[str]) -> Dict[str, str]:
+    """Заголовок tus Upload-Metadata: 'filename d29ybGQ=,filetype aW1hZ2UvanBlZw=='"""
+    metadata = {}
+    for pair in (header or "").split(","):
+        name, _, value = pair.strip().partition(" ")
+        if not name:
+            continue
+        try:
+            metadata[name] = base64.b64decode(value, validate=True).decode("utf-8")
+        except ValueError:
+            raise ValueError(f"Некорректное значение {name} в Upload-Metadata")
+    return metadata
+
+
+class ResumableUploadStore:
+    """
+    Докачиваемые загрузки в духе протокола tus.
+
+    Недокачанный файл и его описание лежат в каталоге .uploads локального
+    хранилища: <id>.part и <id>.json. Текущее смещение - размер .part,
+    поэтому принятые до обрыва соединения байты не теряются. Загрузка,
+    которую не продолжали RESUMABLE_UPLOAD_TTL секунд, удаляется.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self._root = root
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def root(self) -> str:
+        root = self._root or os.path.join(settings.LOCAL_STORAGE_DIR, UPLOADS_DIRNAME)
+        os.makedirs(root, exist_ok=True)
+        return root
+
+    def part_path(self, upload_id: str) -> str:
+        return os.path.join(self.root, f"{upload_id}.part")
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.root, f"{upload_id}.json")
+
+    def _save(self, upload: ResumableUpload):
+        path = self._meta_path(upload.id)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(asdict(upload), f)
+        os.replace(f"{path}.tmp", path)
+
+    # ---------- Жизненный цикл загрузки ----------
+
+    def create(
+        self, user_id: int, length: int, filename: str, content_type: str
+    ) -> ResumableUpload:
+        upload = ResumableUpload(
+            id=uuid.uuid4().hex,
+            user_id=user_id,
+            length=length,
+            filename=filename,
+            content_type=content_type,
+            expires=time.time() + settings.RESUMABLE_UPLOAD_TTL,
+        )
+        open(self.part_path(upload.id), "wb").close()
+        self._save(upload)
+        metrics.inc("resumable_uploads_created_total")
+        return upload
+
+    def get(self, upload_id: str, user_id: int) -> ResumableUpload:
+        if not _UPLOAD_ID.match(upload_id):
+            raise UploadNotFound(upload_id)
+        try:
+            with open(self._meta_path(upload_id)) as f:
+                upload = ResumableUpload(**json.load(f))
+        except FileNotFoundError:
+            raise UploadNotFound(upload_id)
+        if upload.user_id != user_id or upload.expires < time.time():
+            raise UploadNotFound(upload_id)
+        return upload
+
+    def offset(self, upload: ResumableUpload) -> int:
+        try:
+            return os.path.getsize(self.part_path(upload.id))
+        except FileNotFoundError:
+            raise UploadNotFound(upload.id)
+
+    async def append(
+        self, upload: ResumableUpload, offset: int, chunks: AsyncIterator[bytes]
+    ) -> int:
+        """
+        Дописывает тело PATCH с указанного смещения, возвращает новое.
+        Каждая часть сразу уходит на диск: при обрыве соединения
+        загрузка продолжается с последнего принятого байта.
+        """
+        lock = self._locks.setdefault(upload.id, asyncio.Lock())
+        async with lock:
+            current = self.offset(upload)
+            if offset != current:
+                raise UploadOffsetMismatch(current)
+            try:
+                async with aiofiles.open(self.part_path(upload.id), "ab") as f:
+                    async for chunk in chunks:
+                        if current + len(chunk) > upload.length:
+                            raise FileTooLarge(current + len(chunk))
+                        await f.write(chunk)
+                        current += len(chunk)
+            finally:
+                # Загрузка жива, пока её продолжают
+                upload.expires = time.time() + settings.RESUMABLE_UPLOAD_TTL
+                await asyncio.to_thread(self._save, upload)
+                metrics.inc("resumable_upload_bytes_total", current - offset)
+        return current
+
+    async def read(self, upload: ResumableUpload) -> Tuple[bytes, str]:
+        """Содержимое докачанного файла и его SHA-256"""
+
+        def read_file():
+            with open(self.part_path(upload.id), "rb") as f:
+                data = f.read()
+            return data, hashlib.sha256(data).hexdigest()
+
+        return await asyncio.to_thread(read_file)
+
+    async def sha256(self, upload: ResumableUpload) -> str:
+        """SHA-256 докачанного файла, читая его по частям"""
+
+        def hash_file():
+            digest = hashlib.sha256()
+            with open(self.part_path(upload.id), "rb") as f:
+                while chunk := f.read(1024 * 1024):
+                    digest.update(chunk)
+            return digest.hexdigest()
+
+        return await asyncio.to_thread(hash_file)
+
+    def delete(self, upload_id: str):
+        for path in (self._meta_path(upload_id), self.part_path(upload_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._locks.pop(upload_id, None)
+
+    # ---------- Удаление брошенных загрузок ----------
+
+    def expire(self) -> int:
+        """Удаляет истёкшие загрузки, возвращает их число"""
+        now = time.time()
+        upload_ids = {
+            os.path.splitext(name)[0]
+            for name in os.listdir(self.root)
+            if name.endswith((".json", ".part"))
+        }
+        expired = 0
+        for upload_id in upload_ids:
+            try:
+                with open(self._meta_path(upload_id)) as f:
+                    alive = json.load(f)["expires"] >= now
+            except FileNotFoundError:
+                # .part без описания - остаток прерванного create/delete
+                try:
+                    mtime = os.path.getmtime(self.part_path(upload_id))
+                except FileNotFoundError:
+                    continue
+                alive = mtime > now - settings.RESUMABLE_UPLOAD_TTL
+            except (OSError, ValueError, KeyError):
+                alive = False
+            if not alive:
+                self.delete(upload_id)
+                expired += 1
+        if expired:
+            logger.info(f"Удалено брошенных загрузок: {expired}")
+            metrics.inc("resumable_uploads_expired_total", expired)
+        return expired
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._expire_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _expire_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.expire)
+            except Exception as e:
+                logger.error(f"Ошибка очистки брошенных загрузок: {e}")
+            await asyncio.sleep(settings.RESUMABLE_UPLOAD_SWEEP_INTERVAL)
+
+
+# Глобальный экземпляр
+resumable_uploads = ResumableUploadStore()
@@ -0,0 +1,198 @@
+# app/services/storage_gc.py
+import asyncio
+import logging
+import re
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.storage import StorageService, get_storage
+from app.core.storage_backends import ObjectInfo, S3_DELETE_BATCH
+from app.models.database import HarvestRecord, SessionLocal, StoredObject
+from app.services.derivatives import derivative_keys, derivative_stem
+
+logger = logging.getLogger(__name__)
+
+# Сборщик трогает только фотографии анализов: общие объекты по хэшу
+# и каталоги users/<id>/analysis. Файлы из /files/upload записями
+# урожая не учитываются, поэтому не рассматриваются
+GC_PREFIXES = ("objects/", "users/")
+GC_KEY_PATTERN = re.compile(r"^(objects/|users/\d+/analysis/)")
+# Сколько оригиналов уменьшенных копий ищется одним запросом (LIKE через OR)
+GC_STEM_BATCH = 100
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class StorageGarbageCollector:
+    """
+    Удаление объектов хранилища, на которые не ссылается ни одна запись.
+
+    Ключи в хранилище сравниваются с HarvestRecord.image_path, индексом
+    stored_objects и ключами уменьшенных копий. Объекты моложе min_age
+    не трогаются: их могла загрузить ещё не закоммиченная запись. Перед
+    удалением каждой пачки ссылки на оригиналы перепроверяются в БД.
+    """
+
+    def __init__(self, session_factory=SessionLocal, storage_factory=get_storage):
+        self.session_factory = session_factory
+        self.storage_factory = storage_factory
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def referenced_keys(self, db: Session) -> Set[str]:
+        keys: Set[str] = set()
+        originals = db.query(HarvestRecord.image_path).filter(
+            HarvestRecord.image_path.isnot(None)
+        )
+        objects = db.query(StoredObject.key).filter(StoredObject.ref_count > 0)
+        for (key,) in originals.union(objects):
+            keys.add(key)
+            keys.update(derivative_keys(key))
+        return keys
+
+    def _still_referenced(self, db: Session, keys: List[str]) -> Set[str]:
+        """Ключи пачки, на которые (или на оригиналы которых) уже ссылаются"""
+        records = db.query(HarvestRecord.image_path).filter(
+            HarvestRecord.image_path.in_(keys)
+        )
+        objects = db.query(StoredObject.key).filter(StoredObject.key.in_(keys))
+        live = {key for (key,) in records.union(objects)}
+
+        # Уменьшенная копия жива, пока жив её оригинал
+        stems = sorted({stem for stem in map(derivative_stem, keys) if stem})
+        wanted = set(keys)
+        for start in range(0, len(stems), GC_STEM_BATCH):
+            chunk = stems[start : start + GC_STEM_BATCH]
+            for original in self._originals_like(db, chunk):
+                live.update(wanted.intersection(derivative_keys(original)))
+        return live
+
+    @staticmethod
+    def _originals_like(db: Session, stems: List[str]) -> Set[str]:
+        """Ключи оригиналов вида stem.<расширение> в записях и индексе"""
+        patterns = [_escape_like(stem) + ".%" for stem in stems]
+        records = db.query(HarvestRecord.image_path).filter(
+            or_(*(HarvestRecord.image_path.like(p, escape="\\") for p in patterns))
+        )
+        objects = db.query(StoredObject.key).filter(
+            or_(*(StoredObject.key.like(p, escape="\\") for p in patterns))
+        )
+        return {key for (key,) in records.union(objects)}
+
+    def run(
+        self,
+        dry_run: bool = False,
+        batch_size: int = S3_DELETE_BATCH,
+        min_age: float = settings.STORAGE_GC_MIN_AGE,
+        deletes_per_second: float = settings.STORAGE_GC_DELETES_PER_SECOND,
+    ) -> Dict[str, Any]:
+        """Один проход сборщика; возвращает отчёт (в dry_run ничего не удаляется)"""
+        batch_size = min(max(batch_size, 1), S3_DELETE_BATCH)
+        storage = self.storage_factory()
+        db = self.session_factory()
+        started = time.perf_counter()
+        cutoff = time.time() - min_age
+        report = {
+            "dry_run": dry_run,
+            "scanned": 0,
+            "orphans": 0,
+            "deleted": 0,
+            "failed": 0,
+            "bytes_reclaimed": 0,
+            "sample": [],
+        }
+
+        def collect(batch: List[ObjectInfo]):
+            self._collect(db, storage, batch, report, dry_run, deletes_per_second)
+
+        try:
+            referenced = self.referenced_keys(db)
+            batch: List[ObjectInfo] = []
+            for prefix in GC_PREFIXES:
+                for info in storage.list_objects(prefix):
+                    report["scanned"] += 1
+                    if (
+                        not GC_KEY_PATTERN.match(info.key)
+                        or info.key in referenced
+                        or info.modified > cutoff
+                    ):
+                        continue
+                    batch.append(info)
+                    if len(batch) >= batch_size:
+                        collect(batch)
+                        batch = []
+            if batch:
+                collect(batch)
+        finally:
+            db.close()
+
+        report["elapsed"] = round(time.perf_counter() - started, 3)
+        logger.info(f"Сборка мусора в хранилище: {report}")
+        self.last_report = report
+        return report
+
+    def _collect(
+        self,
+        db: Session,
+        storage: StorageService,
+        batch: List[ObjectInfo],
+        report: Dict[str, Any],
+        dry_run: bool,
+        deletes_per_second: float,
+    ):
+        batch_started = time.perf_counter()
+        live = self._still_referenced(db, [info.key for info in batch])
+        orphans = [info for info in batch if info.key not in live]
+        report["orphans"] += len(orphans)
+        free = 20 - len(report["sample"])
+        report["sample"].extend(info.key for info in orphans[:free])
+        if dry_run or not orphans:
+            report["bytes_reclaimed"] += sum(info.size for info in orphans)
+            return
+
+        failed = set(storage.delete_many([info.key for info in orphans]))
+        reclaimed = sum(info.size for info in orphans if info.key not in failed)
+        report["deleted"] += len(orphans) - len(failed)
+        report["failed"] += len(failed)
+        report["bytes_reclaimed"] += reclaimed
+        metrics.inc("storage_gc_deleted_total", len(orphans) - len(failed))
+        metrics.inc("storage_gc_bytes_reclaimed_total", reclaimed)
+
+        # Ограничение скорости: не больше deletes_per_second удалений в секунду
+        if deletes_per_second > 0:
+            elapsed = time.perf_counter() - batch_started
+            pause = len(orphans) / deletes_per_second - elapsed
+            if pause > 0:
+                time.sleep(pause)
+
+    # ---------- Запуск из API ----------
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, **kwargs) -> bool:
+        """Запускает проход в фоне; False, если он уже идёт"""
+        if self.is_running:
+            return False
+        self._task = asyncio.get_running_loop().create_task(
+            asyncio.to_thread(self.run, **kwargs)
+        )
+        self._task.add_done_callback(self._log_failure)
+        return True
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Сборка мусора завершилась с ошибкой: {task.exception()}")
+
+
+# Глобальный экземпляр
+storage_gc = StorageGarbageCollector()
@@ -0,0 +1,270 @@
+# app/services/usage.py
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.database import DetectionUsage, Garden, SessionLocal, User
+
+logger = logging.getLogger(__name__)
+
+# garden_id строк без сада: NULL в уникальном индексе не совпадает сам с собой,
+# и ON CONFLICT не склеил бы такие строки
+NO_GARDEN = 0
+
+# Чья детекция выполняется в текущем запросе/задаче: (user_id, garden_id)
+detection_owner: ContextVar[Optional[Tuple[int, Optional[int]]]] = ContextVar(
+    "detection_owner", default=None
+)
+
+
+def parse_megapixels(image_size: Optional[str]) -> float:
+    """'1920x1080' -> 2.0736"""
+    try:
+        width, height = (int(part) for part in image_size.split("x"))
+    except (AttributeError, ValueError):
+        return 0.0
+    return width * height / 1_000_000
+
+
+class UsageTracker:
+    """
+    Учёт CPU-секунд и мегапикселей детекции по пользователям и садам.
+
+    Суточные суммы по пользователю держатся в памяти - по ним дёшево
+    проверяются квоты. Накопленные приращения периодически сбрасываются
+    в таблицу detection_usage (одна строка на день, пользователя и сад),
+    после чего суммы перечитываются из неё - так квота общая для всех
+    воркеров, но нагрузку других воркеров видно с задержкой до
+    USAGE_FLUSH_INTERVAL.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self._lock = threading.Lock()
+        # (день, user_id, garden_id) -> [детекций, CPU-секунд, мегапикселей]
+        self._pending: Dict[Tuple[date, int, Optional[int]], List[float]] = {}
+        # (день, user_id) -> [CPU-секунд, мегапикселей]
+        self._daily: Dict[Tuple[date, int], List[float]] = defaultdict(lambda: [0.0, 0.0])
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- Учёт ----------
+
+    def attribute(self, user_id: int, garden_id: Optional[int] = None):
+        """Привязывает детекции текущего контекста к пользователю и саду"""
+        detection_owner.set((user_id, garden_id))
+
+    def record(self, cpu_seconds: float, megapixels: float):
+        """Учитывает одну детекцию владельца из текущего контекста"""
+        owner = detection_owner.get()
+        if owner is None:
+            return
+        user_id, garden_id = owner
+        today = datetime.utcnow().date()
+        with self._lock:
+            pending = self._pending.setdefault((today, user_id, garden_id), [0, 0.0, 0.0])
+            pending[0] += 1
+            pending[1] += cpu_seconds
+            pending[2] += megapixels
+            daily = self._daily[(today, user_id)]
+            daily[0] += cpu_seconds
+            daily[1] += megapixels
+        metrics.inc("detection_cpu_seconds_total", cpu_seconds)
+        metrics.inc("detection_megapixels_total", megapixels)
+
+    def today(self, user_id: int) -> Tuple[float, float]:
+        """(CPU-секунды, мегапиксели) пользователя за сегодня"""
+        with self._lock:
+            cpu_seconds, megapixels = self._daily.get(
+                (datetime.utcnow().date(), user_id), (0.0, 0.0)
+            )
+        return cpu_seconds, megapixels
+
+    def check_quota(self, user: User):
+        """429, если пользователь исчерпал суточную квоту детекции"""
+        if user.role == "admin":
+            return
+        cpu_seconds, megapixels = self.today(user.id)
+        exceeded = (
+            settings.DAILY_CPU_SECONDS_QUOTA
+            and cpu_seconds >= settings.DAILY_CPU_SECONDS_QUOTA
+        ) or (
+            settings.DAILY_MEGAPIXELS_QUOTA
+            and megapixels >= settings.DAILY_MEGAPIXELS_QUOTA
+        )
+        if exceeded:
+            metrics.inc("usage_quota_rejected_total")
+            tomorrow = datetime.combine(
+                datetime.utcnow().date() + timedelta(days=1), datetime.min.time()
+            )
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Суточная квота анализа исчерпана",
+                headers={
+                    "Retry-After": str(
+                        int((tomorrow - datetime.utcnow()).total_seconds()) + 1
+                    )
+                },
+            )
+
+    # ---------- Сброс в БД ----------
+
+    def load_today(self, db: Session):
+        """Суточные суммы из таблицы (всех воркеров) плюс ещё не сброшенные"""
+        today = datetime.utcnow().date()
+        rows = (
+            db.query(
+                DetectionUsage.user_id,
+                func.sum(DetectionUsage.cpu_seconds),
+                func.sum(DetectionUsage.megapixels),
+            )
+            .filter(DetectionUsage.day == today)
+            .group_by(DetectionUsage.user_id)
+            .all()
+        )
+        daily: Dict[Tuple[date, int], List[float]] = defaultdict(lambda: [0.0, 0.0])
+        for user_id, cpu_seconds, megapixels in rows:
+            daily[(today, user_id)] = [cpu_seconds or 0.0, megapixels or 0.0]
+        with self._lock:
+            # Словарь собирается заново: суммы за прошедшие дни для квот не нужны
+            for (day, user_id, _), (_, cpu_seconds, megapixels) in self._pending.items():
+                if day == today:
+                    daily[(today, user_id)][0] += cpu_seconds
+                    daily[(today, user_id)][1] += megapixels
+            self._daily = daily
+
+    def flush(self, db: Session) -> int:
+        """
+        Переносит накопленные приращения в detection_usage и обновляет
+        суточные суммы для квот
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        try:
+            for (day, user_id, garden_id), (count, cpu_seconds, megapixels) in pending.items():
+                # Прибавление на стороне БД: другие воркеры пишут в те же строки
+                statement = sqlite_insert(DetectionUsage).values(
+                    day=day,
+                    user_id=user_id,
+                    garden_id=NO_GARDEN if garden_id is None else garden_id,
+                    detections=int(count),
+                    cpu_seconds=cpu_seconds,
+                    megapixels=megapixels,
+                )
+                db.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["day", "user_id", "garden_id"],
+                        set_={
+                            "detections": DetectionUsage.detections
+                            + statement.excluded.detections,
+                            "cpu_seconds": DetectionUsage.cpu_seconds
+                            + statement.excluded.cpu_seconds,
+                            "megapixels": DetectionUsage.megapixels
+                            + statement.excluded.megapixels,
+                        },
+                    )
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Возвращаем приращения, чтобы не потерять их до следующего сброса
+            with self._lock:
+                for key, values in pending.items():
+                    current = self._pending.setdefault(key, [0, 0.0, 0.0])
+                    for i, value in enumerate(values):
+                        current[i] += value
+            raise
+        self.load_today(db)
+        return len(pending)
+
+    def top_consumers(
+        self, db: Session, days: int = 1, by: str = "user", limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """Наибольшие потребители CPU детектора за последние days дней"""
+        since = datetime.utcnow().date() - timedelta(days=max(days, 1) - 1)
+        totals = (
+            func.sum(DetectionUsage.detections).label("detections"),
+            func.sum(DetectionUsage.cpu_seconds).label("cpu_seconds"),
+            func.sum(DetectionUsage.megapixels).label("megapixels"),
+        )
+        if by == "garden":
+            # Без сада - NO_GARDEN, а в строках старых версий - NULL
+            garden_id = func.nullif(DetectionUsage.garden_id, NO_GARDEN)
+            query = (
+                db.query(garden_id, Garden.name, *totals)
+                .outerjoin(Garden, Garden.id == DetectionUsage.garden_id)
+                .group_by(garden_id, Garden.name)
+            )
+        else:
+            query = (
+                db.query(DetectionUsage.user_id, User.email, *totals)
+                .outerjoin(User, User.id == DetectionUsage.user_id)
+                .group_by(DetectionUsage.user_id, User.email)
+            )
+        rows = (
+            query.filter(DetectionUsage.day >= since)
+            .order_by(func.sum(DetectionUsage.cpu_seconds).desc())
+            .limit(limit)
+            .all()
+        )
+
+        key, label = ("garden_id", "garden_name") if by == "garden" else ("user_id", "email")
+        return [
+            {
+                key: row[0],
+                label: row[1],
+                "detections": int(row.detections or 0),
+                "cpu_seconds": round(row.cpu_seconds or 0.0, 3),
+                "megapixels": round(row.megapixels or 0.0, 3),
+            }
+            for row in rows
+        ]
+
+    # ---------- Фоновый сброс ----------
+
+    async def start(self):
+        if self._task is not None:
+            return
+        db = self.session_factory()
+        try:
+            self.load_today(db)
+        finally:
+            db.close()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self._flush_once)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.USAGE_FLUSH_INTERVAL)
+            try:
+                await asyncio.to_thread(self._flush_once)
+            except Exception as e:
+                logger.error(f"Не удалось сохранить статистику нагрузки: {e}")
+
+    def _flush_once(self):
+        db = self.session_factory()
+        try:
+            self.flush(db)
+        finally:
+            db.close()
+
+
+# Глобальный экземпляр
+usage_tracker = UsageTracker()
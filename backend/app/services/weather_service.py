@@ -3,7 +3,7 @@ import httpx
 from tenacity import retry, stop_after_attempt, wait_exponential
 from fastapi import HTTPException
 from app.core.config import settings
-from app.core.cache import cache
+from app.core.cache import cache, single_flight
 
 
 class WeatherService:
@@ -12,6 +12,9 @@ class WeatherService:
         self.api_key = settings.OPENWEATHER_API_KEY
         self.client = httpx.AsyncClient(timeout=10.0)
 
+    # Истёкшая запись популярного сада - один запрос к API на всех,
+    # включая повторные попытки
+    @single_flight(key=lambda self, lat, lon: f"weather_{lat}_{lon}", name="weather")
     @retry(
         stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10)
     )
@@ -28,7 +31,7 @@ class WeatherService:
             }
 
         cache_key = f"weather_{lat}_{lon}"
-        cached = cache.get(cache_key)
+        cached = await cache.aget(cache_key)
         if cached:
             return cached
 
@@ -52,7 +55,7 @@ class WeatherService:
                 "icon": data["weather"][0]["icon"],
                 "wind_speed": data["wind"]["speed"],
             }
-            cache.set(cache_key, normalized, ttl=settings.WEATHER_CACHE_TTL)
+            await cache.aset(cache_key, normalized, ttl=settings.WEATHER_CACHE_TTL)
             return normalized
         except httpx.HTTPStatusError as e:
             raise HTTPException(
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import uuid
 from datetime import datetime
@@ -95,3 +96,15 @@ def validate_image_file(file) -> tuple[bool, str]:
         )
 
     return True, "OK"
+
+
+async def read_upload_with_digest(
+    upload_file, chunk_size: int = 1024 * 1024
+) -> tuple[bytes, str]:
+    """Читает загруженный файл по частям, попутно считая SHA-256"""
+    digest = hashlib.sha256()
+    chunks = []
+    while chunk := await upload_file.read(chunk_size):
+        digest.update(chunk)
+        chunks.append(chunk)
+    return b"".join(chunks), digest.hexdigest()
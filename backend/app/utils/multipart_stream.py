@@ -0,0 +1,129 @@
+# app/utils/multipart_stream.py
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+# Запас на заголовки частей и разделители multipart сверх размера файла
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+@dataclass
+class FilePart:
+    """Заголовки файловой части multipart/form-data"""
+
+    field_name: str = ""
+    filename: Optional[str] = None
+    content_type: str = ""
+    headers: List[Tuple[bytes, bytes]] = field(default_factory=list)
+
+
+class _PartCollector:
+    """Колбэки парсера python-multipart: копят события для следующего await"""
+
+    def __init__(self, field_name: str):
+        self.field_name = field_name
+        self.events: List[Tuple[Optional[FilePart], bytes]] = []
+        self.part: Optional[FilePart] = None
+        self._header_name = b""
+        self._header_value = b""
+        self._headers: List[Tuple[bytes, bytes]] = []
+
+    def on_part_begin(self):
+        self._headers = []
+        self.part = None
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers.append((self._header_name.lower(), self._header_value))
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        headers = dict(self._headers)
+        _, options = parse_options_header(headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if name != self.field_name or b"filename" not in options:
+            return
+        content_type, _ = parse_options_header(headers.get(b"content-type", b""))
+        self.part = FilePart(
+            field_name=name,
+            filename=options[b"filename"].decode("utf-8", "replace"),
+            content_type=content_type.decode("latin-1"),
+            headers=self._headers,
+        )
+        self.events.append((self.part, b""))
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        # Данные остальных полей не нужны и не копятся
+        if self.part is not None:
+            self.events.append((None, data[start:end]))
+
+    def on_part_end(self):
+        self.part = None
+
+
+async def iter_file_chunks(
+    request: Request, field_name: str, chunk_size: int, max_size: int
+) -> AsyncIterator[Tuple[FilePart, bytes]]:
+    """
+    Читает файл из поля field_name запроса multipart/form-data по мере
+    поступления тела, не сохраняя его целиком ни в памяти, ни на диске.
+
+    Первой отдаётся пара (заголовки, b"") - до того, как прочитаны данные,
+    затем части содержимого по chunk_size байт (последняя - короче).
+    Запрос с Content-Length больше max_size + MULTIPART_OVERHEAD
+    отклоняется с 413 без чтения тела.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(422, "Ожидается multipart/form-data")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_size + MULTIPART_OVERHEAD:
+        raise HTTPException(
+            413, f"File too large. Max size: {max_size // (1024*1024)} MB"
+        )
+
+    collector = _PartCollector(field_name)
+    parser = MultipartParser(
+        params[b"boundary"],
+        {
+            "on_part_begin": collector.on_part_begin,
+            "on_header_field": collector.on_header_field,
+            "on_header_value": collector.on_header_value,
+            "on_header_end": collector.on_header_end,
+            "on_headers_finished": collector.on_headers_finished,
+            "on_part_data": collector.on_part_data,
+            "on_part_end": collector.on_part_end,
+        },
+    )
+    found: Optional[FilePart] = None
+    buffer = bytearray()
+
+    async for body_chunk in request.stream():
+        parser.write(body_chunk)
+        events, collector.events = collector.events, []
+        for part, data in events:
+            if part is not None:
+                if found is not None:
+                    # Второй файл в том же поле не принимается
+                    raise HTTPException(422, f"Ожидается один файл в поле {field_name}")
+                found = part
+                yield part, b""
+                continue
+            buffer += data
+            while len(buffer) >= chunk_size:
+                yield found, bytes(buffer[:chunk_size])
+                del buffer[:chunk_size]
+    parser.finalize()
+
+    if found is None:
+        raise HTTPException(422, f"Поле {field_name} с файлом не найдено")
+    if buffer:
+        yield found, bytes(buffer)
@@ -2,6 +2,6 @@
 set -e
 
 # Выполнить миграции (если нужно) – для SQLite можно создать таблицы через create_all
-python -c "from app.models.database import Base, engine; Base.metadata.create_all(bind=engine)"
+python -c "from app.models.database import Base, engine, upgrade_schema; Base.metadata.create_all(bind=engine); upgrade_schema(engine)"
 
 exec "$@"
\ No newline at end of file
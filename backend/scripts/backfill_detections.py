@@ -0,0 +1,53 @@
+# scripts/backfill_detections.py
+"""
+Пересчёт записей урожая текущей версией детектора.
+
+Можно прервать в любой момент: повторный запуск продолжит
+с последней сохранённой контрольной точки.
+
+    python scripts/backfill_detections.py --workers 8 --batch-size 500
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services.backfill import detection_backfill
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пересчёт записей новой версией детектора")
+    parser.add_argument("--name", help="Имя контрольной точки (по умолчанию detector-<версия>)")
+    parser.add_argument("--batch-size", type=int, default=settings.BACKFILL_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=settings.BACKFILL_WORKERS)
+    parser.add_argument("--prefetch", type=int, default=settings.BACKFILL_PREFETCH)
+    parser.add_argument("--limit", type=int, help="Остановиться после N записей")
+    parser.add_argument("--restart", action="store_true", help="Начать обход заново")
+    args = parser.parse_args()
+
+    def report(stats):
+        print(
+            f" id<={stats['last_record_id']}: обработано {stats['processed']}, "
+            f"обновлено {stats['updated']}, ошибок {stats['failed']}, "
+            f"{stats['records_per_second']} зап/с"
+        )
+
+    stats = detection_backfill.run(
+        name=args.name,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        prefetch=args.prefetch,
+        restart=args.restart,
+        limit=args.limit,
+        on_batch=report,
+    )
+    print(
+        f"✅ Готово ({stats['status']}): {stats['processed']} записей за "
+        f"{stats['elapsed']} с, {stats['records_per_second']} зап/с"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# scripts/storage_gc.py
+"""
+Удаление из хранилища фотографий, на которые не ссылается ни одна запись.
+
+Без --delete выполняется пробный прогон: выводится, что и сколько
+места было бы освобождено.
+
+    python scripts/storage_gc.py
+    python scripts/storage_gc.py --delete --rate 200
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services.storage_gc import storage_gc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка мусора в хранилище")
+    parser.add_argument("--delete", action="store_true", help="Удалять (иначе пробный прогон)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--min-age", type=float, default=settings.STORAGE_GC_MIN_AGE)
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=settings.STORAGE_GC_DELETES_PER_SECOND,
+        help="Не больше N удалений в секунду (0 - без ограничения)",
+    )
+    args = parser.parse_args()
+
+    report = storage_gc.run(
+        dry_run=not args.delete,
+        batch_size=args.batch_size,
+        min_age=args.min_age,
+        deletes_per_second=args.rate,
+    )
+    for key in report["sample"]:
+        print(f"  {key}")
+    action = "удалено" if args.delete else "к удалению"
+    print(
+        f"✅ Просмотрено {report['scanned']} объектов, без ссылок {report['orphans']}, "
+        f"{action} {report['deleted'] if args.delete else report['orphans']}, "
+        f"освобождено {report['bytes_reclaimed'] / 1024 / 1024:.1f} МБ "
+        f"за {report['elapsed']} с"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
+import io
 import pytest
 from fastapi.testclient import TestClient
+from PIL import Image, ImageDraw
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.main import app
 from app.models.database import Base, get_db, User
 from app.core.security import get_password_hash
+from app.core.config import settings
+from app.core.storage import get_storage
+from app.services.image_resizer import get_image_resizer
 
 # Создаём engine ОДИН РАЗ
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -32,6 +37,19 @@ def db_session():
     transaction.rollback()
     connection.close()
 
+@pytest.fixture(autouse=True)
+def local_storage(tmp_path, monkeypatch):
+    """Файлы тестов пишутся в локальное хранилище во временном каталоге"""
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", "local")
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_DIR", str(tmp_path / "storage"))
+    monkeypatch.setattr(settings, "DISK_CACHE_DIR", str(tmp_path / "storage_cache"))
+    monkeypatch.setattr(settings, "RESIZE_CACHE_DIR", str(tmp_path / "resize_cache"))
+    get_storage.cache_clear()
+    get_image_resizer.cache_clear()
+    yield
+    get_storage.cache_clear()
+    get_image_resizer.cache_clear()
+
 @pytest.fixture
 def client(db_session):
     """Создаёт клиент с переопределённой сессией БД"""
@@ -122,6 +140,17 @@ def manager_auth_headers(client, manager_user):
     token = response.json()["access_token"]
     return {"Authorization": f"Bearer {token}"}
 
+@pytest.fixture
+def test_image():
+    """Небольшое JPEG изображение с красными кругами"""
+    image = Image.new("RGB", (320, 240), (40, 120, 40))
+    draw = ImageDraw.Draw(image)
+    for x in (60, 160, 260):
+        draw.ellipse([x - 25, 95, x + 25, 145], fill=(200, 20, 20))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
 # Моки для внешних сервисов
 @pytest.fixture
 def mock_s3(mocker):
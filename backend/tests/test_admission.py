@@ -0,0 +1,78 @@
+# tests/test_admission.py
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.admission import AdmissionController, detection_admission
+from app.core.metrics import metrics
+
+
+def test_admission_queues_then_rejects_when_full():
+    metrics.reset()
+    controller = AdmissionController("test", max_concurrent=1, max_queue=1, timeout=1)
+
+    async def scenario():
+        first = await controller.acquire()
+        waiting = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        assert controller.queue_length == 1
+
+        with pytest.raises(HTTPException) as exc:
+            await controller.acquire()
+        assert exc.value.status_code == 429
+        assert int(exc.value.headers["Retry-After"]) >= 1
+
+        first.release()
+        second = await waiting
+        assert controller.active == 1
+        second.release()
+
+    asyncio.run(scenario())
+
+    assert controller.active == 0
+    assert metrics.get(
+        "admission_rejected_total", {"name": "test", "reason": "queue_full"}
+    ) == 1
+
+
+def test_admission_deadline_expires():
+    controller = AdmissionController("test", max_concurrent=1, max_queue=5, timeout=0.05)
+
+    async def scenario():
+        ticket = await controller.acquire()
+        with pytest.raises(HTTPException) as exc:
+            await controller.acquire()
+        assert exc.value.status_code == 429
+        assert controller.queue_length == 0
+        ticket.release()
+
+    asyncio.run(scenario())
+    assert controller.active == 0
+
+
+def test_batch_weight_is_capped_by_limit():
+    controller = AdmissionController("test", max_concurrent=2, max_queue=1, timeout=1)
+
+    async def scenario():
+        ticket = await controller.acquire(weight=10)
+        assert ticket.weight == 2
+        ticket.release()
+        ticket.release()
+
+    asyncio.run(scenario())
+    assert controller.active == 0
+
+
+def test_photo_returns_429_when_overloaded(client, auth_headers, monkeypatch, test_image):
+    monkeypatch.setattr(detection_admission, "max_concurrent", 1)
+    monkeypatch.setattr(detection_admission, "max_queue", 0)
+    monkeypatch.setattr(detection_admission, "active", 1)
+
+    files = {"file": ("tree.jpg", test_image, "image/jpeg")}
+    response = client.post("/api/v1/analysis/photo", files=files, headers=auth_headers)
+    assert response.status_code == 429
+    assert "retry-after" in response.headers
+
+    response = client.get("/api/v1/analysis/demo")
+    assert response.status_code == 429
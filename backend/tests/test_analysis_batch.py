@@ -0,0 +1,125 @@
+# tests/test_analysis_batch.py
+import asyncio
+import io
+import json
+
+import pytest
+from fastapi import UploadFile
+from PIL import Image
+from starlette.datastructures import Headers
+
+from app.api.endpoints.analysis import analyze_batch
+from app.core.config import settings
+from app.core.storage import get_storage
+from app.models.database import HarvestRecord, StoredObject
+
+
+def jpeg_variant(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (160, 120), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def mock_storage(mocker):
+    mocker.patch(
+        "app.core.storage.StorageService.upload_bytes",
+        side_effect=lambda data, filename, content_type, folder, key=None: key,
+    )
+    mocker.patch(
+        "app.core.storage.StorageService.get_presigned_url",
+        return_value="http://mock-s3/image.jpg",
+    )
+
+
+def parse_ndjson(text):
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def test_batch_streams_result_per_file(client, auth_headers, db_session, mock_storage, test_image):
+    files = [
+        ("files", ("row1_tree1.jpg", test_image, "image/jpeg")),
+        ("files", ("row1_tree2.jpg", test_image, "image/jpeg")),
+        ("files", ("notes.txt", b"not an image", "text/plain")),
+    ]
+    response = client.post(
+        "/api/v1/analysis/batch?fruit_type=apple",
+        files=files,
+        data={"tree_ids": ["11", "12", "13"]},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = parse_ndjson(response.text)
+    results = [line for line in lines if line["type"] == "result"]
+    errors = [line for line in lines if line["type"] == "error"]
+    saved = [r for line in lines if line["type"] == "records" for r in line["records"]]
+    summary = lines[-1]
+
+    assert len(results) == 2
+    assert {r["tree_id"] for r in results} == {11, 12}
+    assert errors[0]["filename"] == "notes.txt"
+    assert summary == {"type": "summary", "total": 3, "succeeded": 2, "failed": 1}
+
+    records = (
+        db_session.query(HarvestRecord)
+        .filter(HarvestRecord.id.in_([r["record_id"] for r in saved]))
+        .all()
+    )
+    assert sorted(r.tree_id for r in records) == [11, 12]
+
+
+def test_batch_rejects_mismatched_tree_ids(client, auth_headers, mock_storage, test_image):
+    files = [
+        ("files", ("a.jpg", test_image, "image/jpeg")),
+        ("files", ("b.jpg", test_image, "image/jpeg")),
+    ]
+    response = client.post(
+        "/api/v1/analysis/batch",
+        files=files,
+        data={"tree_ids": ["1"]},
+        headers=auth_headers,
+    )
+    assert response.status_code == 400
+
+
+async def test_disconnect_keeps_references_consistent(
+    db_session, test_user, test_image, monkeypatch
+):
+    """Клиент ушёл после первой строки: ссылки на изображения не утекают"""
+    monkeypatch.setattr(settings, "BATCH_INSERT_CHUNK", 100)
+    images = [test_image, jpeg_variant((200, 20, 20)), jpeg_variant((20, 20, 200))]
+    files = [
+        UploadFile(
+            file=io.BytesIO(data),
+            filename=f"tree{i}.jpg",
+            headers=Headers({"content-type": "image/jpeg"}),
+        )
+        for i, data in enumerate(images)
+    ]
+    response = await analyze_batch(
+        files=files,
+        tree_ids=[],
+        fruit_type="apple",
+        garden_id=None,
+        db=db_session,
+        current_user=test_user,
+        storage=get_storage(),
+    )
+    stream = response.body_iterator
+    first = json.loads(await stream.__anext__())
+    assert first["type"] == "result"
+    await stream.aclose()
+    # Прерванные задачи снимают свои ссылки уже после закрытия потока
+    await asyncio.sleep(0.5)
+
+    objects = db_session.query(StoredObject).all()
+    assert objects
+    for obj in objects:
+        records = (
+            db_session.query(HarvestRecord)
+            .filter(HarvestRecord.image_path == obj.key)
+            .count()
+        )
+        assert obj.ref_count == records >= 1
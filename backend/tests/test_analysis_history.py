@@ -0,0 +1,81 @@
+# tests/test_analysis_history.py
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.models.database import Garden, HarvestRecord
+
+
+@pytest.fixture
+def history_records(db_session, test_user):
+    """Пять записей в двух садах, две из них с одинаковой датой"""
+    gardens = [
+        Garden(name="Северный", location="North", area=1, fruit_type="apple"),
+        Garden(name="Южный", location="South", area=1, fruit_type="pear"),
+    ]
+    db_session.add_all(gardens)
+    db_session.commit()
+
+    base = datetime(2025, 9, 1, 12, 0)
+    dates = [base, base + timedelta(days=1), base + timedelta(days=1), base + timedelta(days=2), base + timedelta(days=3)]
+    records = [
+        HarvestRecord(
+            user_id=test_user.id,
+            garden_id=gardens[i % 2].id,
+            fruit_count=i,
+            harvest_date=date,
+        )
+        for i, date in enumerate(dates)
+    ]
+    db_session.add_all(records)
+    db_session.commit()
+    return records
+
+
+def count_queries(db_session):
+    statements = []
+    engine = db_session.get_bind().engine
+
+    def before_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_execute)
+    return statements, lambda: event.remove(engine, "before_cursor_execute", before_execute)
+
+
+def test_history_keyset_pagination(client, auth_headers, history_records):
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        data = client.get("/api/v1/analysis/history", params=params, headers=auth_headers).json()
+        seen.extend(item["id"] for item in data["analyses"])
+        cursor = data["next_cursor"]
+        assert data["has_more"] == (cursor is not None)
+        if not cursor:
+            break
+
+    expected = sorted(
+        history_records, key=lambda r: (r.harvest_date, r.id), reverse=True
+    )
+    assert seen == [r.id for r in expected]
+
+
+def test_history_resolves_garden_names_in_one_query(client, auth_headers, history_records, db_session):
+    statements, stop = count_queries(db_session)
+    try:
+        data = client.get("/api/v1/analysis/history", headers=auth_headers).json()
+    finally:
+        stop()
+
+    assert {item["garden_name"] for item in data["analyses"]} == {"Северный", "Южный"}
+    garden_queries = [s for s in statements if "gardens" in s]
+    assert len(garden_queries) == 1
+
+
+def test_history_invalid_cursor(client, auth_headers):
+    response = client.get("/api/v1/analysis/history?cursor=not-a-cursor", headers=auth_headers)
+    assert response.status_code == 400
@@ -0,0 +1,169 @@
+# tests/test_analysis_jobs.py
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import AnalysisJob, Base, HarvestRecord, StoredObject
+from app.services.analysis_jobs import analysis_jobs
+
+
+@pytest.fixture
+def job_queue(db_session, tmp_path, monkeypatch, mocker):
+    """Направляет воркеры задач в тестовую БД и мокает S3"""
+    monkeypatch.setattr(
+        analysis_jobs, "session_factory", sessionmaker(bind=db_session.get_bind())
+    )
+    monkeypatch.setattr(analysis_jobs, "spool_dir", str(tmp_path))
+    mocker.patch(
+        "app.core.storage.StorageService.upload_bytes",
+        return_value="users/1/analysis/mock.jpg",
+    )
+    mocker.patch(
+        "app.core.storage.StorageService.get_presigned_url",
+        return_value="http://mock-s3/mock.jpg",
+    )
+    return analysis_jobs
+
+
+def wait_for_job(client, headers, job_id, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        data = client.get(f"/api/v1/analysis/jobs/{job_id}", headers=headers).json()
+        if data["status"] in ("done", "failed"):
+            return data
+        time.sleep(0.05)
+    pytest.fail(f"Задача {job_id} не завершилась за {timeout} секунд")
+
+
+def test_create_job_returns_202(job_queue, client, auth_headers, db_session, test_image):
+    files = {"file": ("tree.jpg", test_image, "image/jpeg")}
+    response = client.post(
+        "/api/v1/analysis/jobs?fruit_type=apple", files=files, headers=auth_headers
+    )
+    assert response.status_code == 202
+    data = response.json()
+    assert data["status"] == "queued"
+    assert response.headers["location"] == data["status_url"]
+
+    result = wait_for_job(client, auth_headers, data["job_id"])
+    assert result["status"] == "done"
+    assert result["progress"] == 100
+    assert result["result"]["image_url"] == "http://mock-s3/mock.jpg"
+
+    record = (
+        db_session.query(HarvestRecord)
+        .filter(HarvestRecord.id == result["record_id"])
+        .first()
+    )
+    assert record.image_path == "users/1/analysis/mock.jpg"
+    assert record.fruit_count == result["result"]["fruit_count"]
+
+
+def test_job_events_stream(job_queue, client, auth_headers, test_image):
+    files = {"file": ("tree.jpg", test_image, "image/jpeg")}
+    job_id = client.post(
+        "/api/v1/analysis/jobs", files=files, headers=auth_headers
+    ).json()["job_id"]
+    wait_for_job(client, auth_headers, job_id)
+
+    response = client.get(f"/api/v1/analysis/jobs/{job_id}/events", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        json.loads(line[len("data: "):])
+        for line in response.text.splitlines()
+        if line.startswith("data: ")
+    ]
+    assert events[-1]["status"] == "done"
+    assert "user_id" not in events[-1]
+
+
+def test_job_of_another_user_not_found(job_queue, client, auth_headers, admin_user, db_session):
+    job = AnalysisJob(id="foreignjob", user_id=admin_user.id, fruit_type="apple")
+    db_session.add(job)
+    db_session.commit()
+
+    response = client.get("/api/v1/analysis/jobs/foreignjob", headers=auth_headers)
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_recover_requeues_interrupted_jobs(job_queue, db_session, test_user):
+    stale = datetime.utcnow() - timedelta(hours=1)
+    db_session.add_all(
+        [
+            AnalysisJob(
+                id="running1",
+                user_id=test_user.id,
+                status="running",
+                stage="detecting",
+                updated_at=stale,
+            ),
+            # Аренду продлевает живой процесс - задачу не трогаем
+            AnalysisJob(id="running2", user_id=test_user.id, status="running", stage="detecting"),
+            AnalysisJob(id="finished1", user_id=test_user.id, status="done", stage="done"),
+        ]
+    )
+    db_session.commit()
+
+    recovered = job_queue._recover()
+    assert "running1" in recovered
+    assert "running2" not in recovered
+    assert "finished1" not in recovered
+    assert job_queue.get_snapshot("running1")["status"] == "queued"
+    assert job_queue.get_snapshot("running2")["status"] == "running"
+
+
+def test_job_is_claimed_once(job_queue, db_session, test_user):
+    db_session.add(AnalysisJob(id="claimed1", user_id=test_user.id))
+    db_session.commit()
+
+    first, second = job_queue.session_factory(), job_queue.session_factory()
+    assert job_queue._claim(first, "claimed1") is True
+    assert job_queue._claim(second, "claimed1") is False
+    first.close()
+    second.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_job_releases_image_and_input(job_queue, tmp_path, mocker, test_image):
+    # Отдельная БД: откат в воркере не должен откатывать подготовку теста
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    mocker.patch.object(job_queue, "session_factory", session_factory)
+    mocker.patch(
+        "app.core.storage.StorageService.upload_bytes",
+        side_effect=lambda data, filename, content_type, folder, key=None: key,
+    )
+    mocker.patch(
+        "app.services.analysis_jobs.build_analysis_result",
+        side_effect=RuntimeError("ошибка после детекции"),
+    )
+    input_path = tmp_path / "failing1"
+    input_path.write_bytes(test_image)
+    db = session_factory()
+    db.add(
+        AnalysisJob(
+            id="failing1",
+            user_id=1,
+            filename="tree.jpg",
+            content_type="image/jpeg",
+            input_path=str(input_path),
+        )
+    )
+    db.commit()
+
+    await job_queue.process("failing1")
+
+    job = db.query(AnalysisJob).filter(AnalysisJob.id == "failing1").one()
+    db.refresh(job)
+    assert job.status == "failed"
+    # Ссылка на изображение снята, запись индекса удалена
+    assert db.query(StoredObject).count() == 0
+    assert not input_path.exists()
+    db.close()
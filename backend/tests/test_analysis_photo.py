@@ -0,0 +1,53 @@
+# tests/test_analysis_photo.py
+import time
+
+from app.models.database import HarvestRecord
+from app.services.ai_service import ai_service
+
+
+def test_photo_record_uses_uploaded_key(client, auth_headers, db_session, mocker, test_image):
+    upload = mocker.patch(
+        "app.core.storage.StorageService.upload_bytes",
+        side_effect=lambda data, filename, content_type, folder, key=None: key,
+    )
+    mocker.patch(
+        "app.core.storage.StorageService.get_presigned_url",
+        return_value="http://mock-s3/stored.jpg",
+    )
+
+    files = {"file": ("tree.jpg", test_image, "image/jpeg")}
+    response = client.post("/api/v1/analysis/photo", files=files, headers=auth_headers)
+    assert response.status_code == 200
+
+    record = (
+        db_session.query(HarvestRecord)
+        .filter(HarvestRecord.id == response.json()["record_id"])
+        .first()
+    )
+    assert record.image_path == upload.call_args.kwargs["key"]
+    assert record.image_path.startswith("objects/")
+
+
+def test_photo_upload_overlaps_detection(client, auth_headers, mocker, test_image):
+    """Загрузка в хранилище идёт параллельно с детекцией"""
+
+    def slow_detection(image_bytes, expected_fruit="apple", cancel=None):
+        time.sleep(0.4)
+        return {"total_fruits": 1, "confidence": 0.9, "recommendations": "", "method": "test"}
+
+    def slow_upload(data, filename, content_type, folder, key=None):
+        time.sleep(0.4)
+        return key
+
+    mocker.patch.object(ai_service, "process_image", side_effect=slow_detection)
+    mocker.patch.object(ai_service, "process_frame", side_effect=slow_detection)
+    mocker.patch("app.core.storage.StorageService.upload_bytes", side_effect=slow_upload)
+    mocker.patch("app.core.storage.StorageService.get_presigned_url", return_value=None)
+
+    files = {"file": ("tree.jpg", test_image, "image/jpeg")}
+    started = time.perf_counter()
+    response = client.post("/api/v1/analysis/photo", files=files, headers=auth_headers)
+    elapsed = time.perf_counter() - started
+
+    assert response.status_code == 200
+    assert elapsed < 0.75
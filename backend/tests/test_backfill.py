@@ -0,0 +1,147 @@
+# tests/test_backfill.py
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import BackfillCheckpoint, HarvestRecord
+from app.services.ai_service import ai_service
+from app.services.backfill import DetectionBackfill, _Prefetcher
+
+
+class FakeStorage:
+    def __init__(self, objects):
+        self.objects = objects
+        self.downloads = []
+
+    def download_bytes(self, key):
+        self.downloads.append(key)
+        return self.objects[key]
+
+
+@pytest.fixture
+def backfill_setup(db_session, test_user, test_image):
+    storage = FakeStorage({"objects/aa/a.jpg": test_image, "objects/bb/b.jpg": test_image})
+    records = [
+        HarvestRecord(fruit_count=0, image_path="objects/aa/a.jpg", user_id=test_user.id),
+        HarvestRecord(fruit_count=0, image_path="objects/bb/b.jpg", user_id=test_user.id),
+        HarvestRecord(fruit_count=0, image_path="objects/aa/a.jpg", user_id=test_user.id),
+        HarvestRecord(fruit_count=0, image_path="objects/zz/missing.jpg", user_id=test_user.id),
+        HarvestRecord(fruit_count=0, image_path=None, user_id=test_user.id),
+        HarvestRecord(
+            fruit_count=7,
+            image_path="objects/bb/b.jpg",
+            detector_version=ai_service.version,
+            user_id=test_user.id,
+        ),
+    ]
+    db_session.add_all(records)
+    db_session.commit()
+
+    backfill = DetectionBackfill(
+        session_factory=sessionmaker(bind=db_session.get_bind()),
+        storage_factory=lambda: storage,
+    )
+    return backfill, storage, records
+
+
+def test_backfill_updates_outdated_records(db_session, backfill_setup):
+    backfill, storage, records = backfill_setup
+
+    stats = backfill.run(name="test", batch_size=2, workers=2, prefetch=2)
+
+    assert stats["status"] == "done"
+    assert stats["processed"] == 4
+    assert stats["updated"] == 3
+    assert stats["failed"] == 1
+    assert stats["records_per_second"] > 0
+    # Одно скачивание на ключ в пачке: a.jpg попал в две разные пачки
+    assert sorted(storage.downloads).count("objects/aa/a.jpg") == 2
+
+    db_session.expire_all()
+    for record in records[:3]:
+        assert record.detector_version == ai_service.version
+        assert record.revision == 2
+    assert records[3].detector_version is None
+    assert records[5].fruit_count == 7
+
+    checkpoint = db_session.query(BackfillCheckpoint).filter_by(name="test").one()
+    assert checkpoint.last_record_id == records[3].id
+
+
+def test_backfill_with_single_image_window(db_session, backfill_setup):
+    backfill, storage, records = backfill_setup
+
+    stats = backfill.run(name="window", batch_size=3, workers=2, prefetch=2, window=1)
+
+    assert stats["status"] == "done"
+    assert stats["updated"] == 3
+    assert stats["failed"] == 1
+
+
+def test_prefetch_is_bounded_by_window():
+    storage = FakeStorage({f"objects/{i}.jpg": b"x" for i in range(10)})
+    downloader = ThreadPoolExecutor(max_workers=4)
+    prefetcher = _Prefetcher(downloader, storage, window=3)
+
+    prefetcher.add(f"objects/{i}.jpg" for i in range(10))
+    downloader.shutdown(wait=True)
+    # Скачано только окно, хотя потоков больше
+    assert storage.downloads == [f"objects/{i}.jpg" for i in range(3)]
+
+    prefetcher.downloader = downloader = ThreadPoolExecutor(max_workers=4)
+    key, future = prefetcher.take()
+    assert key == "objects/0.jpg"
+    assert future.result() == b"x"
+    downloader.shutdown(wait=True)
+    # Забранный ключ освободил место для следующего
+    assert storage.downloads[-1] == "objects/3.jpg"
+    assert len(storage.downloads) == 4
+
+
+def test_backfill_resumes_from_checkpoint(db_session, backfill_setup):
+    backfill, storage, records = backfill_setup
+    executor = ThreadPoolExecutor(max_workers=2)
+
+    first = backfill.run(name="resume", batch_size=2, limit=2, executor=executor)
+    assert first["processed"] == 2
+    assert first["status"] == "running"
+
+    storage.downloads.clear()
+    second = backfill.run(name="resume", batch_size=2, executor=executor)
+    executor.shutdown()
+
+    assert second["processed"] == 2
+    assert second["status"] == "done"
+    assert "objects/bb/b.jpg" not in storage.downloads
+    assert backfill.get_checkpoint("resume")["processed"] == 4
+
+
+def test_backfill_endpoints_admin_only(client, auth_headers):
+    response = client.post("/api/v1/analysis/backfill", headers=auth_headers)
+    assert response.status_code == 403
+    response = client.get("/api/v1/analysis/backfill", headers=auth_headers)
+    assert response.status_code == 403
+
+
+def test_failed_records_are_retried(db_session, backfill_setup, test_image):
+    backfill, storage, records = backfill_setup
+    executor = ThreadPoolExecutor(max_workers=2)
+
+    first = backfill.run(name="retry", batch_size=2, executor=executor)
+    assert first["failed"] == 1
+    checkpoint = backfill.get_checkpoint("retry")
+    assert checkpoint["last_record_id"] == records[3].id
+    assert checkpoint["pending_retry"] == 1
+
+    # Файл появился - следующий запуск повторяет пропущенную запись
+    storage.objects["objects/zz/missing.jpg"] = test_image
+    second = backfill.run(name="retry", batch_size=2, executor=executor)
+    executor.shutdown()
+
+    assert second["retried"] == 1 and second["processed"] == 0
+    checkpoint = backfill.get_checkpoint("retry")
+    assert checkpoint["pending_retry"] == 0
+    assert checkpoint["failed"] == 0 and checkpoint["updated"] == 4
+    db_session.expire_all()
+    assert records[3].detector_version == ai_service.version
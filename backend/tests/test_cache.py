@@ -0,0 +1,163 @@
+# tests/test_cache.py
+import asyncio
+import threading
+
+import pytest
+
+from app.core import cache as cache_module
+from app.core.cache import InMemoryCache, SingleFlight, single_flight
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемые монотонные часы"""
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_get_set_compatible():
+    cache = InMemoryCache(max_entries=10, max_bytes=10**6)
+    assert cache.get("missing") is None
+    cache.set("weather_1_2", {"temperature": 20.5}, ttl=60)
+    assert cache.get("weather_1_2") == {"temperature": 20.5}
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = InMemoryCache(max_entries=3, max_bytes=10**6)
+    for key in "abc":
+        cache.set(key, key)
+    cache.get("a")  # "a" теперь недавно использован
+    cache.set("d", "d")
+    assert cache.get("b") is None
+    assert [cache.get(k) for k in "acd"] == ["a", "c", "d"]
+    assert cache.stats()["evictions"] == 1
+
+    small = InMemoryCache(max_entries=100, max_bytes=3000)
+    for i in range(10):
+        small.set(str(i), b"x" * 1000)
+    assert small.stats()["bytes"] <= 3000
+    assert small.get("9") is not None and small.get("0") is None
+    # Значение больше лимита не кэшируется
+    small.set("huge", b"x" * 5000)
+    assert small.get("huge") is None
+
+
+def test_ttl_lazy_and_periodic_expiry(clock):
+    cache = InMemoryCache(max_entries=100, max_bytes=10**6, sweep_interval=30)
+    cache.set("short", 1, ttl=10)
+    cache.set("long", 2, ttl=100)
+    cache.set("stale", 3, ttl=10)
+
+    clock[0] += 11
+    assert cache.get("short") is None  # истекла при чтении
+    assert len(cache) == 2
+
+    clock[0] += 20  # прошёл sweep_interval: очистка при любой операции
+    cache.get("long")
+    assert len(cache) == 1
+    assert cache.stats()["expirations"] == 2
+
+    # Перезапись продлевает срок: старый элемент кучи не удаляет новую запись
+    cache.set("long", 4, ttl=100)
+    clock[0] += 80
+    assert cache.sweep() == 0
+    assert cache.get("long") == 4
+
+
+def test_thread_safety():
+    cache = InMemoryCache(max_entries=50, max_bytes=10**6)
+
+    def worker(n):
+        for i in range(2000):
+            cache.set(f"{n}-{i % 100}", i)
+            cache.get(f"{(n + 1) % 4}-{i % 100}")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats["entries"] <= 50
+    assert stats["hits"] + stats["misses"] == 8000
+
+
+async def test_single_flight_coalesces_concurrent_calls():
+    calls = []
+
+    @single_flight(key=lambda garden_id: f"stats_{garden_id}")
+    async def garden_stats(garden_id):
+        calls.append(garden_id)
+        await asyncio.sleep(0.05)
+        return {"garden_id": garden_id}
+
+    results = await asyncio.gather(*(garden_stats(i % 2) for i in range(10)))
+    assert sorted(calls) == [0, 1]
+    assert results[0] == {"garden_id": 0} and results[1] == {"garden_id": 1}
+    assert len(garden_stats.flight) == 0
+
+    # Следующий вызов после завершения - новое вычисление
+    await garden_stats(0)
+    assert len(calls) == 3
+
+
+async def test_single_flight_errors_and_cancellation():
+    flight = SingleFlight()
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("API недоступен")
+
+    results = await asyncio.gather(
+        *(flight.do("k", failing) for _ in range(3)), return_exceptions=True
+    )
+    assert len(calls) == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    first = asyncio.ensure_future(flight.do("k", slow))
+    second = asyncio.ensure_future(flight.do("k", slow))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "ok"
+
+
+async def test_weather_requests_coalesced(monkeypatch):
+    from app.services.weather_service import WeatherService
+
+    payload = {
+        "main": {"temp": 20.5, "feels_like": 19.0, "humidity": 60},
+        "weather": [{"description": "ясно", "icon": "01d"}],
+        "wind": {"speed": 2.5},
+    }
+    requests = []
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return payload
+
+    async def fake_get(*args, **kwargs):
+        requests.append(kwargs["params"])
+        await asyncio.sleep(0.05)
+        return Response()
+
+    services = [WeatherService() for _ in range(5)]
+    for service in services:
+        service.api_key = "test_key"
+        monkeypatch.setattr(service.client, "get", fake_get)
+    cache_module.cache.delete("weather_10.5_20.5")
+
+    results = await asyncio.gather(*(s.get_weather(10.5, 20.5) for s in services))
+    assert len(requests) == 1
+    assert all(r["temperature"] == 20.5 for r in results)
+    cache_module.cache.delete("weather_10.5_20.5")
@@ -0,0 +1,206 @@
+# tests/test_cache_backends.py
+import fnmatch
+import socketserver
+import threading
+import time
+
+import pytest
+
+from app.core import cache_backends
+from app.core.cache import InMemoryCache, create_cache
+from app.core.cache_backends import RedisCache, SQLiteCache
+from app.core.config import settings
+from app.core.serialization import SerializationError, packb, unpackb
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Команды Redis, которыми пользуется RedisCache, поверх словаря"""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            self.wfile.write(self.server.execute(args))
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeRedisHandler)
+        self.data = {}
+        self.commands = []
+
+    def _value(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key)
+            return None
+        return value
+
+    def execute(self, args):
+        command = args[0].upper()
+        self.commands.append(command)
+        if command == b"SET":
+            ttl = int(args[4]) / 1000 if len(args) > 4 else None
+            self.data[args[1]] = (args[2], ttl and time.monotonic() + ttl)
+            return b"+OK\r\n"
+        if command == b"MGET":
+            return b"*%d\r\n" % (len(args) - 1) + b"".join(
+                _bulk(self._value(key)) for key in args[1:]
+            )
+        if command == b"DEL":
+            removed = sum(self.data.pop(key, None) is not None for key in args[1:])
+            return b":%d\r\n" % removed
+        if command == b"SCAN":
+            pattern = args[args.index(b"MATCH") + 1].decode()
+            keys = [k for k in self.data if fnmatch.fnmatchcase(k.decode(), pattern)]
+            return b"*2\r\n" + _bulk(b"0") + b"*%d\r\n" % len(keys) + b"".join(
+                map(_bulk, keys)
+            )
+        return b"-ERR unknown command\r\n"
+
+
+def _bulk(value):
+    return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+@pytest.fixture
+def redis_url():
+    server = FakeRedisServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"redis://127.0.0.1:{server.server_address[1]}/0", server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        yield InMemoryCache(max_entries=100, max_bytes=10**6)
+    elif request.param == "sqlite":
+        backend = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+        yield backend
+        backend.close()
+    else:
+        url, _ = request.getfixturevalue("redis_url")
+        backend = RedisCache(url, prefix="test:")
+        yield backend
+        backend.close()
+
+
+def test_backend_contract(backend):
+    weather = {"temperature": 20.5, "humidity": 60, "description": "ясно"}
+    backend.set("weather_55.75_37.62", weather, ttl=60)
+    assert backend.get("weather_55.75_37.62") == weather
+    assert backend.get("missing") is None
+
+    backend.set_many({"a": 1, "b": [1, 2], "c": None}, ttl=60)
+    assert backend.get_many(["a", "b", "c", "missing"]) == {"a": 1, "b": [1, 2], "c": None}
+
+    backend.delete("a")
+    assert backend.get("a", "default") == "default"
+    backend.clear()
+    assert backend.get_many(["b", "weather_55.75_37.62"]) == {}
+
+
+def test_backend_ttl(backend):
+    backend.set("short", "value", ttl=0.05)
+    time.sleep(0.1)
+    assert backend.get("short") is None
+
+
+def test_sqlite_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    worker1, worker2 = SQLiteCache(path), SQLiteCache(path)
+    worker1.set("weather_1_2", {"temperature": 3.5})
+    assert worker2.get("weather_1_2") == {"temperature": 3.5}
+
+
+def test_sqlite_trims_to_max_entries(tmp_path):
+    backend = SQLiteCache(str(tmp_path / "cache.sqlite3"), max_entries=5)
+    backend.set_many({str(i): i for i in range(5)}, ttl=10)
+    backend.set_many({str(i): i for i in range(5, 10)}, ttl=100)
+    assert backend.sweep() == 5
+    assert sorted(backend.get_many(map(str, range(10)))) == ["5", "6", "7", "8", "9"]
+
+
+def test_redis_batches_and_shares(redis_url):
+    url, server = redis_url
+    worker1, worker2 = RedisCache(url, prefix="sg:"), RedisCache(url, prefix="sg:")
+    worker1.set_many({f"k{i}": i for i in range(10)}, ttl=60)
+    server.commands.clear()
+    assert worker2.get_many([f"k{i}" for i in range(10)]) == {f"k{i}": i for i in range(10)}
+    # Все ключи - одной командой MGET
+    assert server.commands == [b"MGET"]
+    assert unpackb(server.data[b"sg:k3"][0]) == 3
+
+
+async def test_backend_async_access(backend):
+    await backend.aset("weather_1_2", {"temperature": 3.5}, ttl=60)
+    assert await backend.aget("weather_1_2") == {"temperature": 3.5}
+    assert await backend.aget("missing", "default") == "default"
+
+
+def test_redis_unavailable_is_a_miss(monkeypatch):
+    backend = RedisCache("redis://127.0.0.1:1/0", timeout=0.2, retry_interval=60)
+    dials = []
+    create_connection = cache_backends.socket.create_connection
+    monkeypatch.setattr(
+        cache_backends.socket,
+        "create_connection",
+        lambda *args, **kwargs: dials.append(1) or create_connection(*args, **kwargs),
+    )
+    backend.set("key", "value")
+    assert backend.get("key") is None
+    # После отказа Redis не подключаемся заново на каждом обращении
+    assert len(dials) == 1
+
+
+def test_redis_unavailable_delete_and_clear_do_not_raise():
+    backend = RedisCache("redis://127.0.0.1:1/0", timeout=0.2, retry_interval=60)
+    backend.delete("key")
+    backend.clear()
+
+
+def test_corrupt_utf8_is_a_miss(redis_url, tmp_path):
+    corrupt = b"\xa2\xff\xfe"
+    with pytest.raises(SerializationError):
+        unpackb(corrupt)
+    with pytest.raises(SerializationError):
+        unpackb(b"\x81\x91\x01\x02")
+
+    url, server = redis_url
+    redis = RedisCache(url, prefix="sg:")
+    redis.set("good", 1)
+    server.data[b"sg:bad"] = (corrupt, None)
+    assert redis.get_many(["good", "bad"]) == {"good": 1}
+
+    sqlite = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    sqlite.set_many({"good": 1, "bad": 2})
+    sqlite._connection().execute("UPDATE cache SET value = ? WHERE key = 'bad'", [corrupt])
+    assert sqlite.get_many(["good", "bad"]) == {"good": 1}
+    sqlite.close()
+
+
+def test_create_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_SQLITE_PATH", str(tmp_path / "c.sqlite3"))
+    assert isinstance(create_cache("sqlite"), SQLiteCache)
+    assert isinstance(create_cache("memory"), InMemoryCache)
+    with pytest.raises(ValueError):
+        create_cache("memcached")
+
+
+def test_serialization_is_compact():
+    value = {"temperature": 20.5, "humidity": 60, "icon": "01d", "ok": True}
+    data = packb(value)
+    assert unpackb(data) == value
+    # Меньше JSON того же значения
+    assert len(data) < len('{"temperature":20.5,"humidity":60,"icon":"01d","ok":true}')
@@ -0,0 +1,97 @@
+# tests/test_cancellation.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.core.cancellation import ClientDisconnected, run_unless_disconnected
+from app.core.metrics import metrics
+from app.core.priority_executor import PriorityExecutor
+from app.services.ai_service import FruitDetectionService
+from app.services.improved_detector import DetectionCancelled, improved_detector
+
+
+class FakeRequest:
+    """Клиент, который отключается через disconnect_after секунд"""
+
+    def __init__(self, disconnect_after):
+        self.deadline = time.perf_counter() + disconnect_after
+
+    async def is_disconnected(self):
+        return time.perf_counter() >= self.deadline
+
+
+def test_detector_stops_between_stages(test_image):
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(DetectionCancelled):
+        improved_detector.detect(test_image, "apple", cancel=cancel)
+
+
+def test_disconnect_cancels_running_detection():
+    metrics.reset()
+    service = FruitDetectionService()
+    stopped = threading.Event()
+
+    def slow_detection(image_bytes, expected_fruit="apple", cancel=None):
+        # Имитация этапов детекции с точками прерывания
+        for _ in range(100):
+            if cancel.is_set():
+                stopped.set()
+                raise DetectionCancelled()
+            time.sleep(0.02)
+        return {"total_fruits": 0}
+
+    service.process_image = slow_detection
+
+    async def scenario():
+        with pytest.raises(ClientDisconnected):
+            await run_unless_disconnected(
+                FakeRequest(0.1),
+                service.process_image_async(b"image"),
+                "detection",
+                poll_interval=0.02,
+            )
+
+    asyncio.run(scenario())
+
+    assert stopped.wait(1)
+    assert metrics.get("detection_cancelled_total", {"stage": "running"}) == 1
+    assert metrics.get("analysis_cancelled_total", {"stage": "detection"}) == 1
+
+
+def test_disconnect_drops_queued_detection():
+    metrics.reset()
+    metrics.observe("detection_seconds", 1.5)
+    service = FruitDetectionService()
+    service.executor = PriorityExecutor(1, {"interactive": 1}, max_queue_age=60)
+    release = threading.Event()
+    calls = []
+
+    def detection(image_bytes, expected_fruit="apple", cancel=None):
+        calls.append(image_bytes)
+        release.wait(2)
+        return {"total_fruits": 0}
+
+    service.process_image = detection
+
+    async def scenario():
+        busy = asyncio.ensure_future(service.process_image_async(b"first"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ClientDisconnected):
+            await run_unless_disconnected(
+                FakeRequest(0.05),
+                service.process_image_async(b"second"),
+                "detection",
+                poll_interval=0.02,
+            )
+        release.set()
+        await busy
+
+    asyncio.run(scenario())
+    service.executor.shutdown()
+
+    assert calls == [b"first"]
+    assert metrics.get("detection_cancelled_total", {"stage": "queued"}) == 1
+    assert metrics.get("detection_cpu_seconds_saved_total") >= 1.5
@@ -0,0 +1,144 @@
+# tests/test_dedup.py
+import hashlib
+
+import pytest
+
+from app.core.metrics import metrics
+from app.core.storage import content_addressed_key, get_storage
+from app.models.database import HarvestRecord, StoredObject
+from app.repositories.object_repository import StoredObjectRepository
+from app.services.analysis_service import detect_and_store
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def storage_mocks(mocker):
+    upload = mocker.patch(
+        "app.core.storage.StorageService.upload_bytes",
+        side_effect=lambda data, filename, content_type, folder, key=None: key,
+    )
+    mocker.patch(
+        "app.core.storage.StorageService.get_presigned_url",
+        return_value="http://mock-s3/image.jpg",
+    )
+    delete = mocker.patch(
+        "app.core.storage.StorageService.delete_file", return_value=True
+    )
+    return upload, delete
+
+
+def upload_photo(client, headers, image):
+    files = {"file": ("tree.jpg", image, "image/jpeg")}
+    response = client.post("/api/v1/analysis/photo", files=files, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_same_image_is_uploaded_once(client, auth_headers, db_session, storage_mocks, test_image):
+    upload, _ = storage_mocks
+    metrics.reset()
+
+    first = upload_photo(client, auth_headers, test_image)
+    second = upload_photo(client, auth_headers, test_image)
+
+    assert upload.call_count == 1
+    assert second["fruit_count"] == first["fruit_count"]
+
+    records = (
+        db_session.query(HarvestRecord)
+        .filter(HarvestRecord.id.in_([first["record_id"], second["record_id"]]))
+        .all()
+    )
+    assert len({r.image_path for r in records}) == 1
+
+    stored = db_session.query(StoredObject).one()
+    assert stored.ref_count == 2
+
+    snapshot = metrics.snapshot()
+    assert snapshot["ratios"]["dedup_ratio"] == 0.5
+    assert snapshot["counters"]["dedup_detections_reused_total"] == 1
+
+
+def test_shared_image_deleted_with_last_reference(client, auth_headers, storage_mocks, test_image):
+    _, delete = storage_mocks
+    first = upload_photo(client, auth_headers, test_image)
+    second = upload_photo(client, auth_headers, test_image)
+
+    response = client.delete(f"/api/v1/analysis/{first['record_id']}", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["image_deleted"] is False
+    delete.assert_not_called()
+
+    response = client.delete(f"/api/v1/analysis/{second['record_id']}", headers=auth_headers)
+    assert response.json()["image_deleted"] is True
+    delete.assert_called_once()
+
+
+def test_metrics_requires_admin(client, auth_headers, admin_auth_headers):
+    assert client.get("/api/v1/metrics", headers=auth_headers).status_code == 403
+    response = client.get("/api/v1/metrics", headers=admin_auth_headers)
+    assert response.status_code == 200
+    assert "ratios" in response.json()
+
+
+def test_ref_count_updates_are_atomic(db_session):
+    """Счётчик меняется в БД, а не по устаревшей копии записи в сессии"""
+    other = TestingSessionLocal(bind=db_session.connection())
+    ours = StoredObjectRepository(db_session)
+    obj, existed = ours.acquire("a" * 64, "objects/aa/a.jpg", 10)
+    assert existed is False and obj.ref_count == 1
+
+    # Другой запрос взял ссылку, пока наша копия записи устарела
+    _, existed = StoredObjectRepository(other).acquire("a" * 64, "objects/aa/b.jpg", 10)
+    assert existed is True
+    assert ours.release("objects/aa/a.jpg") is False
+    assert ours.release("objects/aa/a.jpg") is True
+    assert db_session.query(StoredObject).count() == 0
+    other.close()
+
+
+def test_insert_race_keeps_callers_pending_work(db_session, test_user, mocker):
+    """Гонка вставки откатывает только точку сохранения, а не всю сессию"""
+    StoredObjectRepository(db_session).acquire("b" * 64, "objects/bb/b.jpg", 10)
+    record = HarvestRecord(user_id=test_user.id, fruit_count=1, image_path="x.jpg")
+    db_session.add(record)
+
+    repository = StoredObjectRepository(db_session)
+    increment = mocker.patch.object(
+        repository, "_increment", side_effect=[False, True]
+    )
+    # Запись «ещё не было» на момент UPDATE, но вставка упирается в уникальность
+    obj, existed = repository.acquire("b" * 64, "objects/bb/b.jpg", 10)
+    assert existed is True and increment.call_count == 2
+    assert record in db_session and record.id is not None
+
+
+async def test_reference_released_when_detection_fails(db_session, mocker, test_image):
+    mocker.patch(
+        "app.services.analysis_service.timed_detection",
+        side_effect=RuntimeError("детектор упал"),
+    )
+    storage = get_storage()
+    with pytest.raises(RuntimeError):
+        await detect_and_store(
+            db_session, storage, test_image, "tree.jpg", "image/jpeg", "apple", 1
+        )
+    assert db_session.query(StoredObject).count() == 0
+
+
+async def test_hit_on_unfinished_upload_uploads_itself(db_session, test_image):
+    """Первая загрузка того же файла не завершилась - копия загружается повторно"""
+    content_hash = hashlib.sha256(test_image).hexdigest()
+    key = content_addressed_key(content_hash, "tree.jpg")
+    # Ссылка первой загрузки уже взята, а файла ещё нет
+    obj, _ = StoredObjectRepository(db_session).acquire(content_hash, key, len(test_image))
+    assert obj.upload_status == "pending"
+
+    storage = get_storage()
+    _, _, stored_key = await detect_and_store(
+        db_session, storage, test_image, "tree.jpg", "image/jpeg", "apple", 1
+    )
+    assert stored_key == key
+    assert storage.exists(key)
+    db_session.refresh(obj)
+    assert obj.ref_count == 2 and obj.upload_status == "ready"
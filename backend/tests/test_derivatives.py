@@ -0,0 +1,65 @@
+# tests/test_derivatives.py
+import io
+
+import numpy as np
+from PIL import Image
+
+from app.core.storage import get_storage
+from app.models.database import HarvestRecord
+from app.services.ai_service import ai_service
+from app.services.derivatives import derivative_key, render_derivatives
+
+
+def test_render_derivatives_sizes():
+    frame = np.zeros((1500, 2000, 3), dtype=np.uint8)
+    rendered = render_derivatives(frame)
+
+    preview = Image.open(io.BytesIO(rendered["preview"]))
+    thumb = Image.open(io.BytesIO(rendered["thumb"]))
+    assert preview.format == thumb.format == "WEBP"
+    assert preview.size == (1280, 960)
+    assert thumb.size == (320, 240)
+
+
+def test_derivative_key():
+    assert derivative_key("objects/ab/abc.jpg", "thumb") == "objects/ab/abc.thumb.webp"
+
+
+def test_photo_analysis_stores_derivatives(client, auth_headers, db_session, test_image):
+    files = {"file": ("tree.jpg", test_image, "image/jpeg")}
+    response = client.post("/api/v1/analysis/photo", files=files, headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["thumbnail_url"] and data["preview_url"]
+
+    record = db_session.query(HarvestRecord).get(data["record_id"])
+    assert record.has_derivatives
+    storage = get_storage()
+    thumb = storage.download_bytes(derivative_key(record.image_path, "thumb"))
+    assert Image.open(io.BytesIO(thumb)).format == "WEBP"
+    assert len(thumb) < len(test_image)
+
+    # Список отдаёт миниатюру, а не оригинал
+    history = client.get("/api/v1/analysis/history", headers=auth_headers).json()
+    assert ".thumb.webp" in history["analyses"][0]["thumbnail_url"]
+
+    # Копии удаляются вместе с оригиналом
+    response = client.delete(f"/api/v1/analysis/{record.id}", headers=auth_headers)
+    assert response.status_code == 200
+    assert not storage.exists(record.image_path)
+    assert not storage.exists(derivative_key(record.image_path, "thumb"))
+    assert not storage.exists(derivative_key(record.image_path, "preview"))
+
+
+def test_derivatives_follow_exif_orientation():
+    """Снимок телефона: пиксели лежат на боку, Orientation=6 - повернуть на 90°"""
+    image = Image.new("RGB", (400, 200), (40, 120, 40))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", exif=exif)
+
+    frame = ai_service.decode_image(buffer.getvalue())
+    assert frame.shape[:2] == (400, 200)
+    thumb = Image.open(io.BytesIO(render_derivatives(frame)["thumb"]))
+    assert thumb.size == (160, 320)
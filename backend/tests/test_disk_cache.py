@@ -0,0 +1,118 @@
+# tests/test_disk_cache.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core import disk_cache
+from app.core.disk_cache import DiskCache
+from app.core.metrics import metrics
+from app.core.storage import StorageService
+from app.core.storage_backends import LocalBackend
+
+
+class SlowRemoteBackend(LocalBackend):
+    """Локальный бэкенд, который притворяется медленным S3"""
+
+    name = "remote"
+
+    def __init__(self, root):
+        super().__init__(root=root, fsync="none")
+        self.gets = 0
+        self._gets_lock = threading.Lock()
+
+    def get(self, key):
+        with self._gets_lock:
+            self.gets += 1
+        time.sleep(0.2)
+        return super().get(key)
+
+
+def test_lru_eviction_by_bytes(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=250)
+    cache.put("a", b"a" * 100)
+    cache.put("b", b"b" * 100)
+    assert cache.get("a") == b"a" * 100
+    cache.put("c", b"c" * 100)
+
+    # Вытеснен давно не читавшийся b
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.size == 200
+
+
+def test_corrupted_entry_is_a_miss(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=1000)
+    cache.put("a", b"original")
+    path, _ = next(iter(cache._entries.values()))
+    with open(path, "wb") as f:
+        f.write(b"tampered")
+
+    assert cache.get("a") is None
+    assert not os.path.exists(path)
+
+
+def test_index_survives_restart(tmp_path):
+    DiskCache(str(tmp_path / "cache"), max_bytes=1000).put("a", b"data")
+    assert DiskCache(str(tmp_path / "cache"), max_bytes=1000).get("a") == b"data"
+
+
+def test_invalidated_download_is_not_cached(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=1000)
+    generation = cache.generation("a")
+    cache.invalidate("a")
+    cache.put("a", b"stale", generation)
+    assert cache.get("a") is None
+
+
+def test_concurrent_reads_coalesce_into_one_download(tmp_path):
+    backend = SlowRemoteBackend(str(tmp_path / "remote"))
+    storage = StorageService(backend, DiskCache(str(tmp_path / "cache"), 10_000))
+    storage.put_bytes("objects/ab/abc.jpg", b"photo", "image/jpeg")
+    saved_before = metrics.snapshot()["counters"].get("disk_cache_bytes_saved_total", 0)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(storage.download_bytes, ["objects/ab/abc.jpg"] * 8))
+    assert results == [b"photo"] * 8
+    assert backend.gets == 1
+
+    # Повторное чтение - с диска, без обращения к бэкенду
+    assert storage.download_bytes("objects/ab/abc.jpg") == b"photo"
+    assert backend.gets == 1
+    saved = metrics.snapshot()["counters"]["disk_cache_bytes_saved_total"]
+    assert saved - saved_before >= len(b"photo")
+
+    # Удаление объекта сбрасывает кэш
+    storage.delete_file("objects/ab/abc.jpg")
+    assert storage.disk_cache.get("objects/ab/abc.jpg") is None
+
+
+def test_get_racing_with_put_keeps_new_entry(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=10_000)
+    cache.put("k", b"old")
+    real_open = open
+
+    def open_after_replace(path, *args, **kwargs):
+        # Параллельный put заменил файл между поиском записи и open
+        monkeypatch.undo()
+        cache.put("k", b"new")
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(disk_cache, "open", open_after_replace, raising=False)
+    assert cache.get("k") is None
+    assert cache.get("k") == b"new"
+
+
+def test_abandoned_tmp_files_removed_on_start(tmp_path):
+    root = tmp_path / "cache"
+    DiskCache(str(root), max_bytes=10_000)
+    abandoned = root / ".tmp" / "tmpabc"
+    abandoned.write_bytes(b"x" * 100)
+    old = time.time() - 3600
+    os.utime(abandoned, (old, old))
+    fresh = root / ".tmp" / "tmpdef"
+    fresh.write_bytes(b"y")
+
+    DiskCache(str(root), max_bytes=10_000)
+    assert not abandoned.exists()
+    assert fresh.exists()  # его может дописывать другой процесс
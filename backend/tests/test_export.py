@@ -0,0 +1,74 @@
+# tests/test_export.py
+import csv
+import io
+import json
+import zipfile
+
+import pytest
+
+from app.models.database import Garden, HarvestRecord
+
+
+@pytest.fixture
+def export_data(db_session, test_user, mocker, test_image):
+    garden = Garden(name="Северный", location="Ряд 1", area=1.5, fruit_type="apple")
+    db_session.add(garden)
+    db_session.commit()
+
+    records = [
+        HarvestRecord(fruit_count=5, garden_id=garden.id, image_path="objects/aa/a.jpg", user_id=test_user.id),
+        HarvestRecord(fruit_count=3, garden_id=garden.id, image_path="objects/zz/lost.jpg", user_id=test_user.id),
+        HarvestRecord(fruit_count=1, garden_id=garden.id, image_path=None, user_id=test_user.id),
+        HarvestRecord(fruit_count=9, garden_id=garden.id + 1, image_path="objects/bb/b.jpg", user_id=test_user.id),
+    ]
+    db_session.add_all(records)
+    db_session.commit()
+
+    objects = {"objects/aa/a.jpg": test_image, "objects/bb/b.jpg": test_image}
+    mocker.patch(
+        "app.core.storage.StorageService.download_bytes",
+        side_effect=lambda key: objects[key],
+    )
+    return garden, records
+
+
+def test_export_streams_zip_with_manifest(
+    client, manager_auth_headers, export_data, test_image
+):
+    garden, records = export_data
+    response = client.get(
+        f"/api/v1/analysis/export?garden_id={garden.id}", headers=manager_auth_headers
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    assert "attachment" in response.headers["content-disposition"]
+
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert archive.testzip() is None
+    assert sorted(archive.namelist()) == sorted(
+        ["manifest.csv", f"images/{records[0].id}.jpg", "errors.txt"]
+    )
+    assert archive.read(f"images/{records[0].id}.jpg") == test_image
+
+    rows = list(csv.DictReader(io.StringIO(archive.read("manifest.csv").decode("utf-8"))))
+    assert [int(r["id"]) for r in rows] == [r.id for r in records[:3]]
+    assert rows[0]["garden_name"] == "Северный"
+    assert "objects/zz/lost.jpg" in archive.read("errors.txt").decode("utf-8")
+
+
+def test_export_json_manifest(client, manager_auth_headers, export_data):
+    garden, records = export_data
+    response = client.get(
+        f"/api/v1/analysis/export?garden_id={garden.id}&manifest=json",
+        headers=manager_auth_headers,
+    )
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    manifest = json.loads(archive.read("manifest.json"))
+    assert [row["fruit_count"] for row in manifest] == [5, 3, 1]
+
+
+def test_export_requires_manager_and_filter(client, auth_headers, manager_auth_headers):
+    response = client.get("/api/v1/analysis/export?garden_id=1", headers=auth_headers)
+    assert response.status_code == 403
+    response = client.get("/api/v1/analysis/export", headers=manager_auth_headers)
+    assert response.status_code == 400
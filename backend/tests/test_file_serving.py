@@ -0,0 +1,100 @@
+# tests/test_file_serving.py
+import hashlib
+
+import pytest
+
+from app.core.responses import ZEROCOPY_EXTENSION, SendfileResponse, parse_range
+from app.core.storage import content_addressed_key, get_storage
+
+CONTENT = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def object_url():
+    storage = get_storage()
+    key = content_addressed_key(hashlib.sha256(CONTENT).hexdigest(), "tree.jpg")
+    storage.put_bytes(key, CONTENT, "image/jpeg")
+    return key, storage.get_presigned_url(key)
+
+
+def test_content_addressed_object_is_immutable(client, object_url):
+    key, url = object_url
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["etag"] == f'"{key.rsplit("/", 1)[1]}"'
+    assert "immutable" in response.headers["cache-control"]
+    assert response.headers["accept-ranges"] == "bytes"
+
+    # Повторный просмотр - 304 без тела
+    repeat = client.get(url, headers={"If-None-Match": response.headers["etag"]})
+    assert repeat.status_code == 304
+    assert repeat.content == b""
+    assert repeat.headers["etag"] == response.headers["etag"]
+
+
+def test_range_requests(client, object_url):
+    _, url = object_url
+    response = client.get(url, headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(CONTENT)}"
+    assert response.headers["content-length"] == "10"
+
+    response = client.get(url, headers={"Range": "bytes=-5"})
+    assert response.content == CONTENT[-5:]
+
+    response = client.get(url, headers={"Range": f"bytes={len(CONTENT)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+    # Файл изменился (другой ETag) - диапазон игнорируется, отдаётся целиком
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_mutable_object_etag_changes_on_overwrite(client):
+    storage = get_storage()
+    key = "users/1/uploads/tree.jpg"
+    storage.put_bytes(key, b"first", "image/jpeg")
+    url = storage.get_presigned_url(key)
+    first = client.get(url)
+    assert "immutable" not in first.headers["cache-control"]
+
+    storage.put_bytes(key, b"second", "image/jpeg")
+    url = storage.get_presigned_url(key)
+    second = client.get(url, headers={"If-None-Match": first.headers["etag"]})
+    assert second.status_code == 200
+    assert second.content == b"second"
+
+
+async def test_zerocopy_send_with_range(tmp_path):
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(CONTENT)
+    messages = []
+
+    async def send(message):
+        if message["type"] == ZEROCOPY_EXTENSION:
+            file = message["file"]
+            file.seek(message["offset"])
+            message = {**message, "data": file.read(message["count"])}
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [(b"range", b"bytes=100-199")],
+        "extensions": {ZEROCOPY_EXTENSION: {}},
+    }
+    await SendfileResponse(str(path), media_type="image/jpeg")(scope, None, send)
+    assert messages[0]["status"] == 206
+    assert messages[1]["data"] == CONTENT[100:200]
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-", 10) == (0, 9)
+    assert parse_range("bytes=5-100", 10) == (5, 9)
+    assert parse_range("bytes=0-1,4-5", 10) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=5-2", 10)
@@ -0,0 +1,63 @@
+# tests/test_presigned_urls.py
+import pytest
+
+from app.core.config import settings
+from app.core.storage import StorageService
+from app.core.storage_backends import LocalBackend
+from app.models.database import HarvestRecord
+
+
+@pytest.fixture
+def storage(tmp_path, mocker):
+    service = StorageService(LocalBackend(root=str(tmp_path / "store")))
+    mocker.spy(service.backend, "presigned_url")
+    return service
+
+
+def test_url_is_reused_within_lifetime_fraction(storage, mocker, monkeypatch):
+    monkeypatch.setattr(settings, "PRESIGNED_URL_REUSE_FRACTION", 0.5)
+    clock = mocker.patch("app.core.storage.time.monotonic", return_value=1000.0)
+
+    first = storage.get_presigned_url("users/1/a.jpg", expires_in=3600)
+    clock.return_value = 1000.0 + 1700
+    assert storage.get_presigned_url("users/1/a.jpg", expires_in=3600) == first
+    assert storage.backend.presigned_url.call_count == 1
+
+    # Прошла половина срока - ссылка подписывается заново
+    clock.return_value = 1000.0 + 1801
+    storage.get_presigned_url("users/1/a.jpg", expires_in=3600)
+    assert storage.backend.presigned_url.call_count == 2
+
+
+def test_batch_signs_only_missing_keys(storage):
+    keys = [f"users/1/{i}.jpg" for i in range(500)]
+    storage.get_presigned_urls(keys[:100])
+    urls = storage.get_presigned_urls(keys + keys[:10])
+
+    assert set(urls) == set(keys)
+    assert storage.backend.presigned_url.call_count == 500
+
+
+def test_cache_is_bounded_and_invalidated_on_delete(storage, monkeypatch):
+    monkeypatch.setattr(settings, "PRESIGNED_URL_CACHE_SIZE", 3)
+    storage.get_presigned_urls(["a.jpg", "b.jpg", "c.jpg", "d.jpg"])
+    assert list(storage._urls) == ["b.jpg", "c.jpg", "d.jpg"]
+
+    storage.delete_file("c.jpg")
+    assert "c.jpg" not in storage._urls
+
+
+def test_history_returns_signed_image_urls(client, auth_headers, db_session, test_user):
+    db_session.add_all(
+        [
+            HarvestRecord(user_id=test_user.id, fruit_count=1, image_path="users/1/a.jpg"),
+            HarvestRecord(user_id=test_user.id, fruit_count=2, image_path=None),
+        ]
+    )
+    db_session.commit()
+
+    response = client.get("/api/v1/analysis/history", headers=auth_headers)
+    assert response.status_code == 200
+    urls = {item["fruit_count"]: item["image_url"] for item in response.json()["analyses"]}
+    assert urls[1].startswith("/api/v1/files/users/1/a.jpg?")
+    assert urls[2] is None
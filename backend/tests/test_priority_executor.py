@@ -0,0 +1,89 @@
+# tests/test_priority_executor.py
+import threading
+import time
+
+from app.core.metrics import metrics
+from app.core.priority_executor import PriorityExecutor
+
+
+def run_blocked(executor, submit):
+    """Занимает единственный поток, ставит задачи в очередь и отпускает пул"""
+    release = threading.Event()
+    order = []
+    executor.submit_to("interactive", release.wait, 2)
+    time.sleep(0.05)
+    futures = submit(order)
+    release.set()
+    for future in futures:
+        future.result(timeout=2)
+    return order
+
+
+def test_interactive_gets_larger_share():
+    executor = PriorityExecutor(1, {"interactive": 4, "bulk": 1}, max_queue_age=60)
+
+    def submit(order):
+        futures = [executor.submit_to("bulk", order.append, f"b{i}") for i in range(6)]
+        futures += [
+            executor.submit_to("interactive", order.append, f"i{i}") for i in range(4)
+        ]
+        return futures
+
+    order = run_blocked(executor, submit)
+    executor.shutdown()
+
+    # Все интерактивные задачи проходят раньше, чем половина фоновых
+    last_interactive = max(order.index(f"i{i}") for i in range(4))
+    assert last_interactive < order.index("b3")
+    assert sorted(order) == sorted([f"b{i}" for i in range(6)] + [f"i{i}" for i in range(4)])
+
+
+def test_ageing_prevents_bulk_starvation():
+    metrics.reset()
+    executor = PriorityExecutor(1, {"interactive": 100, "bulk": 1}, max_queue_age=0.05)
+
+    def submit(order):
+        futures = [executor.submit_to("bulk", order.append, "bulk")]
+        time.sleep(0.1)
+        futures += [
+            executor.submit_to("interactive", order.append, f"i{i}") for i in range(5)
+        ]
+        return futures
+
+    order = run_blocked(executor, submit)
+    executor.shutdown()
+
+    assert order[0] == "bulk"
+    assert metrics.get("detection_aged_total", {"class": "bulk"}) >= 1
+    assert metrics.average("detection_queue_seconds", {"class": "bulk"}) >= 0.05
+
+
+def test_cancelled_task_is_skipped():
+    executor = PriorityExecutor(1, {"interactive": 1, "bulk": 1}, max_queue_age=60)
+    release = threading.Event()
+    calls = []
+    executor.submit(release.wait, 2)
+    time.sleep(0.05)
+    queued = executor.submit_to("bulk", calls.append, "bulk")
+    assert queued.cancel()
+    release.set()
+    executor.shutdown()
+    assert calls == []
+
+
+def test_aged_backlog_does_not_block_interactive():
+    """Состарившаяся пачка фоновых задач не выполняется целиком раньше интерактивной"""
+    executor = PriorityExecutor(1, {"interactive": 4, "bulk": 1}, max_queue_age=0.05)
+
+    def submit(order):
+        futures = [executor.submit_to("bulk", order.append, f"b{i}") for i in range(100)]
+        time.sleep(0.1)
+        futures.append(executor.submit_to("interactive", order.append, "i"))
+        return futures
+
+    order = run_blocked(executor, submit)
+    executor.shutdown()
+
+    # Вне очереди успевает пройти не больше одной фоновой задачи
+    assert order.index("i") <= 1
+    assert len(order) == 101
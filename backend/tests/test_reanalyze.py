@@ -0,0 +1,98 @@
+# tests/test_reanalyze.py
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from app.core.storage import StorageService
+from app.models.database import HarvestRecord, upgrade_schema
+from app.services.ai_service import ai_service
+from app.services.frame_cache import frame_cache
+
+
+@pytest.fixture
+def stored_objects(mocker):
+    """Хранилище в памяти вместо S3"""
+    objects = {}
+
+    def upload(data, filename, content_type, folder, key=None):
+        objects[key] = data
+        return key
+
+    mocker.patch("app.core.storage.StorageService.upload_bytes", side_effect=upload)
+    mocker.patch(
+        "app.core.storage.StorageService.download_bytes",
+        side_effect=lambda key: objects[key],
+    )
+    mocker.patch(
+        "app.core.storage.StorageService.get_presigned_url",
+        return_value="http://mock-s3/image.jpg",
+    )
+    frame_cache.clear()
+    yield objects
+    frame_cache.clear()
+
+
+def test_reanalyze_reuses_cached_frame(
+    client, auth_headers, db_session, stored_objects, mocker, test_image
+):
+    files = {"file": ("tree.jpg", test_image, "image/jpeg")}
+    response = client.post(
+        "/api/v1/analysis/photo?fruit_type=apple", files=files, headers=auth_headers
+    )
+    record_id = response.json()["record_id"]
+
+    decode = mocker.spy(ai_service, "decode_image")
+    for fruit_type in ("cherry", "plum"):
+        response = client.post(
+            f"/api/v1/analysis/{record_id}/reanalyze?fruit_type={fruit_type}",
+            headers=auth_headers,
+        )
+        assert response.status_code == 200
+
+    data = response.json()
+    assert data["record_id"] == record_id
+    assert data["revision"] == 3
+    assert data["detector_version"] == ai_service.version
+
+    # Скачивание и декодирование - только при первом повторном анализе
+    assert StorageService.download_bytes.call_count == 1
+    assert decode.call_count == 1
+
+    record = db_session.query(HarvestRecord).filter(HarvestRecord.id == record_id).first()
+    db_session.refresh(record)
+    assert record.fruit_type == "plum"
+    assert record.fruit_count == data["fruit_count"]
+
+
+def test_reanalyze_foreign_record_not_found(
+    client, auth_headers, db_session, test_admin, stored_objects
+):
+    record = HarvestRecord(
+        fruit_count=1, fruit_type="apple", image_path="objects/ab/abc.jpg",
+        user_id=test_admin.id,
+    )
+    db_session.add(record)
+    db_session.commit()
+
+    response = client.post(
+        f"/api/v1/analysis/{record.id}/reanalyze", headers=auth_headers
+    )
+    assert response.status_code == 404
+
+
+def test_upgrade_schema_adds_missing_columns():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE harvest_records (id INTEGER PRIMARY KEY, "
+                "fruit_count INTEGER NOT NULL, user_id INTEGER, harvest_date DATETIME)"
+            )
+        )
+        conn.execute(text("INSERT INTO harvest_records (fruit_count) VALUES (3)"))
+
+    upgrade_schema(engine)
+
+    columns = {c["name"] for c in inspect(engine).get_columns("harvest_records")}
+    assert {"detector_version", "revision", "image_path"} <= columns
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT fruit_count FROM harvest_records")).scalar() == 3
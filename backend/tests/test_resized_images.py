@@ -0,0 +1,88 @@
+# tests/test_resized_images.py
+import asyncio
+import io
+import time
+
+from PIL import Image
+
+from app.core.disk_cache import DiskCache
+from app.core.metrics import metrics
+from app.core.storage import get_storage
+from app.services import image_resizer
+from app.services.image_resizer import ImageResizer
+
+
+def jpeg(size=(2000, 1500)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (40, 120, 40)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_resize_follows_exif_orientation():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # пиксели на боку: 2000x1500, показывается 1500x2000
+    buffer = io.BytesIO()
+    Image.new("RGB", (2000, 1500), (40, 120, 40)).save(buffer, format="JPEG", exif=exif)
+    resized = image_resizer.resize_image(buffer.getvalue(), 300, None, "jpeg")
+    assert Image.open(io.BytesIO(resized)).size == (300, 400)
+
+
+def test_resized_is_cached(client, auth_headers, test_user):
+    key = f"users/{test_user.id}/uploads/tree.jpg"
+    get_storage().put_bytes(key, jpeg(), "image/jpeg")
+    url = f"/api/v1/files/{key}/resized"
+    rendered = metrics.get("resize_rendered_total")
+
+    response = client.get(url, params={"w": 400}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert Image.open(io.BytesIO(response.content)).size == (400, 300)
+
+    # Повтор берётся из кэша, с тем же ETag - 304
+    again = client.get(
+        url,
+        params={"w": 400},
+        headers={**auth_headers, "If-None-Match": response.headers["etag"]},
+    )
+    assert again.status_code == 304
+    assert metrics.get("resize_rendered_total") == rendered + 1
+
+    response = client.get(url, params={"h": 100, "fmt": "jpeg"}, headers=auth_headers)
+    image = Image.open(io.BytesIO(response.content))
+    assert (image.format, image.size) == ("JPEG", (133, 100))
+
+
+def test_resized_access_and_validation(client, auth_headers, test_user):
+    key = "users/999/uploads/tree.jpg"
+    get_storage().put_bytes(key, jpeg(), "image/jpeg")
+    response = client.get(f"/api/v1/files/{key}/resized?w=100", headers=auth_headers)
+    assert response.status_code == 404
+
+    own = f"users/{test_user.id}/uploads/tree.jpg"
+    response = client.get(f"/api/v1/files/{own}/resized", headers=auth_headers)
+    assert response.status_code == 422
+    response = client.get(f"/api/v1/files/{own}/resized?w=100", headers=auth_headers)
+    assert response.status_code == 404
+
+
+async def test_concurrent_requests_are_coalesced(tmp_path, monkeypatch):
+    storage = get_storage()
+    storage.put_bytes("users/1/uploads/tree.jpg", jpeg(), "image/jpeg")
+    calls = []
+    original = image_resizer.resize_image
+
+    def slow_resize(*args):
+        calls.append(args[1:])
+        time.sleep(0.1)
+        return original(*args)
+
+    monkeypatch.setattr(image_resizer, "resize_image", slow_resize)
+    resizer = ImageResizer(DiskCache(str(tmp_path / "cache"), 10**7))
+    results = await asyncio.gather(
+        *(
+            resizer.resized(storage, "users/1/uploads/tree.jpg", 200, None, "webp")
+            for _ in range(5)
+        )
+    )
+    assert calls == [(200, None, "webp")]
+    assert len(set(results)) == 1
@@ -0,0 +1,107 @@
+# tests/test_resumable_uploads.py
+import base64
+import hashlib
+import os
+import time
+
+from app.core.config import settings
+from app.core.storage import get_storage
+from app.models.database import HarvestRecord
+from app.services.resumable_uploads import resumable_uploads
+
+
+def create_upload(client, auth_headers, length, filename="tree.jpg", filetype="image/jpeg"):
+    metadata = ",".join(
+        f"{name} {base64.b64encode(value.encode()).decode()}"
+        for name, value in (("filename", filename), ("filetype", filetype))
+    )
+    return client.post(
+        "/api/v1/uploads",
+        headers={**auth_headers, "Upload-Length": str(length), "Upload-Metadata": metadata},
+    )
+
+
+def patch(client, auth_headers, upload_id, offset, data):
+    return client.patch(
+        f"/api/v1/uploads/{upload_id}",
+        content=data,
+        headers={
+            **auth_headers,
+            "Upload-Offset": str(offset),
+            "Content-Type": "application/offset+octet-stream",
+        },
+    )
+
+
+def test_resume_after_interrupted_upload(client, auth_headers):
+    content = os.urandom(300 * 1024)
+    response = create_upload(client, auth_headers, len(content))
+    assert response.status_code == 201
+    upload_id = response.json()["id"]
+    assert response.headers["Location"] == f"/api/v1/uploads/{upload_id}"
+
+    response = patch(client, auth_headers, upload_id, 0, content[:100_000])
+    assert response.status_code == 204
+    assert response.headers["Upload-Offset"] == "100000"
+
+    # Клиент потерял связь и узнаёт, с какого места продолжать
+    response = client.head(f"/api/v1/uploads/{upload_id}", headers=auth_headers)
+    assert response.headers["Upload-Offset"] == "100000"
+    assert response.headers["Upload-Length"] == str(len(content))
+
+    response = patch(client, auth_headers, upload_id, 0, content)
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == "100000"
+
+    # Завершить незаконченную загрузку нельзя
+    response = client.post(f"/api/v1/uploads/{upload_id}/file", headers=auth_headers)
+    assert response.status_code == 409
+
+    assert patch(client, auth_headers, upload_id, 100_000, content[100_000:]).status_code == 204
+    response = client.post(f"/api/v1/uploads/{upload_id}/file", headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["sha256"] == hashlib.sha256(content).hexdigest()
+    assert get_storage().download_bytes(data["key"]) == content
+
+    response = client.head(f"/api/v1/uploads/{upload_id}", headers=auth_headers)
+    assert response.status_code == 404
+
+
+def test_finish_into_analysis(client, auth_headers, db_session, test_image):
+    upload_id = create_upload(client, auth_headers, len(test_image)).json()["id"]
+    assert patch(client, auth_headers, upload_id, 0, test_image).status_code == 204
+
+    response = client.post(
+        f"/api/v1/analysis/uploads/{upload_id}?fruit_type=apple", headers=auth_headers
+    )
+    assert response.status_code == 200
+    record = db_session.query(HarvestRecord).get(response.json()["record_id"])
+    assert get_storage().download_bytes(record.image_path) == test_image
+    assert os.listdir(resumable_uploads.root) == []
+
+
+def test_limits(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE", 1000)
+    assert create_upload(client, auth_headers, 1001).status_code == 413
+    assert create_upload(client, auth_headers, 10, filetype="text/plain").status_code == 400
+
+    upload_id = create_upload(client, auth_headers, 10).json()["id"]
+    assert patch(client, auth_headers, upload_id, 0, b"x" * 11).status_code == 413
+    response = client.head(f"/api/v1/uploads/{upload_id}", headers=auth_headers)
+    assert response.headers["Upload-Offset"] == "0"
+
+
+def test_abandoned_uploads_expire(client, auth_headers, test_user):
+    upload_id = create_upload(client, auth_headers, 100).json()["id"]
+    assert patch(client, auth_headers, upload_id, 0, b"x" * 50).status_code == 204
+    live_id = create_upload(client, auth_headers, 100).json()["id"]
+
+    upload = resumable_uploads.get(upload_id, test_user.id)
+    upload.expires = time.time() - 1
+    resumable_uploads._save(upload)
+
+    assert resumable_uploads.expire() == 1
+    assert sorted(os.listdir(resumable_uploads.root)) == [f"{live_id}.json", f"{live_id}.part"]
+    response = client.head(f"/api/v1/uploads/{upload_id}", headers=auth_headers)
+    assert response.status_code == 404
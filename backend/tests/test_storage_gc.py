@@ -0,0 +1,95 @@
+# tests/test_storage_gc.py
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.core.storage import get_storage
+from app.models.database import HarvestRecord
+from app.services.storage_gc import StorageGarbageCollector
+
+
+@pytest.fixture
+def gc_setup(db_session, test_user):
+    storage = get_storage()
+    objects = {
+        "objects/aa/a.jpg": b"a" * 100,
+        "objects/aa/a.thumb.webp": b"t" * 10,
+        "objects/bb/b.jpg": b"b" * 200,
+        "objects/bb/b.thumb.webp": b"t" * 20,
+        "users/1/analysis/x.jpg": b"x" * 300,
+        # Загрузки через /files/upload сборщик не трогает
+        "users/1/uploads/u.jpg": b"u" * 400,
+    }
+    for key, data in objects.items():
+        storage.put_bytes(key, data, "image/jpeg")
+
+    db_session.add(
+        HarvestRecord(fruit_count=1, image_path="objects/aa/a.jpg", user_id=test_user.id)
+    )
+    db_session.commit()
+
+    gc = StorageGarbageCollector(
+        session_factory=sessionmaker(bind=db_session.get_bind()),
+        storage_factory=get_storage,
+    )
+    return gc, storage
+
+
+def test_dry_run_reports_without_deleting(gc_setup):
+    gc, storage = gc_setup
+
+    report = gc.run(dry_run=True, min_age=0)
+
+    assert report["orphans"] == 3
+    assert report["deleted"] == 0
+    assert report["bytes_reclaimed"] == 520
+    assert sorted(report["sample"]) == [
+        "objects/bb/b.jpg",
+        "objects/bb/b.thumb.webp",
+        "users/1/analysis/x.jpg",
+    ]
+    assert storage.exists("objects/bb/b.jpg")
+
+
+def test_deletes_orphans_in_batches(gc_setup, mocker):
+    gc, storage = gc_setup
+    delete_many = mocker.spy(storage.backend, "delete_many")
+
+    report = gc.run(min_age=0, batch_size=2, deletes_per_second=0)
+
+    assert report["deleted"] == 3
+    assert report["bytes_reclaimed"] == 520
+    assert all(len(call.args[0]) <= 2 for call in delete_many.call_args_list)
+    assert not storage.exists("objects/bb/b.jpg")
+    assert not storage.exists("users/1/analysis/x.jpg")
+    assert storage.exists("objects/aa/a.jpg")
+    assert storage.exists("objects/aa/a.thumb.webp")
+    assert storage.exists("users/1/uploads/u.jpg")
+
+
+def test_recent_objects_are_kept(gc_setup):
+    gc, storage = gc_setup
+
+    report = gc.run(min_age=3600)
+
+    assert report["orphans"] == 0
+    assert storage.exists("objects/bb/b.jpg")
+
+
+def test_derivatives_of_reacquired_original_are_kept(gc_setup, db_session, test_user, mocker):
+    """Оригинал снова получил ссылку во время прохода - его копии не удаляются"""
+    gc, storage = gc_setup
+    snapshot = gc.referenced_keys(db_session)
+
+    def referenced_then_reacquired(db):
+        db_session.add(
+            HarvestRecord(fruit_count=1, image_path="objects/bb/b.jpg", user_id=test_user.id)
+        )
+        db_session.commit()
+        return snapshot
+
+    mocker.patch.object(gc, "referenced_keys", side_effect=referenced_then_reacquired)
+    report = gc.run(min_age=0, deletes_per_second=0)
+
+    assert report["deleted"] == 1  # только users/1/analysis/x.jpg
+    assert storage.exists("objects/bb/b.jpg")
+    assert storage.exists("objects/bb/b.thumb.webp")
@@ -0,0 +1,79 @@
+# tests/test_storage_local.py
+import io
+import os
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from app.core.storage import get_storage
+from app.core.storage_backends import LocalBackend
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return LocalBackend(root=str(tmp_path / "store"), fsync="batch", fsync_batch=3)
+
+
+def test_keys_are_sharded_and_roundtrip(backend):
+    keys = [f"users/1/analysis/{i}.jpg" for i in range(20)]
+    for i, key in enumerate(keys):
+        backend.put(key, io.BytesIO(b"photo-%d" % i), "image/jpeg")
+
+    shards = {os.path.relpath(os.path.dirname(backend.path(k)), backend.root) for k in keys}
+    assert len(shards) > 1
+    assert all(len(shard.split(os.sep)) == 2 for shard in shards)
+    assert backend.get(keys[7]) == b"photo-7"
+    # Временные файлы после переименования не остаются
+    assert os.listdir(os.path.join(backend.root, ".tmp")) == []
+
+
+def test_delete_is_idempotent(backend):
+    backend.put("objects/ab/abc.jpg", io.BytesIO(b"x"), "image/jpeg")
+    backend.delete("objects/ab/abc.jpg")
+    backend.delete("objects/ab/abc.jpg")
+    assert not backend.exists("objects/ab/abc.jpg")
+    with pytest.raises(FileNotFoundError):
+        backend.get("objects/ab/abc.jpg")
+
+
+def test_fsync_is_batched(backend, mocker):
+    fsync = mocker.patch("app.core.storage_backends.os.fsync")
+    backend.put("a.jpg", io.BytesIO(b"a"), "image/jpeg")
+    backend.put("b.jpg", io.BytesIO(b"b"), "image/jpeg")
+    assert fsync.call_count == 0
+
+    backend.put("c.jpg", io.BytesIO(b"c"), "image/jpeg")
+    # Три файла и их каталоги - одной пачкой
+    assert fsync.call_count >= 3
+    fsync.reset_mock()
+    backend.flush()
+    assert fsync.call_count == 0
+
+
+def test_rejects_path_traversal(backend):
+    with pytest.raises(ValueError):
+        backend.path("../etc/passwd")
+
+
+def test_upload_and_signed_download(client, auth_headers, test_user, test_image):
+    files = {"file": ("tree.jpg", test_image, "image/jpeg")}
+    response = client.post("/api/v1/files/upload", files=files, headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["key"].startswith(f"users/{test_user.id}/uploads/")
+    assert get_storage().download_bytes(data["key"]) == test_image
+
+    # Подписанная ссылка открывается без токена
+    url = data["url"]
+    downloaded = client.get(url)
+    assert downloaded.status_code == 200
+    assert downloaded.content == test_image
+    assert downloaded.headers["content-type"] == "image/jpeg"
+
+    parts = urlsplit(url)
+    query = parse_qs(parts.query)
+    forged = client.get(
+        parts.path,
+        params={"expires": int(query["expires"][0]) + 3600, "signature": query["signature"][0]},
+    )
+    assert forged.status_code == 403
@@ -0,0 +1,97 @@
+# tests/test_storage_s3.py
+import asyncio
+import os
+
+import pytest
+
+moto_server = pytest.importorskip("moto.server")
+
+from app.core.config import settings
+from app.core.storage import StorageService, get_storage
+
+
+@pytest.fixture(scope="module")
+def s3_endpoint():
+    """Локальный S3 (moto) вместо MinIO"""
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f"http://{host}:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def storage(s3_endpoint, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", "s3")
+    monkeypatch.setattr(settings, "S3_ENDPOINT", s3_endpoint)
+    monkeypatch.setattr(settings, "S3_BUCKET_NAME", "test-bucket")
+    monkeypatch.setattr(settings, "S3_MULTIPART_THRESHOLD", 5 * 1024 * 1024)
+    monkeypatch.setattr(settings, "S3_MULTIPART_CHUNKSIZE", 5 * 1024 * 1024)
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE", 20 * 1024 * 1024)
+    service = StorageService()
+    try:
+        service.backend.client.create_bucket(Bucket="test-bucket")
+    except service.backend.client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+    return service
+
+
+def test_async_roundtrip(storage):
+    async def scenario():
+        key = await storage.upload_bytes_async(
+            b"jpeg-bytes", "tree.jpg", "image/jpeg", folder="users/1/analysis"
+        )
+        assert key.startswith("users/1/analysis/") and key.endswith(".jpg")
+        assert await storage.download_bytes_async(key) == b"jpeg-bytes"
+        assert await storage.delete_file_async(key)
+        return key
+
+    key = asyncio.run(scenario())
+    assert not storage.exists(key)
+    with pytest.raises(FileNotFoundError):
+        storage.download_bytes(key)
+
+
+def test_large_upload_uses_multipart(storage):
+    data = os.urandom(11 * 1024 * 1024)
+    key = storage.upload_bytes(data, "big.jpg", "image/jpeg", key="objects/bi/big.jpg")
+
+    s3 = storage.backend
+    head = s3.client.head_object(Bucket=s3.bucket, Key=key)
+    # ETag составного объекта имеет вид "<md5>-<число частей>"
+    assert head["ETag"].strip('"').endswith("-3")
+    assert storage.download_bytes(key) == data
+
+
+def test_delete_many_batches_requests(storage, mocker):
+    keys = [f"objects/gc/{i}.jpg" for i in range(1001)]
+    storage.put_bytes(keys[0], b"data", "image/jpeg")
+    delete_objects = mocker.spy(storage.backend.client, "delete_objects")
+
+    assert storage.delete_many(keys) == []
+    # Не больше 1000 ключей в одном запросе DeleteObjects
+    assert delete_objects.call_count == 2
+    assert not storage.exists(keys[0])
+    assert [o.key for o in storage.list_objects("objects/gc/")] == []
+
+
+def test_storage_is_process_singleton():
+    assert get_storage() is get_storage()
+
+
+def test_streaming_upload_to_s3(storage, tmp_path, monkeypatch):
+    staging = tmp_path / "staging"
+    staging.mkdir()
+    monkeypatch.setattr(storage.backend, "staging_dir", str(staging))
+    data = os.urandom(6 * 1024 * 1024)
+
+    async def scenario():
+        async with storage.open_upload("big.jpg", "image/jpeg") as upload:
+            for start in range(0, len(data), 256 * 1024):
+                await upload.write(data[start : start + 256 * 1024])
+            return await upload.commit()
+
+    key = asyncio.run(scenario())
+    assert storage.download_bytes(key) == data
+    # Временный файл удалён после передачи
+    assert os.listdir(staging) == []
@@ -0,0 +1,99 @@
+# tests/test_upload_streaming.py
+import hashlib
+import os
+
+import pytest
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.core.storage import FileTooLarge, get_storage
+from app.utils.multipart_stream import iter_file_chunks
+
+BOUNDARY = "testboundary"
+
+
+def multipart_body(content: bytes, filename="photo.jpg", content_type="image/jpeg"):
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="note"\r\n\r\n'
+        f"просто поле\r\n"
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode("utf-8") + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def staged_files():
+    return os.listdir(get_storage().backend.staging_dir)
+
+
+def test_upload_streams_and_hashes(client, auth_headers):
+    content = os.urandom(600 * 1024)
+    files = {"file": ("tree.jpg", content, "image/jpeg")}
+    response = client.post("/api/v1/files/upload", files=files, headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["size"] == len(content)
+    assert data["sha256"] == hashlib.sha256(content).hexdigest()
+    assert get_storage().download_bytes(data["key"]) == content
+    assert staged_files() == []
+
+
+def test_oversized_upload_is_aborted(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE", 100 * 1024)
+    monkeypatch.setattr(settings, "UPLOAD_CHUNK_SIZE", 16 * 1024)
+    # Content-Length в пределах запаса: размер проверяется при чтении потока
+    files = {"file": ("big.jpg", b"x" * (120 * 1024), "image/jpeg")}
+    response = client.post("/api/v1/files/upload", files=files, headers=auth_headers)
+    assert response.status_code == 413
+    assert list(get_storage().list_objects("users/")) == []
+    assert staged_files() == []
+
+
+async def test_chunks_are_read_incrementally():
+    body = multipart_body(b"a" * 100_000)
+    pieces = [body[i : i + 4096] for i in range(0, len(body), 4096)]
+    received = []
+
+    async def receive():
+        piece = pieces[len(received)]
+        received.append(piece)
+        return {
+            "type": "http.request",
+            "body": piece,
+            "more_body": len(received) < len(pieces),
+        }
+
+    request = Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "headers": [
+                (b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())
+            ],
+        },
+        receive,
+    )
+    chunks = iter_file_chunks(request, "file", chunk_size=8192, max_size=10**6)
+    part, first = await anext(chunks)
+    assert (part.filename, part.content_type, first) == ("photo.jpg", "image/jpeg", b"")
+
+    _, chunk = await anext(chunks)
+    assert chunk == b"a" * 8192
+    # Прочитано лишь начало тела
+    assert len(received) < len(pieces) // 4
+
+    rest = [chunk async for _, chunk in chunks]
+    assert all(len(c) == 8192 for c in rest[:-1])
+    assert 8192 + sum(map(len, rest)) == 100_000
+
+
+async def test_streaming_upload_discards_partial_file():
+    storage = get_storage()
+    upload = storage.open_upload("big.jpg", "image/jpeg", max_size=10)
+    with pytest.raises(FileTooLarge):
+        async with upload:
+            await upload.write(b"12345")
+            await upload.write(b"678901")
+    assert not storage.exists(upload.key)
+    assert staged_files() == []
@@ -0,0 +1,94 @@
+# tests/test_usage.py
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.models.database import DetectionUsage
+from app.services.usage import UsageTracker, detection_owner, usage_tracker
+
+
+@pytest.fixture
+def tracker(db_session, monkeypatch, mocker):
+    """Чистое состояние учёта нагрузки в тестовой БД и мок S3"""
+    monkeypatch.setattr(
+        usage_tracker, "session_factory", sessionmaker(bind=db_session.get_bind())
+    )
+    usage_tracker._pending.clear()
+    usage_tracker._daily.clear()
+    mocker.patch(
+        "app.core.storage.StorageService.upload_bytes",
+        side_effect=lambda data, filename, content_type, folder, key=None: key,
+    )
+    mocker.patch(
+        "app.core.storage.StorageService.get_presigned_url",
+        return_value="http://mock-s3/image.jpg",
+    )
+    yield usage_tracker
+    usage_tracker._pending.clear()
+    usage_tracker._daily.clear()
+
+
+def analyze(client, headers, image, garden_id=None):
+    url = "/api/v1/analysis/photo"
+    if garden_id:
+        url += f"?garden_id={garden_id}"
+    files = {"file": ("tree.jpg", image, "image/jpeg")}
+    return client.post(url, files=files, headers=headers)
+
+
+def test_usage_is_attributed_and_flushed(
+    tracker, client, auth_headers, admin_auth_headers, test_user, db_session, test_image
+):
+    assert analyze(client, auth_headers, test_image, garden_id=7).status_code == 200
+
+    cpu_seconds, megapixels = tracker.today(test_user.id)
+    assert cpu_seconds > 0
+    assert megapixels == pytest.approx(320 * 240 / 1_000_000)
+
+    response = client.get("/api/v1/analysis/usage/top", headers=admin_auth_headers)
+    assert response.status_code == 200
+    top = response.json()["consumers"][0]
+    assert top["user_id"] == test_user.id
+    assert top["email"] == test_user.email
+    assert top["detections"] == 1
+
+    row = db_session.query(DetectionUsage).filter_by(user_id=test_user.id).one()
+    assert row.garden_id == 7
+
+    response = client.get(
+        "/api/v1/analysis/usage/top?by=garden", headers=admin_auth_headers
+    )
+    assert response.json()["consumers"][0]["garden_id"] == 7
+
+
+def test_daily_quota_is_enforced(tracker, client, auth_headers, monkeypatch, test_image):
+    monkeypatch.setattr(settings, "DAILY_MEGAPIXELS_QUOTA", 0.05)
+
+    assert analyze(client, auth_headers, test_image).status_code == 200
+    response = analyze(client, auth_headers, test_image)
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) > 0
+
+
+def test_top_consumers_admin_only(client, auth_headers):
+    response = client.get("/api/v1/analysis/usage/top", headers=auth_headers)
+    assert response.status_code == 403
+
+
+def test_workers_share_rollup_and_quota(db_session, test_user):
+    """Два воркера пишут в одни строки без потерь и дублей и видят общую сумму"""
+    workers = [UsageTracker(), UsageTracker()]
+    token = detection_owner.set((test_user.id, None))
+    try:
+        for worker in workers:
+            worker.record(cpu_seconds=1.5, megapixels=2.0)
+            worker.flush(db_session)
+    finally:
+        detection_owner.reset(token)
+
+    row = db_session.query(DetectionUsage).filter_by(user_id=test_user.id).one()
+    assert row.detections == 2
+    assert row.cpu_seconds == pytest.approx(3.0)
+    # Первый воркер видит нагрузку второго после очередного сброса
+    workers[0].flush(db_session)
+    assert workers[0].today(test_user.id) == pytest.approx((3.0, 4.0))